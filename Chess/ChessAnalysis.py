@@ -0,0 +1,178 @@
+"""
+Batch analysis of many positions: the legal moves, whether the side to move is in check, mated or stalemated, and
+optionally a search score and best move for every FEN in an iterable or file. Each process keeps one Analyzer, a game
+state and a searcher that are reloaded for each position instead of built again. With workers the positions are sent
+to a process pool in batches, with a bounded number of batches in flight, and the results still come back in input
+order. Run from the project root, reading FENs one per line and writing JSON lines:
+    python -m Chess.ChessAnalysis positions.fen --workers 8 --depth 3 > results.jsonl
+    cat positions.fen | python -m Chess.ChessAnalysis - --backend bitboard
+    python -m Chess.ChessAnalysis --check
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from Chess.ChessSearch import Searcher, isMateScore, mateScore
+
+#  (FEN, the status analyze should report, or 'error' for a position it must refuse) checked by --check
+analysisChecks = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 'normal'),
+    ("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3", 'checkmate'),
+    ("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", 'stalemate'),
+    ("4k3/8/8/8/8/8/4r3/4K3 w - - 0 1", 'check'),
+    ("4k3/8/8/8/8/8/8/4K3 w - - 100 80", 'fifty move draw'),
+    ("8/8/8/8/8/8/8/8 w - - 0 1", 'error'),  # no kings, not a stalemate
+    ("8/8/8/8/8/8/8/4K3 w - - 0 1", 'error'),  # no black king
+    ("4k3/8/8/8/8/8/8/KK6 w - - 0 1", 'error'),  # two white kings
+    ("4k3/8/8/8/8/8/8/P3K3 w - - 0 1", 'error'),  # a pawn on the first rank, which would have a1a2
+    ("4k3/4R3/8/8/8/8/8/4K3 w - - 0 1", 'error'),  # black, not to move, is in check: e7e8 would take the king
+    ("4k3/8/8/8/8/8/8/4K3 x - - 0 1", 'error'),
+    ("not a fen", 'error'),
+]
+
+
+class Analyzer():
+    def __init__(self, backend='list', depth=None, hashSizeMB=16):
+        from Chess.ChessPerft import backends
+        self.gameState = backends[backend]()
+        self.depth = depth  # search depth for a score, None for legal moves and status only
+        self.searcher = Searcher(self.gameState, hashSizeMB=hashSizeMB) if depth else None
+
+    '''
+    The analysis of one FEN as a dict ready for JSON. A FEN that cannot be read, or a position loadFEN refuses
+    (no king for a side, say), gives {"fen", "error"}.
+    '''
+    def analyze(self, fen):
+        gameState = self.gameState
+        try:
+            gameState.loadFEN(fen)
+        except ValueError as error:
+            return {'fen': fen, 'error': str(error)}
+        moves = gameState.getValidMoves()
+        inCheck = gameState.inCheck()
+        if gameState.checkMate:
+            status = 'checkmate'
+        elif gameState.staleMate:
+            status = 'stalemate'
+        elif gameState.fiftyMoveDraw:
+            status = 'fifty move draw'
+        else:
+            status = 'check' if inCheck else 'normal'
+        result = {'fen': fen, 'status': status, 'inCheck': inCheck,
+                  'legalMoves': [move.getChessNotation() for move in moves]}
+        if self.searcher is not None and moves:
+            search = self.searcher.search(self.depth)
+            if isMateScore(search.score):
+                plies = mateScore - abs(search.score)
+                result['score'] = {'mate': (plies + 1) // 2 if search.score > 0 else -((plies + 1) // 2)}
+            else:
+                result['score'] = {'cp': search.score}
+            result['bestMove'] = search.bestMove.getChessNotation() if search.bestMove else None
+            result['pv'] = [move.getChessNotation() for move in search.pv]
+            result['nodes'] = search.nodes
+        return result
+
+
+#  the Analyzer of a worker process, made once by initWorker and used for every batch the process gets
+workerAnalyzer = None
+
+
+def initWorker(backend, depth, hashSizeMB):
+    global workerAnalyzer
+    workerAnalyzer = Analyzer(backend, depth, hashSizeMB)
+
+
+def analyzeBatch(fens):
+    return [workerAnalyzer.analyze(fen) for fen in fens]
+
+
+'''
+Yield the analysis of every FEN in fens, in order. With workers above 1 the FENs are analysed batchSize at a time
+in a process pool with at most two batches per worker queued, so any number of positions can stream through.
+'''
+def analyzePositions(fens, workers=1, depth=None, backend='list', hashSizeMB=16, batchSize=256):
+    if workers is None or workers <= 1:
+        analyzer = Analyzer(backend, depth, hashSizeMB)
+        for fen in fens:
+            yield analyzer.analyze(fen)
+        return
+    with ProcessPoolExecutor(workers, initializer=initWorker, initargs=(backend, depth, hashSizeMB)) as executor:
+        pending = deque()
+        batch = []
+        for fen in fens:
+            batch.append(fen)
+            if len(batch) == batchSize:
+                pending.append(executor.submit(analyzeBatch, batch))
+                batch = []
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+        if batch:
+            pending.append(executor.submit(analyzeBatch, batch))
+        while pending:
+            yield from pending.popleft().result()
+
+
+'''
+Analyse every position of analysisChecks on the given backend and report whether each got the expected status or
+error. Returns True if all did.
+'''
+def checkAnalysis(backend='list', out=sys.stdout):
+    passed = True
+    results = analyzePositions([fen for fen, _ in analysisChecks], backend=backend)
+    for (fen, expected), result in zip(analysisChecks, results):
+        found = 'error' if 'error' in result else result['status']
+        status = "ok" if found == expected else "FAIL (expected %s)" % expected
+        passed = passed and found == expected
+        print("%-60s %-15s %s" % (fen, found, status), file=out)
+    return passed
+
+
+'''
+The FENs in a stream of lines, skipping blank lines and # comments
+'''
+def readFENs(lines):
+    for line in lines:
+        fen = line.strip()
+        if fen and not fen.startswith('#'):
+            yield fen
+
+
+def main(argv=None):
+    from Chess.ChessPerft import backends
+    parser = argparse.ArgumentParser(description="Analyse FENs (one per line) and write one JSON object per line")
+    parser.add_argument("input", nargs="?", default="-", help="file of FENs, - for standard input")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--depth", type=int, help="also search each position this deep for a score and best move")
+    parser.add_argument("--backend", choices=sorted(backends), default="list")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB per process")
+    parser.add_argument("--batch", type=int, default=256, help="positions per task sent to a worker")
+    parser.add_argument("--check", action="store_true", help="check the analysis of known positions and bad FENs")
+    args = parser.parse_args(argv)
+    if args.check:
+        return 0 if checkAnalysis(args.backend) else 1
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    start = time.perf_counter()
+    count = errors = 0
+    try:
+        for result in analyzePositions(readFENs(source), args.workers, args.depth, args.backend, args.hash, args.batch):
+            sys.stdout.write(json.dumps(result, separators=(',', ':')) + '\n')
+            count += 1
+            errors += 'error' in result
+    except BrokenPipeError:  # the reader went away, as with | head
+        sys.stdout = open(os.devnull, 'w')
+        return 0
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    elapsed = time.perf_counter() - start
+    print("analysed %d positions (%d unreadable) in %.2fs, %.0f positions/s with %d worker(s) on %d cores" % (
+        count, errors, elapsed, count / elapsed if elapsed > 0 else 0.0, args.workers, os.cpu_count()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Compact binary position format: 37 bytes per position, for moving large numbers of positions between processes and
+onto disk. The 64 squares take 32 bytes, a 4 bit piece code per square, two squares to a byte, from a8 to h1. Then
+one byte of side to move and castling rights, one byte for the en passant file, one byte for the halfmove clock and
+two bytes (little endian) for the full move number. Records have a fixed size, so a buffer of positions can be
+sliced or memory mapped without an index.
+"""
+import struct
+from Chess.ChessEngine import GameState, CastleRights
+
+positionBytes = 37
+pieceCodes = {'--': 0, 'wP': 1, 'wN': 2, 'wB': 3, 'wR': 4, 'wQ': 5, 'wK': 6,
+              'bP': 7, 'bN': 8, 'bB': 9, 'bR': 10, 'bQ': 11, 'bK': 12}
+codePieces = {code: piece for piece, code in pieceCodes.items()}
+#  one lookup per pair of squares each way instead of per square
+pairCodes = {(first, second): pieceCodes[first] | pieceCodes[second] << 4 for first in pieceCodes for second in pieceCodes}
+pairPieces = [(codePieces.get(byte & 15), codePieces.get(byte >> 4)) for byte in range(256)]
+header = struct.Struct('<BBBH')  # side to move and castling bits, en passant file (15 for none), halfmove clock, full move number
+noEnPassant = 15
+
+
+'''
+The 37 byte record for the position in a game state
+'''
+def encodePosition(gameState):
+    board = gameState.board
+    squares = bytes([pairCodes[row[c], row[c + 1]] for row in board for c in (0, 2, 4, 6)])
+    rights = gameState.currentCastlingRights
+    flags = (0 if gameState.whiteToMove else 1) | rights.whiteKingSide << 1 | rights.whiteQueenSide << 2 | \
+            rights.blackKingSide << 3 | rights.blackQueenSide << 4
+    enPassant = gameState.enPassantPossible[1] if gameState.enPassantPossible else noEnPassant
+    return squares + header.pack(flags, enPassant, min(gameState.getHalfmoveClock(), 255),
+                                 min(gameState.getFullmoveNumber(), 65535))
+
+
+'''
+Unpack the record at offset in data into (board, whiteToMove, CastleRights, en passant square, halfmove clock,
+full move number), the arguments of GameState.setPosition
+'''
+def decodeFields(data, offset=0):
+    pieces = []
+    for byte in data[offset:offset + 32]:
+        pieces.extend(pairPieces[byte])
+    if None in pieces:
+        raise ValueError("Bad piece code in position record at offset %d" % offset)
+    board = [pieces[i:i + 8] for i in range(0, 64, 8)]
+    flags, enPassant, halfmoveClock, fullmoveNumber = header.unpack_from(data, offset + 32)
+    whiteToMove = not flags & 1
+    castleRights = CastleRights(bool(flags & 2), bool(flags & 8), bool(flags & 4), bool(flags & 16))
+    if enPassant == noEnPassant:
+        enPassantPossible = ()
+    else:
+        enPassantPossible = (2 if whiteToMove else 5, enPassant)  # the square the capturing pawn moves to
+    return board, whiteToMove, castleRights, enPassantPossible, halfmoveClock, fullmoveNumber
+
+
+'''
+A new game state of gameStateClass set up from the record at offset in data
+'''
+def decodePosition(data, offset=0, gameStateClass=GameState):
+    gameState = gameStateClass()
+    gameState.setPosition(*decodeFields(data, offset))
+    return gameState
+
+
+'''
+The records of many game states joined into one buffer
+'''
+def encodePositions(gameStates):
+    return b''.join([encodePosition(gameState) for gameState in gameStates])
+
+
+'''
+Game states from a buffer of records, one at a time
+'''
+def decodePositions(data, gameStateClass=GameState):
+    if len(data) % positionBytes:
+        raise ValueError("Buffer of %d bytes is not a whole number of %d byte positions" % (len(data), positionBytes))
+    for offset in range(0, len(data), positionBytes):
+        yield decodePosition(data, offset, gameStateClass)
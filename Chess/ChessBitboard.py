@@ -0,0 +1,587 @@
+"""
+This class stores the game state as bitboards, an alternative backend for GameState. Each of the twelve pieces has a
+64 bit integer with one bit set for every square it stands on, bit (row * 8 + col) so that a8 is bit 0 and h1 is
+bit 63, the same layout GameState.getAttackedSquares uses. Moves are generated from precomputed attack tables and
+the 8x8 board list is only built when something asks for it.
+"""
+from Chess.ChessEngine import GameState, CastleRights, getMove, addPromotions, normalMove, enPassantMove, castleMove, kingDirections, \
+    knightDirections, rayDirections, zobristEnPassant
+
+pieceNames = ['wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK']
+pieceIndex = {name: i for i, name in enumerate(pieceNames)}
+WP, WN, WB, WR, WQ, WK, BP, BN, BB, BR, BQ, BK = range(12)
+
+fullBoard = (1 << 64) - 1
+fileA = sum(1 << (r * 8) for r in range(8))
+fileH = fileA << 7
+notFileA = fullBoard ^ fileA
+notFileH = fullBoard ^ fileH
+rowMasks = [0xFF << (r * 8) for r in range(8)]
+lastRows = rowMasks[0] | rowMasks[7]  # pawns promote on reaching either
+rookCorners = 1 | 1 << 7 | 1 << 56 | 1 << 63  # a rook leaving or captured on one of these can take castling rights
+
+
+def squareBit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def stepAttacks(directions):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        table.append(sum(squareBit(r + dr, c + dc) for dr, dc in directions if 0 <= r + dr < 8 and 0 <= c + dc < 8))
+    return table
+
+
+knightAttacks = stepAttacks(knightDirections)
+kingAttacks = stepAttacks(kingDirections)
+#  pawnAttacks[0][sq] are the squares a white pawn on sq attacks, pawnAttacks[1][sq] the same for black
+pawnAttacks = [stepAttacks(((-1, -1), (-1, 1))), stepAttacks(((1, -1), (1, 1)))]
+
+'''
+Sliding attacks, kindergarten style: a rook or bishop attack is the union of its attacks along each line (rank,
+file, diagonal and anti-diagonal) through its square. For every square and line the attack set only depends on the
+occupancy of the inner squares of that line, at most 6 bits, so each line has a small table indexed directly by
+that masked occupancy and a lookup is a mask and a dict access.
+'''
+def buildLineTables(lineDirections):
+    masks = []
+    tables = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        rays = []
+        mask = 0
+        for dr, dc in lineDirections:
+            ray = []
+            endRow, endCol = r + dr, c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                ray.append(squareBit(endRow, endCol))
+                endRow += dr
+                endCol += dc
+            for bit in ray[:-1]:  # the last square of a ray is attacked whether or not it is occupied
+                mask |= bit
+            rays.append(ray)
+        table = {}
+        occ = 0
+        while True:  # walk every subset of the mask
+            attacks = 0
+            for ray in rays:
+                for bit in ray:
+                    attacks |= bit
+                    if occ & bit:
+                        break
+            table[occ] = attacks
+            occ = (occ - mask) & mask
+            if occ == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+rankMasks, rankTables = buildLineTables(((0, -1), (0, 1)))
+fileMasks, fileTables = buildLineTables(((-1, 0), (1, 0)))
+diagMasks, diagTables = buildLineTables(((-1, -1), (1, 1)))
+antiDiagMasks, antiDiagTables = buildLineTables(((-1, 1), (1, -1)))
+
+
+def rookAttacks(sq, occupied):
+    return rankTables[sq][occupied & rankMasks[sq]] | fileTables[sq][occupied & fileMasks[sq]]
+
+
+def bishopAttacks(sq, occupied):
+    return diagTables[sq][occupied & diagMasks[sq]] | antiDiagTables[sq][occupied & antiDiagMasks[sq]]
+
+
+def queenAttacks(sq, occupied):
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+def buildBetweenAndLines():
+    between = [[0] * 64 for _ in range(64)]  # squares strictly between two aligned squares
+    lines = [[0] * 64 for _ in range(64)]  # the whole line through two aligned squares
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        for dr, dc in rayDirections:
+            fullLine = squareBit(r, c)
+            for sign in (1, -1):
+                endRow, endCol = r + dr * sign, c + dc * sign
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    fullLine |= squareBit(endRow, endCol)
+                    endRow += dr * sign
+                    endCol += dc * sign
+            passed = 0
+            endRow, endCol = r + dr, c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                target = endRow * 8 + endCol
+                between[sq][target] = passed
+                lines[sq][target] = fullLine
+                passed |= squareBit(endRow, endCol)
+                endRow += dr
+                endCol += dc
+    return between, lines
+
+
+betweenMasks, lineMasks = buildBetweenAndLines()
+
+
+def iterBits(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+class BitboardGameState(GameState):
+    #  the bitboard state lives in slots: GameState already has 27 attributes, and CPython only shares the keys of an
+    #  instance dictionary (keeping attribute access on its fast path) while it has fewer than 30
+    __slots__ = ('pieceBB', 'occupancy', 'occupied', 'squares', 'boardView')
+
+    def __init__(self):
+        self.pieceBB = [0] * 12
+        self.occupancy = [0, 0]  # white pieces, black pieces
+        self.occupied = 0
+        self.squares = ["--"] * 64  # piece on every square, used to find what a move captures
+        self.boardView = None
+        super().__init__()
+
+    '''
+    The 8x8 list view of the board. It is built from the bitboards the first time it is asked for after a move and
+    is a snapshot, so writing into it does not change the position; assign a whole new board instead.
+    '''
+    @property
+    def board(self):
+        if self.boardView is None:
+            squares = self.squares
+            self.boardView = [squares[i:i + 8] for i in range(0, 64, 8)]
+        return self.boardView
+
+    @board.setter
+    def board(self, rows):
+        self.pieceBB = [0] * 12
+        self.squares = ["--"] * 64
+        for r in range(8):
+            for c in range(8):
+                piece = rows[r][c]
+                if piece != "--":
+                    self.pieceBB[pieceIndex[piece]] |= squareBit(r, c)
+                    self.squares[r * 8 + c] = piece
+        self.updateOccupancy()
+        self.boardView = None
+
+    '''
+    Rebuild the per-side and total occupancy masks from the piece bitboards. The generators call this once per
+    position rather than makeMove and undoMove keeping the masks up to date: three more XORs on 64 bit integers for
+    every move made cost more than a dozen ORs for every position moves are generated in.
+    '''
+    def updateOccupancy(self):
+        bbs = self.pieceBB
+        self.occupancy[0] = bbs[WP] | bbs[WN] | bbs[WB] | bbs[WR] | bbs[WQ] | bbs[WK]
+        self.occupancy[1] = bbs[BP] | bbs[BN] | bbs[BB] | bbs[BR] | bbs[BQ] | bbs[BK]
+        self.occupied = self.occupancy[0] | self.occupancy[1]
+
+    '''
+    GameState.enPassantKey read off the mailbox, so that a double push does not build the board view
+    '''
+    def enPassantKey(self):
+        epRow, epCol = self.enPassantPossible
+        pawnSq, pawn = ((epRow + 1) * 8 + epCol, 'wP') if self.whiteToMove else ((epRow - 1) * 8 + epCol, 'bP')
+        squares = self.squares
+        if (epCol > 0 and squares[pawnSq - 1] == pawn) or (epCol < 7 and squares[pawnSq + 1] == pawn):
+            return zobristEnPassant[epCol]
+        return 0
+
+    '''
+    Move whatever stands on fromSq to the empty square toSq, used for the rook when castling
+    '''
+    def movePiece(self, fromSq, toSq):
+        piece = self.squares[fromSq]
+        self.pieceBB[pieceIndex[piece]] ^= (1 << fromSq) | (1 << toSq)
+        self.squares[toSq] = piece
+        self.squares[fromSq] = "--"
+
+    '''
+    Takes a move as a parameter and executes it on the bitboards, including castling, pawn promotion and en passant.
+    A plain move or capture, most of them, is one XOR for each piece bitboard it changes and two mailbox stores; the
+    other moves go through makeSpecialMove. The castling rights on castleRightsLog are shared with
+    currentCastlingRights and never changed in place: only a king move, or a move from or onto a rook's corner, can
+    change them, and it changes a copy, so any other move and undoMove copy nothing.
+    '''
+    def makeMove(self, move):
+        oldEnPassantKey = self.enPassantKey() if self.enPassantPossible else 0
+        packed = move.packed
+        startSq = packed & 63
+        endSq = packed >> 6 & 63
+        moveBits = (1 << startSq) | (1 << endSq)
+        piece = move.pieceMoved
+        squares = self.squares
+        if move.flag == normalMove and not move.isPawnPromotion:
+            bbs = self.pieceBB
+            bbs[pieceIndex[piece]] ^= moveBits
+            captured = move.pieceCaptured
+            if captured != "--":
+                bbs[pieceIndex[captured]] ^= 1 << endSq
+            squares[endSq] = piece
+        else:
+            self.makeSpecialMove(move, startSq, endSq)
+        squares[startSq] = "--"
+        self.boardView = None
+
+        self.moveLog.append(move)
+        self.whiteToMove = not self.whiteToMove
+        if piece == 'wK':
+            self.whiteKingLocation = (move.endRow, move.endCol)
+        elif piece == 'bK':
+            self.blackKingLocation = (move.endRow, move.endCol)
+        if piece[1] == 'P' and abs(move.startRow - move.endRow) == 2:  # pawn moved 2 squares
+            self.enPassantPossible = ((move.startRow + move.endRow) // 2, move.endCol)
+        else:
+            self.enPassantPossible = ()
+        if piece[1] == 'K' or moveBits & rookCorners:
+            rights = self.currentCastlingRights
+            self.currentCastlingRights = CastleRights(rights.whiteKingSide, rights.blackKingSide, rights.whiteQueenSide, rights.blackQueenSide)
+            self.updateCastleRights(move)
+        self.updateHash(move, oldEnPassantKey)
+        self.updateHalfmoveClock(move)
+        self.updateEvaluation(move)
+        self.castleRightsLog.append(self.currentCastlingRights)
+        self.enPassantLog.append(self.enPassantPossible)
+
+    '''
+    The bitboard and mailbox changes of a castling move, an en passant capture or a promotion, for makeMove
+    '''
+    def makeSpecialMove(self, move, startSq, endSq):
+        bbs = self.pieceBB
+        piece = move.pieceMoved
+        captured = move.pieceCaptured
+        bbs[pieceIndex[piece]] ^= 1 << startSq
+        if move.isPawnPromotion:
+            piece = piece[0] + move.promotionChoice
+        bbs[pieceIndex[piece]] ^= 1 << endSq
+        self.squares[endSq] = piece
+        if move.flag == enPassantMove:
+            capturedSq = startSq - move.startCol + move.endCol  # the pawn beside the start square
+            bbs[pieceIndex[captured]] ^= 1 << capturedSq
+            self.squares[capturedSq] = "--"
+        elif captured != "--":
+            bbs[pieceIndex[captured]] ^= 1 << endSq
+        elif move.flag == castleMove:
+            if endSq > startSq:  # king side castle move
+                self.movePiece(endSq + 1, endSq - 1)  # moves the rook
+            else:  # queen side castle move
+                self.movePiece(endSq - 2, endSq + 1)
+
+    '''
+    Undo the last move made
+    '''
+    def undoMove(self):
+        if len(self.moveLog) != 0:  # makes sure there is a move to undo.
+            move = self.moveLog.pop()
+            packed = move.packed
+            startSq = packed & 63
+            endSq = packed >> 6 & 63
+            moveBits = (1 << startSq) | (1 << endSq)
+            piece = move.pieceMoved
+            squares = self.squares
+            if move.flag == normalMove and not move.isPawnPromotion:
+                bbs = self.pieceBB
+                bbs[pieceIndex[piece]] ^= moveBits
+                captured = move.pieceCaptured
+                if captured != "--":
+                    bbs[pieceIndex[captured]] ^= 1 << endSq
+                squares[endSq] = captured
+            else:
+                self.undoSpecialMove(move, startSq, endSq)
+            squares[startSq] = piece
+            self.boardView = None
+
+            self.whiteToMove = not self.whiteToMove  # switch turns back
+            if piece == 'wK':
+                self.whiteKingLocation = (move.startRow, move.startCol)
+            elif piece == 'bK':
+                self.blackKingLocation = (move.startRow, move.startCol)
+            self.enPassantLog.pop()
+            self.enPassantPossible = self.enPassantLog[-1]
+            self.hashLog.pop()
+            self.hash = self.hashLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            self.evaluationLog.pop()
+            self.midgameScore, self.endgameScore, self.gamePhase = self.evaluationLog[-1]
+            self.castleRightsLog.pop()  # get rid of the new castle rights
+            self.currentCastlingRights = self.castleRightsLog[-1]
+
+    '''
+    Takes back the bitboard and mailbox changes of makeSpecialMove, for undoMove
+    '''
+    def undoSpecialMove(self, move, startSq, endSq):
+        bbs = self.pieceBB
+        squares = self.squares
+        captured = move.pieceCaptured
+        bbs[pieceIndex[squares[endSq]]] ^= 1 << endSq  # the promoted piece if this was a promotion
+        bbs[pieceIndex[move.pieceMoved]] ^= 1 << startSq
+        if move.flag == enPassantMove:
+            capturedSq = startSq - move.startCol + move.endCol
+            bbs[pieceIndex[captured]] ^= 1 << capturedSq
+            squares[capturedSq] = captured
+            squares[endSq] = "--"
+        else:
+            if captured != "--":
+                bbs[pieceIndex[captured]] ^= 1 << endSq
+            squares[endSq] = captured
+            if move.flag == castleMove:
+                if endSq > startSq:  # king side
+                    self.movePiece(endSq - 1, endSq + 1)
+                else:  # queen side
+                    self.movePiece(endSq + 1, endSq - 2)
+
+    '''
+    Bitmask of the pieces of the given side (0 white, 1 black) that attack square sq with the given occupancy
+    '''
+    def attackersTo(self, sq, side, occupied):
+        bbs = self.pieceBB
+        base = 0 if side == 0 else 6
+        queens = bbs[base + 4]
+        return (knightAttacks[sq] & bbs[base + 1]) | (kingAttacks[sq] & bbs[base + 5]) | \
+               (pawnAttacks[1 - side][sq] & bbs[base]) | \
+               (rookAttacks(sq, occupied) & (bbs[base + 3] | queens)) | \
+               (bishopAttacks(sq, occupied) & (bbs[base + 2] | queens))
+
+    '''
+    Determine if the enemy can attack the square r, c. The allied king is looked through, as in GameState.
+    '''
+    def squareUnderAttack(self, r, c):
+        us = 0 if self.whiteToMove else 1
+        self.updateOccupancy()
+        occupied = self.occupied ^ self.pieceBB[WK if us == 0 else BK]
+        return self.attackersTo(r * 8 + c, 1 - us, occupied) != 0
+
+    '''
+    Every square attacked by the given side as a single bitmask, bit (row * 8 + col)
+    '''
+    def getAttackedSquares(self, white):
+        self.updateOccupancy()
+        bbs = self.pieceBB
+        occupied = self.occupied
+        if white:
+            base = 0
+            pawns = bbs[WP]
+            attacked = ((pawns & notFileA) >> 9) | ((pawns & notFileH) >> 7)
+        else:
+            base = 6
+            pawns = bbs[BP]
+            attacked = (((pawns & notFileA) << 7) | ((pawns & notFileH) << 9)) & fullBoard
+        for sq in iterBits(bbs[base + 1]):
+            attacked |= knightAttacks[sq]
+        for sq in iterBits(bbs[base + 2] | bbs[base + 4]):
+            attacked |= bishopAttacks(sq, occupied)
+        for sq in iterBits(bbs[base + 3] | bbs[base + 4]):
+            attacked |= rookAttacks(sq, occupied)
+        for sq in iterBits(bbs[base + 5]):
+            attacked |= kingAttacks[sq]
+        return attacked
+
+    '''
+    All legal moves, generated from the bitboards. Checkers and pinned pieces are found with x-ray lookups from the
+    king's square, so every move produced is legal and nothing is made and undone.
+    '''
+    def getValidMoves(self, moves=None):
+        moves, inCheck = self.generateLegalMoves(moves)
+        self.setMateFlags(moves, inCheck)
+        return moves
+
+    '''
+    The stages of generateMoves and the moves of a single piece, each from generateLegalMoves
+    '''
+    def getNoisyMoves(self, moves=None):
+        return self.generateLegalMoves(moves, quiet=False)[0]
+
+    def getQuietMoves(self, moves=None):
+        return self.generateLegalMoves(moves, noisy=False)[0]
+
+    def getMovesFrom(self, r, c, moves=None):
+        return self.generateLegalMoves(moves, fromMask=squareBit(r, c))[0]
+
+    '''
+    True if the side to move has a legal move, trying the king's moves before the rest. Sets the same flags as
+    getValidMoves.
+    '''
+    def hasLegalMove(self):
+        moves, inCheck = self.generateLegalMoves(None, fromMask=self.pieceBB[WK if self.whiteToMove else BK])
+        if not moves:
+            moves, inCheck = self.generateLegalMoves(moves)
+        self.setMateFlags(moves, inCheck)
+        return len(moves) > 0
+
+    '''
+    The legal captures and promotions (noisy) and the other moves (quiet) of the pieces on the squares in fromMask,
+    and whether the side to move is in check. The two kinds are only told apart by the target squares allowed, so
+    each stage of generateMoves costs no more than its own moves.
+    '''
+    def generateLegalMoves(self, moves=None, noisy=True, quiet=True, fromMask=fullBoard):
+        self.updateOccupancy()
+        squares = self.squares
+        bbs = self.pieceBB
+        us = 0 if self.whiteToMove else 1
+        them = 1 - us
+        base = 0 if us == 0 else 6
+        enemyBase = 6 - base
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = self.occupied
+        kingBB = bbs[base + 5]
+        kingSq = kingBB.bit_length() - 1
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        stageMask = (enemy if noisy else 0) | (~occupied & fullBoard if quiet else 0)
+
+        checkers = self.attackersTo(kingSq, them, occupied)
+        #  pinned pieces: enemy sliders that would attack the king through exactly one allied piece
+        pinned = 0
+        pinLines = {}
+        enemyQueens = bbs[enemyBase + 4]
+        snipers = (rookAttacks(kingSq, enemy) & (bbs[enemyBase + 3] | enemyQueens)) | \
+                  (bishopAttacks(kingSq, enemy) & (bbs[enemyBase + 2] | enemyQueens))
+        for sniperSq in iterBits(snipers):
+            blockers = betweenMasks[kingSq][sniperSq] & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                pinned |= blockers
+                pinLines[blockers.bit_length() - 1] = lineMasks[kingSq][sniperSq]
+
+        #  king moves, tested with the king lifted off the board so it cannot hide behind itself
+        withoutKing = occupied ^ kingBB
+        king = squares[kingSq]
+        if kingBB & fromMask:
+            for endSq in iterBits(kingAttacks[kingSq] & stageMask):
+                if not self.attackersTo(endSq, them, withoutKing):
+                    moves.append(getMove(kingSq, endSq, king, squares[endSq]))
+        if checkers & (checkers - 1):  # double check, king has to move
+            return moves, True
+
+        if checkers:
+            checkerSq = checkers.bit_length() - 1
+            targetMask = betweenMasks[kingSq][checkerSq] | checkers  # block the check or capture the checker
+        else:
+            targetMask = fullBoard
+        allowed = stageMask & targetMask
+
+        #  the loops over target squares take the bits off inline, which saves a generator step for every move
+        for startSq in iterBits(bbs[base + 1] & ~pinned & fromMask):  # a pinned knight can never move
+            pieceMoved = squares[startSq]
+            targets = knightAttacks[startSq] & allowed
+            while targets:
+                endSq = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                moves.append(getMove(startSq, endSq, pieceMoved, squares[endSq]))
+        for pieceOffset, attacksFrom in ((2, bishopAttacks), (3, rookAttacks), (4, queenAttacks)):
+            for startSq in iterBits(bbs[base + pieceOffset] & fromMask):
+                targets = attacksFrom(startSq, occupied) & allowed
+                if pinned & (1 << startSq):  # pinned pieces stay on the pin line
+                    targets &= pinLines[startSq]
+                pieceMoved = squares[startSq]
+                while targets:
+                    endSq = (targets & -targets).bit_length() - 1
+                    targets &= targets - 1
+                    moves.append(getMove(startSq, endSq, pieceMoved, squares[endSq]))
+
+        self.getPawnBitboardMoves(moves, us, bbs[base] & fromMask, enemy, occupied, kingSq, pinned, pinLines, targetMask,
+                                  checkers, noisy, quiet)
+        if quiet and not checkers and kingBB & fromMask:
+            self.getCastleMoves(kingSq >> 3, kingSq & 7, moves)
+        return moves, checkers != 0
+
+    '''
+    Helpers for getCastleMoves, reading the mailbox so the board view is not built
+    '''
+    def getKingSideCastleMoves(self, r, c, moves):
+        kingSq = r * 8 + c
+        if self.squares[kingSq + 1] == '--' and self.squares[kingSq + 2] == '--':
+            if not self.squareUnderAttack(r, c + 1) and not self.squareUnderAttack(r, c + 2):
+                moves.append(getMove(kingSq, kingSq + 2, self.squares[kingSq], '--', castleMove))
+
+    def getQueenSideCastleMoves(self, r, c, moves):
+        kingSq = r * 8 + c
+        if self.squares[kingSq - 1] == '--' and self.squares[kingSq - 2] == '--' and self.squares[kingSq - 3] == '--':
+            if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
+                moves.append(getMove(kingSq, kingSq - 2, self.squares[kingSq], '--', castleMove))
+
+    '''
+    Pawn pushes, captures and en passant for generateLegalMoves. Captures and pushes onto the last rank are noisy,
+    the other pushes quiet.
+    '''
+    def getPawnBitboardMoves(self, moves, us, pawns, enemy, occupied, kingSq, pinned, pinLines, targetMask, checkers,
+                             noisy=True, quiet=True):
+        squares = self.squares
+        pawn = 'wP' if us == 0 else 'bP'
+        empty = ~occupied & fullBoard
+        if us == 0:
+            forward = -8
+            singles = (pawns >> 8) & empty
+            doubles = ((singles & rowMasks[5]) >> 8) & empty
+        else:
+            forward = 8
+            singles = (pawns << 8) & empty
+            doubles = ((singles & rowMasks[2]) << 8) & empty
+        if not quiet:
+            singles &= lastRows
+            doubles = 0
+        elif not noisy:
+            singles &= ~lastRows
+        targets = singles & targetMask
+        while targets:
+            endSq = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            startSq = endSq - forward
+            if not pinned & (1 << startSq) or pinLines[startSq] >> endSq & 1:
+                if lastRows >> endSq & 1:
+                    addPromotions(moves, startSq, endSq, pawn, "--")
+                else:
+                    moves.append(getMove(startSq, endSq, pawn, "--"))
+        targets = doubles & targetMask
+        while targets:
+            endSq = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            startSq = endSq - 2 * forward
+            if not pinned & (1 << startSq) or pinLines[startSq] >> endSq & 1:
+                moves.append(getMove(startSq, endSq, pawn, "--"))
+        if not noisy:
+            return
+        attackTable = pawnAttacks[us]
+        for startSq in iterBits(pawns):
+            targets = attackTable[startSq] & enemy & targetMask
+            if pinned & (1 << startSq):
+                targets &= pinLines[startSq]
+            for endSq in iterBits(targets):
+                if lastRows >> endSq & 1:
+                    addPromotions(moves, startSq, endSq, pawn, squares[endSq])
+                else:
+                    moves.append(getMove(startSq, endSq, pawn, squares[endSq]))
+        if self.enPassantPossible:
+            epRow, epCol = self.enPassantPossible
+            epSq = epRow * 8 + epCol
+            capturedSq = epSq - forward
+            #  en passant is only worth trying if it blocks or removes the checker
+            if checkers and not (targetMask >> epSq & 1 or checkers >> capturedSq & 1):
+                return
+            bbs = self.pieceBB
+            enemyBase = 6 if us == 0 else 0
+            enemyQueens = bbs[enemyBase + 4]
+            for startSq in iterBits(pawnAttacks[1 - us][epSq] & pawns):
+                #  both pawns leave their squares at once, so test the king against sliders with the resulting
+                #  occupancy, which covers pins as well as the discovered check along the rank
+                afterOccupied = (occupied ^ (1 << startSq) ^ (1 << capturedSq)) | (1 << epSq)
+                if rookAttacks(kingSq, afterOccupied) & (bbs[enemyBase + 3] | enemyQueens) or \
+                        bishopAttacks(kingSq, afterOccupied) & (bbs[enemyBase + 2] | enemyQueens):
+                    continue
+                moves.append(getMove(startSq, epSq, pawn, "--", enPassantMove))
+
+    def setMateFlags(self, moves, inCheck):
+        if len(moves) == 0:  # checkmate or stalemate
+            self.checkMate = inCheck
+            self.staleMate = not inCheck
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        self.setDrawFlags()
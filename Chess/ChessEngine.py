@@ -2,13 +2,58 @@
 This class will store all information regarding the current game state and for determining valid chess moves
 at the current game state. It will also keep a log of all moves.
 """
-from Chess import ChessMain
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import random
+from Chess.ChessEvaluation import midgamePieceSquare, endgamePieceSquare, phaseWeights, computeEvaluation
 
 ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
 rowsToRanks = {v: k for k, v in ranksToRows.items()}
 filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
 colsToFiles = {v: k for k, v in filesToCols.items()}
+startFEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+rayDirections = rookDirections + bishopDirections  # orthogonal directions first, then diagonals
+knightDirections = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+kingDirections = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+#  precomputed target squares for every square so the generators and attack checks skip the bounds tests
+knightSquares = [[tuple((r + dr, c + dc) for dr, dc in knightDirections if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+                  for c in range(8)] for r in range(8)]
+kingSquares = [[tuple((r + dr, c + dc) for dr, dc in kingDirections if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+                for c in range(8)] for r in range(8)]
+raySquares = [[tuple(tuple((r + dr * i, c + dc * i) for i in range(1, 8) if 0 <= r + dr * i < 8 and 0 <= c + dc * i < 8)
+                     for dr, dc in rayDirections) for c in range(8)] for r in range(8)]
+sliderRays = {'R': range(0, 4), 'B': range(4, 8), 'Q': range(0, 8)}  # which of a square's raySquares each slider uses
+#  the same knight and king targets as bitmasks with bit (row * 8 + col), used by getAttackedSquares
+knightMasks = [[sum(1 << (endRow * 8 + endCol) for endRow, endCol in knightSquares[r][c]) for c in range(8)] for r in range(8)]
+kingMasks = [[sum(1 << (endRow * 8 + endCol) for endRow, endCol in kingSquares[r][c]) for c in range(8)] for r in range(8)]
+
+#  Zobrist keys: a random 64 bit number for every piece on every square (row * 8 + col), the side to move, each
+#  castling right and the file of the en passant square. A position's key is the XOR of the keys that apply to it.
+#  The generator is seeded so keys are the same in every process.
+zobristRandom = random.Random(20201)
+zobristPieces = {piece: [zobristRandom.getrandbits(64) for _ in range(64)]
+                 for piece in ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')}
+zobristBlackToMove = zobristRandom.getrandbits(64)
+zobristCastling = [zobristRandom.getrandbits(64) for _ in range(4)]  # white king side, white queen side, black king side, black queen side
+zobristEnPassant = [zobristRandom.getrandbits(64) for _ in range(8)]
+
+
+def castleRightsKey(rights):
+    key = 0
+    if rights.whiteKingSide:
+        key ^= zobristCastling[0]
+    if rights.whiteQueenSide:
+        key ^= zobristCastling[1]
+    if rights.blackKingSide:
+        key ^= zobristCastling[2]
+    if rights.blackQueenSide:
+        key ^= zobristCastling[3]
+    return key
+
 
 class GameState():
     def __init__(self):
@@ -30,17 +75,240 @@ class GameState():
         self.blackKingLocation = (0, 4)
         self.checkMate = False
         self.staleMate = False
+        self.fiftyMoveDraw = False  # 100 plies without a capture or pawn move, set with checkMate/staleMate
+        self.repetitionDraw = False  # the position has now been reached three times, set with checkMate/staleMate
+        self.pins = {}  # pinned allied pieces (row, col) -> direction of the pin, found by getValidMoves
+        self.checks = []  # pieces giving check to the side to move, found by getValidMoves
         self.enPassantPossible = ()  # square where an en passant is currently possible
         self.currentCastlingRights = CastleRights(True, True, True, True)
         self.castleRightsLog = [CastleRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.blackKingSide,
                                              self.currentCastlingRights.whiteQueenSide, self.currentCastlingRights.blackQueenSide)]
+        self.enPassantLog = [self.enPassantPossible]
+        self.hash = self.computeHash()  # Zobrist key of the current position, kept up to date by makeMove/undoMove
+        self.hashLog = [self.hash]  # key of every position reached, next to moveLog
+        self.halfmoveClock = 0  # plies since the last capture or pawn move, kept up to date by makeMove/undoMove
+        self.halfmoveClockLog = [self.halfmoveClock]
+        #  evaluation totals kept up to date by makeMove/undoMove, see ChessEvaluation
+        self.midgameScore, self.endgameScore, self.gamePhase = computeEvaluation(self.board)
+        self.evaluationLog = [(self.midgameScore, self.endgameScore, self.gamePhase)]
+        self.startFEN = startFEN  # position the move log starts from
+        self.startFullmove = 1
+        self.moveCache = None  # MoveCache used by getCachedValidMoves, made on first use; games can share one
+
+    '''
+    Pickle a game state as the position the game started from and the moves played since, as Move.packed codes,
+    instead of the board, logs and pooled moves. That is a few hundred bytes for a whole game, and unpickling
+    replays the moves so undoMove and the logs work as before.
+    '''
+    def __getstate__(self):
+        return {'startFEN': self.startFEN, 'moves': [move.packed for move in self.moveLog]}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.loadFEN(state['startFEN'])
+        for packed in state['moves']:
+            self.makeMove(moveFromPacked(self.board, packed))
+
+    '''
+    Set the game state to the position described by a FEN string, for example
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1". The move log is cleared, so the position
+    becomes the start of the game. The move counters at the end of the string are optional. Raises ValueError for a
+    string that is not FEN, or a position setPosition refuses.
+    '''
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) < 2:
+            raise ValueError("FEN needs at least the piece placement and the side to move: " + repr(fen))
+        board = []
+        for rankText in fields[0].split('/'):
+            row = []
+            for ch in rankText:
+                if ch.isdigit():
+                    row.extend(["--"] * int(ch))
+                elif ch.upper() in 'PNBRQK':
+                    row.append(('w' if ch.isupper() else 'b') + ch.upper())
+                else:
+                    raise ValueError("Unknown piece " + repr(ch) + " in FEN " + repr(fen))
+            if len(row) != 8:
+                raise ValueError("FEN rank " + repr(rankText) + " does not have 8 squares")
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError("FEN does not have 8 ranks: " + repr(fen))
+        if fields[1] not in ('w', 'b'):
+            raise ValueError("FEN side to move must be w or b: " + repr(fen))
+        castling = fields[2] if len(fields) > 2 else '-'
+        enPassant = fields[3] if len(fields) > 3 else '-'
+        try:
+            enPassantPossible = () if enPassant == '-' else (ranksToRows[enPassant[1]], filesToCols[enPassant[0]])
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except (KeyError, IndexError, ValueError):
+            raise ValueError("Bad en passant square or move counters in FEN " + repr(fen))
+        self.setPosition(board, fields[1] == 'w', CastleRights('K' in castling, 'k' in castling, 'Q' in castling, 'q' in castling),
+                         enPassantPossible, halfmoveClock, fullmoveNumber)
+        self.startFEN = fen
+
+    '''
+    A new game state of this class set up at the position described by a FEN string
+    '''
+    @classmethod
+    def fromFEN(cls, fen):
+        gameState = cls()
+        gameState.loadFEN(fen)
+        return gameState
+
+    '''
+    Set the game state to a position given as an 8x8 board, the side to move, CastleRights, the en passant square
+    and the move counters. The move log is cleared, so the position becomes the start of the game. Raises
+    ValueError, leaving the game state as it was, unless each side has exactly one king, no pawn stands on the
+    first or last rank and the side not to move is not in check.
+    '''
+    def setPosition(self, board, whiteToMove, castleRights, enPassantPossible=(), halfmoveClock=0, fullmoveNumber=1):
+        kings = {'wK': [], 'bK': []}
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece in kings:
+                    kings[piece].append((r, c))
+                elif piece[1:] == 'P' and (r == 0 or r == 7):
+                    raise ValueError("Pawn on " + Move.colsToFiles[c] + Move.rowsToRanks[r] + ", the first or last rank")
+        for king, side in (('wK', "white"), ('bK', "black")):
+            if len(kings[king]) != 1:
+                raise ValueError("The position has %d %s kings, it needs exactly one" % (len(kings[king]), side))
+        previous = self.board, self.whiteToMove, self.whiteKingLocation, self.blackKingLocation
+        self.board = board
+        self.whiteKingLocation = kings['wK'][0]
+        self.blackKingLocation = kings['bK'][0]
+        self.whiteToMove = not whiteToMove  # inCheck for the side not to move, whose king could be taken
+        if self.inCheck():
+            self.board, self.whiteToMove, self.whiteKingLocation, self.blackKingLocation = previous
+            raise ValueError("The side not to move is in check")
+        self.whiteToMove = whiteToMove
+        self.currentCastlingRights = castleRights
+        self.enPassantPossible = enPassantPossible
+        self.moveLog = []
+        self.checkMate = False
+        self.staleMate = False
+        self.fiftyMoveDraw = False
+        self.repetitionDraw = False
+        self.castleRightsLog = [CastleRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.blackKingSide,
+                                             self.currentCastlingRights.whiteQueenSide, self.currentCastlingRights.blackQueenSide)]
+        self.enPassantLog = [self.enPassantPossible]
+        self.hash = self.computeHash()
+        self.hashLog = [self.hash]
+        self.halfmoveClock = halfmoveClock
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.midgameScore, self.endgameScore, self.gamePhase = computeEvaluation(self.board)
+        self.evaluationLog = [(self.midgameScore, self.endgameScore, self.gamePhase)]
+        self.startFullmove = fullmoveNumber
+        self.startFEN = self.toFEN()
 
+    '''
+    The FEN string of the current position
+    '''
+    def toFEN(self):
+        ranks = []
+        for row in self.board:
+            text = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        text += str(empty)
+                        empty = 0
+                    text += piece[1] if piece[0] == 'w' else piece[1].lower()
+            if empty:
+                text += str(empty)
+            ranks.append(text)
+        rights = self.currentCastlingRights
+        castling = ('K' if rights.whiteKingSide else '') + ('Q' if rights.whiteQueenSide else '') + \
+                   ('k' if rights.blackKingSide else '') + ('q' if rights.blackQueenSide else '')
+        if self.enPassantPossible:
+            enPassant = colsToFiles[self.enPassantPossible[1]] + rowsToRanks[self.enPassantPossible[0]]
+        else:
+            enPassant = '-'
+        return "%s %s %s %s %d %d" % ('/'.join(ranks), 'w' if self.whiteToMove else 'b', castling or '-', enPassant,
+                                      self.getHalfmoveClock(), self.getFullmoveNumber())
+
+    '''
+    Plies since the last capture or pawn move, counting the clock of the start position
+    '''
+    def getHalfmoveClock(self):
+        return self.halfmoveClock
+
+    '''
+    Update the halfmove clock for a move that has just been made and push it onto halfmoveClockLog
+    '''
+    def updateHalfmoveClock(self, move):
+        if move.pieceMoved[1] == 'P' or move.pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+
+    '''
+    True if the current position was reached before in this game. Only positions since the last capture or pawn
+    move can be the same, and only those with the same side to move, so this looks at every other key in hashLog
+    back to there and builds nothing; cheap enough for every node of a search.
+    '''
+    def isRepetition(self):
+        hashLog = self.hashLog
+        h = self.hash
+        i = len(hashLog) - 5  # four plies back is the first position that can repeat this one
+        stop = len(hashLog) - 1 - self.halfmoveClock
+        if stop < 0:
+            stop = 0
+        while i >= stop:
+            if hashLog[i] == h:
+                return True
+            i -= 2
+        return False
+
+    '''
+    How many times the current position has been reached in this game, counting this time
+    '''
+    def repetitionCount(self):
+        hashLog = self.hashLog
+        h = self.hash
+        count = 1
+        i = len(hashLog) - 5
+        stop = max(len(hashLog) - 1 - self.halfmoveClock, 0)
+        while i >= stop:
+            if hashLog[i] == h:
+                count += 1
+            i -= 2
+        return count
+
+    '''
+    Set fiftyMoveDraw and repetitionDraw for the current position. Called with checkMate and staleMate set, since
+    a mate on the hundredth ply still counts.
+    '''
+    def setDrawFlags(self):
+        self.fiftyMoveDraw = self.halfmoveClock >= 100 and not self.checkMate
+        self.repetitionDraw = self.halfmoveClock >= 8 and self.repetitionCount() >= 3
+
+    '''
+    True if the game is drawn: stalemate, the fifty move rule or threefold repetition, as found by the last call to
+    getValidMoves
+    '''
+    def isDraw(self):
+        return self.staleMate or self.fiftyMoveDraw or self.repetitionDraw
+
+    '''
+    The number of the current full move, starting from the start position's and going up after black moves
+    '''
+    def getFullmoveNumber(self):
+        startedWhite = self.whiteToMove == (len(self.moveLog) % 2 == 0)
+        return self.startFullmove + (len(self.moveLog) + (0 if startedWhite else 1)) // 2
 
     '''
     Takes a move as a parameter and executes it. NOTE: will not work for castling, 
     pawn promotion, and en-pessant. 
     '''
     def makeMove(self, move):
+        oldEnPassantKey = self.enPassantKey() if self.enPassantPossible else 0
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)
@@ -56,7 +324,7 @@ class GameState():
             self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
 
         #  en passant
-        if isinstance(move, EnPassantMove):
+        if move.flag == enPassantMove:
             self.board[move.startRow][move.endCol] = "--"  # captures the pawn
         #  updating enPassantPossible
         if move.pieceMoved[1] == 'P' and abs(move.startRow - move.endRow) == 2:  # pawn moved 2 squares
@@ -65,7 +333,7 @@ class GameState():
             self.enPassantPossible = ()
 
         # castle Move
-        if isinstance(move, CastleMove):
+        if move.flag == castleMove:
             if move.endCol - move.startCol == 2:  # king side castle move
                 self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # moves the rook
                 self.board[move.endRow][move.endCol + 1] = '--'
@@ -75,8 +343,12 @@ class GameState():
 
         # update castling rights --> whenever it is a rook or a king move
         self.updateCastleRights(move)
+        self.updateHash(move, oldEnPassantKey)
+        self.updateHalfmoveClock(move)
+        self.updateEvaluation(move)
         self.castleRightsLog.append(CastleRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.blackKingSide,
                                                  self.currentCastlingRights.whiteQueenSide, self.currentCastlingRights.blackQueenSide))
+        self.enPassantLog.append(self.enPassantPossible)
 
     '''
     Undo the last move made
@@ -93,19 +365,24 @@ class GameState():
             elif move.pieceMoved == 'bK':
                 self.blackKingLocation = (move.startRow, move.startCol)
             # undo en passant
-            if isinstance(move, EnPassantMove):
+            if move.flag == enPassantMove:
                 self.board[move.endRow][move.endCol] = "--"  # landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enPassantPossible = (move.endRow, move.endCol)
-            # undo 2 square pawn move
-            if move.pieceMoved[1] == 'P' and abs(move.startRow - move.endRow) == 2:
-                self.enPassantPossible = ()
+            # restore the en passant square and the position key from before the move
+            self.enPassantLog.pop()
+            self.enPassantPossible = self.enPassantLog[-1]
+            self.hashLog.pop()
+            self.hash = self.hashLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            self.evaluationLog.pop()
+            self.midgameScore, self.endgameScore, self.gamePhase = self.evaluationLog[-1]
             # undo castling Rights
             self.castleRightsLog.pop()  # get rid of the new castle rights
             newRights = self.castleRightsLog[-1]
             self.currentCastlingRights = CastleRights(newRights.whiteKingSide, newRights.blackKingSide, newRights.whiteQueenSide, newRights.blackQueenSide)
             # undo castle move
-            if isinstance(move, CastleMove):
+            if move.flag == castleMove:
                 if move.endCol - move.startCol == 2:  # king Side
                     self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
                     self.board[move.endRow][move.endCol - 1] = '--'
@@ -113,6 +390,100 @@ class GameState():
                     self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
                     self.board[move.endRow][move.endCol + 1] = '--'
     '''
+    Update the Zobrist key for a move that has just been made, given the enPassantKey from before it. Only the
+    squares the move touched, the side to move, the castling rights that changed and the en passant file are
+    XORed, so this costs the same whatever the position. The new key is pushed onto hashLog.
+    '''
+    def updateHash(self, move, oldEnPassantKey):
+        keys = zobristPieces
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        pieceMoved = move.pieceMoved
+        h = self.hash ^ zobristBlackToMove ^ keys[pieceMoved][startSq]
+        h ^= keys[pieceMoved[0] + move.promotionChoice if move.isPawnPromotion else pieceMoved][endSq]
+        if move.flag == enPassantMove:
+            h ^= keys[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != "--":
+            h ^= keys[move.pieceCaptured][endSq]
+        elif move.flag == castleMove:
+            rookKeys = keys[pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2:  # king side, rook from endSq + 1 to endSq - 1
+                h ^= rookKeys[endSq + 1] ^ rookKeys[endSq - 1]
+            else:  # queen side, rook from endSq - 2 to endSq + 1
+                h ^= rookKeys[endSq - 2] ^ rookKeys[endSq + 1]
+        if pieceMoved[1] in 'KR' or move.pieceCaptured[1] == 'R':  # the only moves that can change castling rights
+            h ^= castleRightsKey(self.castleRightsLog[-1]) ^ castleRightsKey(self.currentCastlingRights)
+        h ^= oldEnPassantKey
+        if self.enPassantPossible:
+            h ^= self.enPassantKey()
+        self.hash = h
+        self.hashLog.append(h)
+
+    '''
+    Update the evaluation totals (see ChessEvaluation) for a move that has just been made, the same way updateHash
+    updates the key: only the squares the move touched are looked at. The new totals are pushed onto evaluationLog.
+    '''
+    def updateEvaluation(self, move):
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        pieceMoved = move.pieceMoved
+        piecePlaced = pieceMoved[0] + move.promotionChoice if move.isPawnPromotion else pieceMoved
+        midgame = self.midgameScore - midgamePieceSquare[pieceMoved][startSq] + midgamePieceSquare[piecePlaced][endSq]
+        endgame = self.endgameScore - endgamePieceSquare[pieceMoved][startSq] + endgamePieceSquare[piecePlaced][endSq]
+        phase = self.gamePhase
+        if move.isPawnPromotion:
+            phase += phaseWeights[move.promotionChoice]
+        if move.pieceCaptured != "--":
+            captureSq = move.startRow * 8 + move.endCol if move.flag == enPassantMove else endSq
+            midgame -= midgamePieceSquare[move.pieceCaptured][captureSq]
+            endgame -= endgamePieceSquare[move.pieceCaptured][captureSq]
+            phase -= phaseWeights[move.pieceCaptured[1]]
+        elif move.flag == castleMove:
+            rook = pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2:  # king side, rook from endSq + 1 to endSq - 1
+                rookFrom, rookTo = endSq + 1, endSq - 1
+            else:  # queen side, rook from endSq - 2 to endSq + 1
+                rookFrom, rookTo = endSq - 2, endSq + 1
+            midgame += midgamePieceSquare[rook][rookTo] - midgamePieceSquare[rook][rookFrom]
+            endgame += endgamePieceSquare[rook][rookTo] - endgamePieceSquare[rook][rookFrom]
+        self.midgameScore = midgame
+        self.endgameScore = endgame
+        self.gamePhase = phase
+        self.evaluationLog.append((midgame, endgame, phase))
+
+    '''
+    Compute the Zobrist key of the current position from scratch. makeMove and undoMove keep self.hash up to date
+    incrementally, this is for setting up a position and for checking the incremental key.
+    '''
+    def computeHash(self):
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    h ^= zobristPieces[piece][r * 8 + c]
+        if not self.whiteToMove:
+            h ^= zobristBlackToMove
+        h ^= castleRightsKey(self.currentCastlingRights)
+        if self.enPassantPossible:
+            h ^= self.enPassantKey()
+        return h
+
+    '''
+    The part of the Zobrist key for enPassantPossible, which must be set: the key of its file if a pawn of the side
+    to move stands beside the pawn that just moved two squares, else 0. A square no pawn can capture on does not
+    make a different position, so the same position reached again gets the same key and counts as a repetition.
+    ChessBook.polyglotKey makes the same test.
+    '''
+    def enPassantKey(self):
+        epRow, epCol = self.enPassantPossible
+        pawnRow, pawn = (epRow + 1, 'wP') if self.whiteToMove else (epRow - 1, 'bP')
+        row = self.board[pawnRow]
+        if (epCol > 0 and row[epCol - 1] == pawn) or (epCol < 7 and row[epCol + 1] == pawn):
+            return zobristEnPassant[epCol]
+        return 0
+
+    '''
     Update the castle rights given the move 
     '''
     def updateCastleRights(self, move):
@@ -131,44 +502,256 @@ class GameState():
         elif move.pieceMoved == 'bR':
             if move.startRow == 0:
                 if move.startCol == 0:  # left rook
-                    self.currentCastlingRights.blackQueenSideQueenSide = False
+                    self.currentCastlingRights.blackQueenSide = False
                 elif move.startCol == 7:  # right rook
                     self.currentCastlingRights.blackKingSide = False
+        # a rook captured on its starting square takes that side's castling with it
+        if move.pieceCaptured == 'wR':
+            if move.endRow == 7:
+                if move.endCol == 0:
+                    self.currentCastlingRights.whiteQueenSide = False
+                elif move.endCol == 7:
+                    self.currentCastlingRights.whiteKingSide = False
+        elif move.pieceCaptured == 'bR':
+            if move.endRow == 0:
+                if move.endCol == 0:
+                    self.currentCastlingRights.blackQueenSide = False
+                elif move.endCol == 7:
+                    self.currentCastlingRights.blackKingSide = False
 
     '''
-    All Moves Considering King is in Check
+    All Moves Considering King is in Check. Pins and checks are found once from the king's square so only
+    legal moves are generated, instead of making and undoing every possible move. Callers that generate moves
+    over and over (a search, perft) can pass in their own list as moves to have it cleared and refilled
+    instead of a new list being built each time.
     '''
-    def getValidMoves(self):
+    def getValidMoves(self, moves=None):
+        moves, kingRow, kingCol, inCheck = self.startGeneration(moves)
+        if inCheck:
+            if len(self.checks) == 1:  # only 1 check, block the check or move the king
+                self.getAllPossibleMoves(moves)
+                self.removeNonEvasions(moves, kingRow, kingCol)
+            else:  # double check, king has to move
+                self.getKingMoves(kingRow, kingCol, moves)
+        else:  # not in check so all moves are fine
+            self.getAllPossibleMoves(moves)
+            self.getCastleMoves(kingRow, kingCol, moves)
 
-        tempEnPassantPossible = self.enPassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRights.whiteKingSide, self.currentCastlingRights.blackKingSide,
-                                        self.currentCastlingRights.whiteQueenSide, self.currentCastlingRights.blackQueenSide)
+        if len(moves) == 0:  # checkmate or stalemate
+            self.checkMate = inCheck
+            self.staleMate = not inCheck
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        self.setDrawFlags()
+        return moves
 
-        moves = self.getAllPossibleMoves()
+    '''
+    Clear the list passed in as moves, or make a new one, and find the pins and checks on the king of the side to
+    move for the generators. Returns the list, the king's row and col and whether it is in check.
+    '''
+    def startGeneration(self, moves):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
         if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+            kingRow, kingCol = self.whiteKingLocation
         else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        for i in range(len(moves)-1, -1, -1):
-            self.makeMove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        if len(moves) == 0: #checkmate or stalemate
-            if self.inCheck():
-                self.checkMate = True
-            else:
-                self.staleMate = True
+            kingRow, kingCol = self.blackKingLocation
+        inCheck, self.pins, self.checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        return moves, kingRow, kingCol, inCheck
+
+    '''
+    With the king in a single check (self.checks), remove the moves that neither capture the checking piece nor
+    block its line. King moves are left alone, they were already checked.
+    '''
+    def removeNonEvasions(self, moves, kingRow, kingCol):
+        checkRow, checkCol, dirRow, dirCol = self.checks[0]
+        pieceChecking = self.board[checkRow][checkCol]
+        validSquares = set()  # squares that pieces can move to
+        if pieceChecking[1] == 'N':  # knight must be captured or the king must move
+            validSquares.add((checkRow, checkCol))
         else:
-            self.checkMate = False
-            self.staleMate = False
+            for i in range(1, 8):
+                validSquare = (kingRow + dirRow * i, kingCol + dirCol * i)
+                validSquares.add(validSquare)
+                if validSquare == (checkRow, checkCol):  # once you get to the piece stop
+                    break
+        for i in range(len(moves) - 1, -1, -1):
+            move = moves[i]
+            if move.pieceMoved[1] != 'K':
+                if (move.endRow, move.endCol) not in validSquares:
+                    # an en passant capture can still remove a checking pawn
+                    if not (move.flag == enPassantMove and (move.startRow, move.endCol) == (checkRow, checkCol)):
+                        del moves[i]
+
+    '''
+    The legal captures, en passant captures and promotions, without generating any quiet move. The quiescence
+    search needs nothing else, and they are the first stage of generateMoves.
+    '''
+    def getNoisyMoves(self, moves=None):
+        moves, kingRow, kingCol, inCheck = self.startGeneration(moves)
+        doubleCheck = inCheck and len(self.checks) > 1
+        board = self.board
+        allyColor, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        pins = self.pins
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece[0] != allyColor or (doubleCheck and piece[1] != 'K'):
+                    continue
+                kind = piece[1]
+                startSq = r * 8 + c
+                if kind == 'P':
+                    self.getPawnNoisyMoves(r, c, moves)
+                elif kind == 'N':
+                    if (r, c) not in pins:  # a pinned knight can never move
+                        for endRow, endCol in knightSquares[r][c]:
+                            endPiece = board[endRow][endCol]
+                            if endPiece[0] == enemyColor:
+                                moves.append(getMove(startSq, endRow * 8 + endCol, piece, endPiece))
+                elif kind == 'K':
+                    for endRow, endCol in kingSquares[r][c]:
+                        endPiece = board[endRow][endCol]
+                        if endPiece[0] == enemyColor and not self.squareUnderAttack(endRow, endCol):
+                            moves.append(getMove(startSq, endRow * 8 + endCol, piece, endPiece))
+                else:
+                    pin = pins.get((r, c))
+                    rays = raySquares[r][c]
+                    for i in sliderRays[kind]:
+                        d = rayDirections[i]
+                        if pin is not None and pin != d and pin != (-d[0], -d[1]):  # pinned pieces stay on the pin line
+                            continue
+                        for endRow, endCol in rays[i]:
+                            endPiece = board[endRow][endCol]
+                            if endPiece != "--":  # only the first piece along the ray can be taken
+                                if endPiece[0] == enemyColor:
+                                    moves.append(getMove(startSq, endRow * 8 + endCol, piece, endPiece))
+                                break
+        if inCheck and not doubleCheck:
+            self.removeNonEvasions(moves, kingRow, kingCol)
+        return moves
+
+    '''
+    The captures and promotions of the pawn at r, c: getPawnMoves without the quiet pushes
+    '''
+    def getPawnNoisyMoves(self, r, c, moves):
+        board = self.board
+        if self.whiteToMove:
+            moveAmount, enemyColor = -1, 'b'
+        else:
+            moveAmount, enemyColor = 1, 'w'
+        endRow = r + moveAmount
+        startSq = r * 8 + c
+        pieceMoved = board[r][c]
+        promotion = endRow == 0 or endRow == 7
+        if promotion and board[endRow][c] == "--" and self.pinAllows(r, c, moveAmount, 0):
+            addPromotions(moves, startSq, endRow * 8 + c, pieceMoved, "--")
+        for dirCol in (-1, 1):
+            endCol = c + dirCol
+            if 0 <= endCol <= 7 and self.pinAllows(r, c, moveAmount, dirCol):
+                endPiece = board[endRow][endCol]
+                if endPiece[0] == enemyColor:
+                    if promotion:
+                        addPromotions(moves, startSq, endRow * 8 + endCol, pieceMoved, endPiece)
+                    else:
+                        moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, endPiece))
+                elif (endRow, endCol) == self.enPassantPossible and not self.enPassantExposesKing(r, c, endRow, endCol):
+                    moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, "--", enPassantMove))
+
+    '''
+    The legal moves that are neither captures nor promotions, castling included: the last stage of generateMoves
+    '''
+    def getQuietMoves(self, moves=None):
+        moves, kingRow, kingCol, inCheck = self.startGeneration(moves)
+        if inCheck and len(self.checks) > 1:
+            self.getKingMoves(kingRow, kingCol, moves)
+        else:
+            self.getAllPossibleMoves(moves)
+            if inCheck:
+                self.removeNonEvasions(moves, kingRow, kingCol)
+        moves[:] = [move for move in moves if move.pieceCaptured == "--" and not move.isPawnPromotion]
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, moves)
+        return moves
 
-        self.enPassantPossible = tempEnPassantPossible
-        self.currentCastlingRights = tempCastleRights
+    '''
+    The legal moves of the piece on r, c only, none if it is not a piece of the side to move
+    '''
+    def getMovesFrom(self, r, c, moves=None):
+        moves, kingRow, kingCol, inCheck = self.startGeneration(moves)
+        piece = self.board[r][c]
+        if piece[0] != ('w' if self.whiteToMove else 'b'):
+            return moves
+        if piece[1] == 'K':
+            self.getKingMoves(r, c, moves)
+            if not inCheck:
+                self.getCastleMoves(r, c, moves)
+        elif not inCheck or len(self.checks) == 1:
+            self.moveFunctions[piece[1]](r, c, moves)
+            if inCheck:
+                self.removeNonEvasions(moves, kingRow, kingCol)
         return moves
 
+    '''
+    The legal moves one stage at a time, each stage generated only once the one before has been used up: first
+    the moves in priorityMoves (Move.packed codes, such as the move from a transposition table) that are legal
+    here, then captures and promotions ordered by captureOrder, then quiet moves ordered by quietOrder if it is
+    given, both highest first. A caller that stops early, on a beta cutoff say, never pays for the later stages.
+    The game state may be changed between moves as long as it is back in this position when the next is asked for.
+    '''
+    def generateMoves(self, priorityMoves=(), captureOrder=None, quietOrder=None):
+        found = []
+        for packed in priorityMoves:
+            if packed and packed not in found:  # 0 is no move
+                startSq = packed & 63
+                for move in self.getMovesFrom(startSq >> 3, startSq & 7):
+                    if move.packed == packed:
+                        found.append(packed)
+                        yield move
+                        break
+        moves = self.getNoisyMoves()
+        moves.sort(key=captureOrder or mvvLva, reverse=True)
+        for move in moves:
+            if move.packed not in found:
+                yield move
+        moves = self.getQuietMoves()
+        if quietOrder is not None:
+            moves.sort(key=quietOrder, reverse=True)
+        for move in moves:
+            if move.packed not in found:
+                yield move
+
+    '''
+    True if the side to move has a legal move, stopping at the first one found: the king's moves are tried first,
+    then one piece at a time. Sets checkMate, staleMate and the draw flags as getValidMoves does, for callers that
+    need the state of the game but not the list of moves. Castling never has to be tried, as a king that may
+    castle may also step to the square next to it.
+    '''
+    def hasLegalMove(self):
+        moves, kingRow, kingCol, inCheck = self.startGeneration(None)
+        self.getKingMoves(kingRow, kingCol, moves)
+        found = len(moves) > 0
+        if not found and not (inCheck and len(self.checks) > 1):
+            allyColor = 'w' if self.whiteToMove else 'b'
+            for r, row in enumerate(self.board):
+                for c, piece in enumerate(row):
+                    if piece[0] == allyColor and piece[1] != 'K':
+                        self.moveFunctions[piece[1]](r, c, moves)
+                        if inCheck:
+                            self.removeNonEvasions(moves, kingRow, kingCol)
+                        if moves:
+                            found = True
+                            break
+                if found:
+                    break
+        self.checkMate = inCheck and not found
+        self.staleMate = not inCheck and not found
+        self.setDrawFlags()
+        return found
+
     '''
     Determine if the current player is in check
     '''
@@ -179,24 +762,165 @@ class GameState():
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
     '''
-    Determine if the enemy can attack the square r, c
+    Determine if the enemy can attack the square r, c. Looks outward from the square along knight, pawn, king and
+    slider rays and stops at the first hit. The allied king is looked through, so the king can be tested on a
+    square it would move to.
     '''
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove #switch to opponent view
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove #switch turns back
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: #sqaure is under attack
+        board = self.board
+        if self.whiteToMove:
+            enemyColor, allyKing, pawnRow = 'b', 'wK', r - 1  # black pawns attack downwards
+        else:
+            enemyColor, allyKing, pawnRow = 'w', 'bK', r + 1  # white pawns attack upwards
+        enemyKnight = enemyColor + 'N'
+        for endRow, endCol in knightSquares[r][c]:
+            if board[endRow][endCol] == enemyKnight:
+                return True
+        if 0 <= pawnRow < 8:
+            enemyPawn = enemyColor + 'P'
+            if (c > 0 and board[pawnRow][c - 1] == enemyPawn) or (c < 7 and board[pawnRow][c + 1] == enemyPawn):
+                return True
+        enemyKing = enemyColor + 'K'
+        for endRow, endCol in kingSquares[r][c]:
+            if board[endRow][endCol] == enemyKing:
                 return True
+        rays = raySquares[r][c]
+        for j in range(8):
+            slider = 'R' if j < 4 else 'B'
+            for endRow, endCol in rays[j]:
+                endPiece = board[endRow][endCol]
+                if endPiece == "--" or endPiece == allyKing:
+                    continue
+                if endPiece[0] == enemyColor and (endPiece[1] == slider or endPiece[1] == 'Q'):
+                    return True
+                break  # first piece on the ray blocks it
         return False
 
+    '''
+    Every square attacked by the given side as a single bitmask, where bit (row * 8 + col) is set for an attacked
+    square. Pawn attacks are included whether or not the target square is occupied.
+    '''
+    def getAttackedSquares(self, white):
+        board = self.board
+        color = 'w' if white else 'b'
+        pawnDir = -1 if white else 1
+        attacked = 0
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece[0] != color:
+                    continue
+                pieceType = piece[1]
+                if pieceType == 'P':
+                    endRow = r + pawnDir
+                    if 0 <= endRow < 8:
+                        if c > 0:
+                            attacked |= 1 << (endRow * 8 + c - 1)
+                        if c < 7:
+                            attacked |= 1 << (endRow * 8 + c + 1)
+                elif pieceType == 'N':
+                    attacked |= knightMasks[r][c]
+                elif pieceType == 'K':
+                    attacked |= kingMasks[r][c]
+                else:
+                    rays = raySquares[r][c]
+                    for j in (range(4) if pieceType == 'R' else range(4, 8) if pieceType == 'B' else range(8)):
+                        for endRow, endCol in rays[j]:
+                            attacked |= 1 << (endRow * 8 + endCol)
+                            if board[endRow][endCol] != "--":  # the first piece hit stops the ray
+                                break
+        return attacked
+
+    '''
+    Look outward from the square r, c (normally the king's square) for pinned allied pieces and enemy pieces
+    giving check. Returns (inCheck, pins, checks) where pins maps a pinned piece's square to the direction of
+    the pin and checks is a list of (row, col, dirRow, dirCol) for every checking piece. The allied king is
+    looked through so the same scan can tell whether the king would be safe on a square it moves to.
+    '''
+    def checkForPinsAndChecks(self, r, c):
+        pins = {}
+        checks = []
+        inCheck = False
+        board = self.board
+        if self.whiteToMove:
+            enemyColor, allyColor = 'b', 'w'
+        else:
+            enemyColor, allyColor = 'w', 'b'
+        allyKing = allyColor + 'K'
+        rays = raySquares[r][c]
+        for j in range(8):
+            dirRow, dirCol = rayDirections[j]
+            possiblePin = None  # reset possible pins
+            i = 0
+            for endRow, endCol in rays[j]:
+                i += 1
+                endPiece = board[endRow][endCol]
+                if endPiece == "--" or endPiece == allyKing:
+                    continue
+                if endPiece[0] == allyColor:
+                    if possiblePin is None:  # 1st allied piece could be pinned
+                        possiblePin = (endRow, endCol)
+                    else:  # 2nd allied piece, so no pin or check possible in this direction
+                        break
+                else:
+                    pieceType = endPiece[1]
+                    # 5 possibilities here in this complex conditional
+                    # 1.) orthogonally away from king and piece is a rook
+                    # 2.) diagonally away from king and piece is a bishop
+                    # 3.) 1 square away diagonally from king and piece is a pawn
+                    # 4.) any direction and piece is a queen
+                    # 5.) any direction 1 square away and piece is a king
+                    if (j < 4 and pieceType == 'R') or (j >= 4 and pieceType == 'B') or pieceType == 'Q' or \
+                            (i == 1 and pieceType == 'P' and ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
+                            (i == 1 and pieceType == 'K'):
+                        if possiblePin is None:  # no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, dirRow, dirCol))
+                        else:  # piece blocking so pin
+                            pins[possiblePin] = (dirRow, dirCol)
+                    break  # enemy piece not applying check
+        # check for knight checks
+        enemyKnight = enemyColor + 'N'
+        for endRow, endCol in knightSquares[r][c]:
+            if board[endRow][endCol] == enemyKnight:
+                inCheck = True
+                checks.append((endRow, endCol, endRow - r, endCol - c))
+        return inCheck, pins, checks
+
+    '''
+    Returns True if the pin recorded for the piece at r, c (if any) allows it to move in direction dirRow, dirCol
+    '''
+    def pinAllows(self, r, c, dirRow, dirCol):
+        pin = self.pins.get((r, c))
+        return pin is None or pin == (dirRow, dirCol) or pin == (-dirRow, -dirCol)
 
+    '''
+    Returns True if capturing en passant from r, c to endRow, endCol would leave the allied king in check. Both
+    pawns leave the board at once, which can open a line that no single pin describes.
+    '''
+    def enPassantExposesKing(self, r, c, endRow, endCol):
+        board = self.board
+        pieceMoved = board[r][c]
+        capturedPiece = board[r][endCol]
+        board[r][c] = "--"
+        board[r][endCol] = "--"
+        board[endRow][endCol] = pieceMoved
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        exposed = self.squareUnderAttack(kingRow, kingCol)
+        board[endRow][endCol] = "--"
+        board[r][endCol] = capturedPiece
+        board[r][c] = pieceMoved
+        return exposed
 
     '''
-    All Moves Without Considering The King is in Check
+    All Moves Without Considering The King is in Check. A list passed in as moves is cleared and reused.
     '''
-    def getAllPossibleMoves(self):
-        moves = []
+    def getAllPossibleMoves(self, moves=None):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
         for r in range(len(self.board)):  # number of rows
             for c in range(len(self.board[r])):  # number of col's in given row.
                 turn = self.board[r][c][0]
@@ -209,125 +933,115 @@ class GameState():
     Get All Pawn Moves For The Pawn Located At Row, Col And Then Adds To Move List 
     '''
     def getPawnMoves(self, r, c, moves):
+        board = self.board
         if self.whiteToMove:  # white pawn moves
-            if self.board[r - 1][c] == "--":  # 1 square pawn move
-                moves.append(Move((r, c), (r - 1, c), self.board))
-                if r == 6 and self.board[r - 2][c] == "--":  # 2 square pawn move
-                    moves.append(Move((r, c), (r - 2, c), self.board))
-            if c - 1 >= 0:  # captures to the left
-                if self.board[r - 1][c - 1][0] == 'b':  # enemy piece to capture
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
-                elif (r-1,c-1) == self.enPassantPossible:
-                    moves.append(EnPassantMove((r, c), (r - 1, c - 1), self.board))
-            if c + 1 <= 7:  # captures to the right
-                if self.board[r - 1][c + 1][0] == 'b':  # enemy piece to capture
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                elif (r-1,c+1) == self.enPassantPossible:
-                    moves.append(EnPassantMove((r, c), (r - 1, c + 1), self.board))
-
-
+            moveAmount, startRow, enemyColor = -1, 6, 'b'
         else:  # black pawn moves
-            if self.board[r + 1][c] == "--":  # 1 square move
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == "--":  # 2 square move
-                    moves.append(Move((r, c), ( r + 2, c), self.board))
-            # captures
-            if c - 1 >= 0:  # capture to left
-                if self.board[r + 1][c - 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r+1,c-1) == self.enPassantPossible:
-                    moves.append(EnPassantMove((r, c), (r + 1, c - 1), self.board))
-            if c + 1 <= 7:  # capture to right
-                if self.board[r + 1][c + 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r+1,c+1) == self.enPassantPossible:
-                    moves.append(EnPassantMove((r, c), (r + 1, c + 1), self.board))
+            moveAmount, startRow, enemyColor = 1, 1, 'w'
+        endRow = r + moveAmount
+        startSq = r * 8 + c
+        pieceMoved = board[r][c]
+        promotion = endRow == 0 or endRow == 7
+        if board[endRow][c] == "--" and self.pinAllows(r, c, moveAmount, 0):  # 1 square pawn move
+            if promotion:
+                addPromotions(moves, startSq, endRow * 8 + c, pieceMoved, "--")
+            else:
+                moves.append(getMove(startSq, endRow * 8 + c, pieceMoved, "--"))
+            if r == startRow and board[r + 2 * moveAmount][c] == "--":  # 2 square pawn move
+                moves.append(getMove(startSq, (r + 2 * moveAmount) * 8 + c, pieceMoved, "--"))
+        for dirCol in (-1, 1):  # captures to the left and right
+            endCol = c + dirCol
+            if 0 <= endCol <= 7 and self.pinAllows(r, c, moveAmount, dirCol):
+                endPiece = board[endRow][endCol]
+                if endPiece[0] == enemyColor:  # enemy piece to capture
+                    if promotion:
+                        addPromotions(moves, startSq, endRow * 8 + endCol, pieceMoved, endPiece)
+                    else:
+                        moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, endPiece))
+                elif (endRow, endCol) == self.enPassantPossible and not self.enPassantExposesKing(r, c, endRow, endCol):
+                    moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, "--", enPassantMove))
+
     '''
-    Get All Rook Moves For The Rook Located At Row, Col And Then Adds To Move List
+    Get All Moves For A Sliding Piece Located At Row, Col Along The Given Directions And Then Adds To Move List
     '''
-    def getRookMoves(self, r, c, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+    def getSlidingMoves(self, r, c, moves, directions):
+        board = self.board
         enemyColor = "b" if self.whiteToMove else "w"
+        pin = self.pins.get((r, c))
+        startSq = r * 8 + c
+        pieceMoved = board[r][c]
         for d in directions:
+            if pin is not None and pin != d and pin != (-d[0], -d[1]):  # pinned pieces stay on the pin line
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:  # on board
-                    endPiece = self.board[endRow][endCol]
+                    endPiece = board[endRow][endCol]
                     if endPiece == "--":  # empty space valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, endPiece))
                     elif endPiece[0] == enemyColor:  # enemy piece valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, endPiece))
                         break
                     else:  # friendly piece invalid
                         break
                 else:  # off board
                     break
 
+    '''
+    Get All Rook Moves For The Rook Located At Row, Col And Then Adds To Move List
+    '''
+    def getRookMoves(self, r, c, moves):
+        self.getSlidingMoves(r, c, moves, rookDirections)
+
     '''
        Get All Knight Moves For The Knight Located At Row, Col And Then Adds To Move List
        '''
     def getKnightMoves(self, r, c, moves):
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        if (r, c) in self.pins:  # a pinned knight can never move
+            return
+        board = self.board
         allyColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:  # not an ally piece ( empty or enemy)
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+        startSq = r * 8 + c
+        pieceMoved = board[r][c]
+        for endRow, endCol in knightSquares[r][c]:
+            endPiece = board[endRow][endCol]
+            if endPiece[0] != allyColor:  # not an ally piece ( empty or enemy)
+                moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, endPiece))
 
 
     '''
        Get All Bishop Moves For The Bishop Located At Row, Col And Then Adds To Move List
        '''
     def getBishopMoves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == "--":  # empty space valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    elif endPiece[0] == enemyColor:  # enemy piece valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                        break
-                    else:  #friendly piece valid
-                        break
-                else:  # off board
-                    break
+        self.getSlidingMoves(r, c, moves, bishopDirections)
 
     '''
        Get All Queen Moves For The Queen Located At Row, Col And Then Adds To Move List
        '''
     def getQueenMoves(self, r, c, moves):
-        self.getRookMoves(r, c, moves)
-        self.getBishopMoves(r, c, moves)
+        self.getSlidingMoves(r, c, moves, rayDirections)
 
     '''
-       Get All King Moves For The King Located At Row, Col And Then Adds To Move List
+       Get All King Moves For The King Located At Row, Col And Then Adds To Move List. Only squares the king
+       would be safe on are added.
        '''
     def getKingMoves(self, r, c, moves):
-        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+        board = self.board
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + kingMoves[i][0]
-            endCol = c + kingMoves[i][1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:  # not an ally piece ( empty or enemy )
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+        startSq = r * 8 + c
+        pieceMoved = board[r][c]
+        for endRow, endCol in kingSquares[r][c]:
+            endPiece = board[endRow][endCol]
+            if endPiece[0] != allyColor:  # not an ally piece ( empty or enemy )
+                if not self.squareUnderAttack(endRow, endCol):  # king is not attacked there
+                    moves.append(getMove(startSq, endRow * 8 + endCol, pieceMoved, endPiece))
 
     '''
-    Generate all valid castle moves for the King at (r, c) and add them to the list of moves 
+    Generate all valid castle moves for the King at (r, c) and add them to the list of moves. Only called when
+    the king is not in check.
     '''
     def getCastleMoves(self, r, c, moves):
-        if self.squareUnderAttack(r, c):
-            return  # cant castle while in check
         if (self.whiteToMove and self.currentCastlingRights.whiteKingSide) or (not self.whiteToMove and self.currentCastlingRights.blackKingSide):
             self.getKingSideCastleMoves(r, c, moves)
         if (self.whiteToMove and self.currentCastlingRights.whiteQueenSide) or (not self.whiteToMove and self.currentCastlingRights.blackQueenSide):
@@ -339,7 +1053,7 @@ class GameState():
     def getKingSideCastleMoves(self, r, c, moves):
         if self.board[r][c+1] == '--' and self.board[r][c+2] == '--':
             if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
-                moves.append(CastleMove((r, c), (r, c+2), self.board))
+                moves.append(getMove(r * 8 + c, r * 8 + c + 2, self.board[r][c], '--', castleMove))
 
     '''
     Helper For getCastleMoves
@@ -347,7 +1061,25 @@ class GameState():
     def getQueenSideCastleMoves(self, r, c, moves):
         if self.board[r][c - 1] == '--' and self.board[r][c - 2] == '--' and self.board[r][c - 3] == '--':
             if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
-                moves.append(CastleMove((r, c), (r, c - 2), self.board))
+                moves.append(getMove(r * 8 + c, r * 8 + c - 2, self.board[r][c], '--', castleMove))
+
+    '''
+    The legal moves of the current position as a ValidMoves, looked up by Zobrist key in self.moveCache so a
+    position seen before (after an undo, or reached again) is not generated again. Sets checkMate and staleMate
+    like getValidMoves. The ValidMoves is shared with the cache and must not be changed.
+    '''
+    def getCachedValidMoves(self):
+        if self.moveCache is None:
+            self.moveCache = MoveCache()
+        validMoves = self.moveCache.get(self.hash)
+        if validMoves is None:
+            validMoves = ValidMoves(tuple(self.getValidMoves()), self.checkMate, self.staleMate)
+            self.moveCache.put(self.hash, validMoves)
+        else:
+            self.checkMate = validMoves.checkMate
+            self.staleMate = validMoves.staleMate
+            self.setDrawFlags()  # these depend on how the position was reached, so are not cached
+        return validMoves
 
 
 class CastleRights():
@@ -357,23 +1089,54 @@ class CastleRights():
         self.whiteQueenSide = whiteQueenSide
         self.blackQueenSide = blackQueenSide
 
+#  move flags, replacing the old EnPassantMove and CastleMove subclasses
+normalMove = 0
+enPassantMove = 1
+castleMove = 2
+promotionPieces = "NBRQ"  # promotion choice as stored in the 2 promotion bits of Move.packed
+promotionIDs = {'Q': 0, 'R': 1, 'B': 2, 'N': 3}  # added to moveID in the ten thousands, a queen keeps the plain moveID
+
+
 class Move():
     ranksToRows = {"1":7, "2":6, "3": 5, "4":4, "5":3, "6":2, "7":1, "8":0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a":0, "b":1, "c":2, "d":3, "e":4, "f":5, "g":6, "h":7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    #  no per-instance __dict__, a move is a fixed set of small fields
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'isPawnPromotion',
+                 'promotionChoice', 'moveID', 'flag', 'packed')
 
-    def __init__(self, startSq, endSq, board):  # optional paramter, defaults to () unless specified
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+    def __init__(self, startSq, endSq, board, flag=normalMove, promotionChoice='Q'):
+        self.setMove(startSq[0], startSq[1], endSq[0], endSq[1], board[startSq[0]][startSq[1]], board[endSq[0]][endSq[1]],
+                     flag, promotionChoice)
+
+    def setMove(self, startRow, startCol, endRow, endCol, pieceMoved, pieceCaptured, flag, promotionChoice='Q'):
+        self.startRow = startRow
+        self.startCol = startCol
+        self.endRow = endRow
+        self.endCol = endCol
+        self.pieceMoved = pieceMoved
+        if flag == enPassantMove:
+            pieceCaptured = 'wP' if pieceMoved == 'bP' else 'bP'
+        self.pieceCaptured = pieceCaptured
+        self.flag = flag
         #pawn promotion
-        self.isPawnPromotion = (self.pieceMoved == 'wP' and self.endRow == 0) or (self.pieceMoved == 'bP' and self.endRow == 7)
-        self.promotionChoice = 'Q'
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        self.isPawnPromotion = (pieceMoved == 'wP' and endRow == 0) or (pieceMoved == 'bP' and endRow == 7)
+        self.promotionChoice = promotionChoice
+        self.moveID = startRow * 1000 + startCol * 100 + endRow * 10 + endCol
+        if self.isPawnPromotion:  # under promotions are different moves from the queen promotion
+            self.moveID += promotionIDs[promotionChoice] * 10000
+        #  16 bit code: from square, to square, flag and promotion piece
+        self.packed = (startRow * 8 + startCol) | (endRow * 8 + endCol) << 6 | flag << 12 | \
+                      promotionPieces.index(self.promotionChoice) << 14
+
+    @property
+    def isEnPassantMove(self):
+        return self.flag == enPassantMove
+
+    @property
+    def isCastleMove(self):
+        return self.flag == castleMove
 
     '''
     Overriding the equals method
@@ -383,23 +1146,145 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.isPawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
+
+
 '''
+Every Move the generators hand out comes from this pool, keyed by squares (row * 8 + col), pieces and flag. A move is
+fully described by those, so the same object can be shared by every position it occurs in, and move generation stops
+allocating once the pool is warm. Pooled moves are shared, so they must never be modified.
+'''
+movePool = {}
+
+
+def getMove(startSq, endSq, pieceMoved, pieceCaptured, flag=normalMove, promotionChoice='Q'):
+    key = (startSq, endSq, pieceMoved, pieceCaptured, flag, promotionChoice)
+    move = movePool.get(key)
+    if move is None:
+        move = Move.__new__(Move)
+        move.setMove(startSq >> 3, startSq & 7, endSq >> 3, endSq & 7, pieceMoved, pieceCaptured, flag, promotionChoice)
+        movePool[key] = move
+    return move
 
+
+'''
+The pooled move for a Move.packed code, reading the pieces off board. The code is not checked for legality.
 '''
-class EnPassantMove(Move):
-    def __init__(self, startSq, endSq, board):
-        super().__init__(startSq, endSq, board)
-        self.pieceCaptured = 'wP' if self.pieceMoved == 'bP' else 'bP'
+def moveFromPacked(board, packed):
+    startSq = packed & 63
+    endSq = (packed >> 6) & 63
+    flag = (packed >> 12) & 3
+    return getMove(startSq, endSq, board[startSq >> 3][startSq & 7], board[endSq >> 3][endSq & 7], flag,
+                   promotionPieces[packed >> 14])
+
 
+victimValues = {'-': 0, 'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 0}
+
+
+'''
+Most valuable victim, least valuable attacker: the default order of the captures and promotions in generateMoves
 '''
+def mvvLva(move):
+    score = victimValues[move.pieceCaptured[1]] * 10
+    if move.isPawnPromotion:
+        score += victimValues[move.promotionChoice] * 10
+    return score - victimValues[move.pieceMoved[1]]
 
+
+'''
+Add a pawn move onto the last rank once for each piece it can promote to, queen first so a move built from the
+player's clicks (which always promotes to a queen) matches the first of them
+'''
+def addPromotions(moves, startSq, endSq, pieceMoved, pieceCaptured):
+    for promotionChoice in 'QRBN':
+        moves.append(getMove(startSq, endSq, pieceMoved, pieceCaptured, normalMove, promotionChoice))
+
+
+'''
+The legal moves of one position, indexed by start square so the moves of a selected piece, or the move a pair
+of clicks stands for, are found with one dictionary lookup instead of a scan of the whole list. Iterating,
+len() and indexing work as on the list of moves.
 '''
-class CastleMove(Move):
-    def __init__(self, startSq, endSq, board):
-        super().__init__(startSq, endSq, board)
+class ValidMoves():
+    __slots__ = ('moves', 'byOrigin', 'checkMate', 'staleMate')
+
+    def __init__(self, moves, checkMate=False, staleMate=False):
+        self.moves = moves
+        self.byOrigin = {}  # (row, col) -> moves of the piece on that square
+        for move in moves:
+            origin = (move.startRow, move.startCol)
+            if origin in self.byOrigin:
+                self.byOrigin[origin].append(move)
+            else:
+                self.byOrigin[origin] = [move]
+        self.checkMate = checkMate
+        self.staleMate = staleMate
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def __getitem__(self, index):
+        return self.moves[index]
+
+    def movesFrom(self, r, c):
+        return self.byOrigin.get((r, c), ())
+
+    '''
+    The legal move from startSq to endSq, both (row, col), promoting to promotionChoice if it is a promotion, or
+    None if there is no such move
+    '''
+    def find(self, startSq, endSq, promotionChoice='Q'):
+        for move in self.byOrigin.get(startSq, ()):
+            if move.endRow == endSq[0] and move.endCol == endSq[1] and \
+                    (not move.isPawnPromotion or move.promotionChoice == promotionChoice):
+                return move
+        return None
+
+
+'''
+ValidMoves by position key, least recently used first, holding at most maxEntries positions. The key is the
+Zobrist key, which covers the pieces, side to move, castling rights and en passant file, everything the legal
+moves depend on.
+'''
+class MoveCache():
+    def __init__(self, maxEntries=4096):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        validMoves = self.entries.get(key)
+        if validMoves is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return validMoves
+
+    def put(self, key, validMoves):
+        self.entries[key] = validMoves
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)  # evict the least recently used
 
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
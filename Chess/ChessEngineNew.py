@@ -1,5 +1,5 @@
 
-from Chess import ChessMain, ChessEngine
+from Chess import ChessEngine
 from abc import ABC, abstractmethod
 
 
@@ -0,0 +1,265 @@
+"""
+Search in the background, for a GUI that has to keep drawing and taking input while the engine thinks. An
+EngineWorker owns a worker process with a Searcher and a transposition table that lasts between moves. go() hands it
+a game state and returns at once; poll() picks up the progress of each finished iteration (depth, score, principal
+variation) and the final result without blocking. stop() asks for the best move found so far, cancel() abandons the
+search, and a search started with ponder=True thinks on the opponent's time until ponderHit() starts its clock or it
+is cancelled. Commands reach the worker through a pipe that the search looks at between nodes (Searcher.stopCheck).
+Given a Polyglot book (ChessBook), the worker plays from it without searching while the position is in the book,
+and given a directory of endgame tables (ChessTablebase) its searches score the positions they cover from them.
+Run from the project root to watch a search from a 30 frames a second loop, with the frame timing it kept:
+    python -m Chess.ChessEngineWorker --time 3
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from Chess.ChessBook import OpeningBook
+from Chess.ChessSearch import Searcher, maxDepth, formatScore
+from Chess.ChessTablebase import Tablebase
+from Chess.ChessTransposition import TranspositionTable
+
+
+class EngineReport():
+    def __init__(self, depth, score, pv, pvPacked, nodes, seconds):
+        self.depth = depth
+        self.score = score
+        self.pv = pv  # the principal variation in coordinate notation
+        self.pvPacked = pvPacked  # the same moves as Move.packed codes
+        self.nodes = nodes
+        self.seconds = seconds
+
+    @property
+    def bestMove(self):
+        return self.pvPacked[0] if self.pvPacked else None
+
+    @property
+    def ponderMove(self):
+        return self.pvPacked[1] if len(self.pvPacked) > 1 else None
+
+    def describe(self):
+        return "depth %d %s nodes %d %.1fs pv %s" % (self.depth, formatScore(self.score), self.nodes, self.seconds,
+                                                     " ".join(self.pv))
+
+
+def makeReport(result):
+    return EngineReport(result.depth, result.score, [move.getChessNotation() for move in result.pv],
+                        [move.packed for move in result.pv], result.nodes, result.seconds)
+
+
+'''
+State of the search running in the worker: its id, whether it is still pondering, and the commands that came in
+while it ran
+'''
+class WorkerSearch():
+    def __init__(self, connection, searcher, searchId, timeLimit, ponder):
+        self.connection = connection
+        self.searcher = searcher
+        self.searchId = searchId
+        self.timeLimit = timeLimit
+        self.pondering = ponder
+        self.stopped = False
+        self.quit = False
+        self.nextCommand = None  # a command for after this search, read while looking for a stop
+
+    def handle(self, command):
+        if command[0] == 'stop':
+            self.stopped = True
+        elif command[0] == 'go':  # a new search replaces this one
+            self.stopped = True
+            self.nextCommand = command
+        elif command[0] == 'quit':
+            self.stopped = self.quit = True
+        elif command[0] == 'ponderhit' and self.pondering:  # the move pondered on was played, start the clock
+            self.pondering = False
+            if self.timeLimit is not None:
+                self.searcher.deadline = time.perf_counter() + self.timeLimit
+
+    '''
+    Searcher.stopCheck: read any waiting commands and say whether to stop
+    '''
+    def check(self):
+        while not self.stopped and self.connection.poll():  # what comes after a stop is for the next search
+            self.handle(self.connection.recv())
+        return self.stopped
+
+    def report(self, result):
+        self.connection.send(('info', self.searchId, makeReport(result)))
+
+
+'''
+The worker process: run each search it is sent and answer with info messages and a bestmove
+'''
+def workerMain(connection, hashSizeMB, bookPath=None, tablebaseDir=None):
+    transpositionTable = TranspositionTable(hashSizeMB)
+    book = OpeningBook(bookPath) if bookPath is not None else None
+    tablebase = Tablebase(tablebaseDir) if tablebaseDir is not None else None
+    command = None
+    while True:
+        if command is None:
+            command = connection.recv()
+        if command[0] == 'quit':
+            break
+        if command[0] != 'go':
+            command = None
+            continue  # a stop or ponderhit for a search that already finished
+        _, searchId, gameState, depth, timeLimit, nodeLimit, ponder = command
+        bookMove = book.chooseMove(gameState) if book is not None and not ponder else None
+        if bookMove is not None:
+            connection.send(('bestmove', searchId, EngineReport(0, 0, [bookMove.getChessNotation()], [bookMove.packed], 0, 0.0)))
+            command = None
+            continue
+        searcher = Searcher(gameState, transpositionTable=transpositionTable, tablebase=tablebase)
+        search = WorkerSearch(connection, searcher, searchId, timeLimit, ponder)
+        searcher.stopCheck = search.check
+        result = searcher.search(depth, None if ponder else timeLimit, nodeLimit, search.report)
+        while search.pondering and not search.stopped:  # done early, but no best move while still pondering
+            search.handle(connection.recv())
+        connection.send(('bestmove', searchId, makeReport(result)))
+        if search.quit:
+            break
+        command = search.nextCommand
+    if book is not None:
+        book.close()
+    if tablebase is not None:
+        tablebase.close()
+    connection.close()
+
+
+class EngineWorker():
+    def __init__(self, hashSizeMB=16, bookPath=None, tablebaseDir=None):
+        #  spawned rather than forked, so the child does not inherit the GUI's display and event state
+        context = multiprocessing.get_context('spawn')
+        self.connection, childConnection = context.Pipe()
+        self.process = context.Process(target=workerMain, args=(childConnection, hashSizeMB, bookPath, tablebaseDir),
+                                       daemon=True)
+        self.process.start()
+        childConnection.close()
+        self.searchId = 0
+        self.thinking = False  # a search has been started and its result has not come back
+        self.pondering = False
+        self.info = None  # EngineReport of the last iteration finished by the current search
+        self.result = None  # EngineReport with the best move, once the current search is done
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    '''
+    Start searching gameState (copied, so it may change afterwards) and return at once. Any search still running is
+    cancelled. With ponder the time limit only starts when ponderHit is called.
+    '''
+    def go(self, gameState, depth=maxDepth, timeLimit=None, nodeLimit=None, ponder=False):
+        if self.thinking:
+            self.cancel()
+        self.searchId += 1
+        self.thinking = True
+        self.pondering = ponder
+        self.info = None
+        self.result = None
+        self.connection.send(('go', self.searchId, gameState, depth, timeLimit, nodeLimit, ponder))
+
+    '''
+    The opponent played the move being pondered on: keep the search and start its time limit now
+    '''
+    def ponderHit(self):
+        if self.pondering:
+            self.pondering = False
+            self.connection.send(('ponderhit',))
+
+    '''
+    Finish the current search now; its best move so far arrives through poll
+    '''
+    def stop(self):
+        if self.thinking:
+            self.pondering = False
+            self.connection.send(('stop',))
+
+    '''
+    Abandon the current search; anything it still sends is ignored
+    '''
+    def cancel(self):
+        if self.thinking:
+            self.connection.send(('stop',))
+            self.searchId += 1
+            self.thinking = self.pondering = False
+
+    '''
+    Take in the messages the worker has sent without waiting. Returns True if there was news of the current search.
+    '''
+    def poll(self):
+        news = False
+        while self.connection.poll():
+            kind, searchId, report = self.connection.recv()
+            if searchId != self.searchId:
+                continue  # from a cancelled search
+            news = True
+            if kind == 'info':
+                self.info = report
+            else:
+                self.result = report
+                self.thinking = self.pondering = False
+        return news
+
+    '''
+    Wait for the current search to finish and return its result
+    '''
+    def wait(self, timeout=None):
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        while self.thinking:
+            remaining = deadline - time.perf_counter() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            if self.connection.poll(remaining):
+                self.poll()
+        return self.result
+
+    def close(self):
+        if self.process.is_alive():
+            self.connection.send(('quit',))
+            self.process.join(5)
+        self.connection.close()
+
+
+'''
+Search gameState in an EngineWorker while a loop runs at fps frames a second, printing each iteration, and report
+how regular the frames stayed
+'''
+def frameRateCheck(gameState, timeLimit, fps=30, out=sys.stdout):
+    frameTime = 1.0 / fps
+    with EngineWorker() as engine:
+        engine.go(gameState, timeLimit=timeLimit)
+        gaps = []
+        last = time.perf_counter()
+        while engine.thinking:
+            if engine.poll() and engine.info is not None and engine.result is None:
+                print("info " + engine.info.describe(), file=out)
+            time.sleep(max(0.0, last + frameTime - time.perf_counter()))
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+    result = engine.result
+    print("bestmove %s  %s" % (result.pv[0] if result.pv else "none", result.describe()), file=out)
+    gaps.sort()
+    print("%d frames, frame time median %.1f ms, 99th percentile %.1f ms, worst %.1f ms (target %.1f ms)" % (
+        len(gaps), 1000 * gaps[len(gaps) // 2], 1000 * gaps[int(len(gaps) * 0.99)], 1000 * gaps[-1], 1000 * frameTime),
+        file=out)
+    return result
+
+
+def main(argv=None):
+    from Chess.ChessPerft import backends, newGameState
+    parser = argparse.ArgumentParser(description="Search in a background worker while a frame loop keeps running")
+    parser.add_argument("--fen", default="r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    parser.add_argument("--time", type=float, default=3.0, help="seconds to search")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--backend", choices=sorted(backends), default="list")
+    args = parser.parse_args(argv)
+    frameRateCheck(newGameState(args.fen, args.backend), args.time, args.fps)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
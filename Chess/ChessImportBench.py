@@ -0,0 +1,85 @@
+"""
+Import time benchmark for the headless engine modules. Each module is imported in a fresh interpreter, the way a
+short lived evaluator process would start, and the run fails if the import pulls in a GUI module or takes longer
+than the budget. Run from the project root, for example:
+    python -m Chess.ChessImportBench
+    python -m Chess.ChessImportBench --repeat 20 --budget 50 Chess.ChessEngine
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+#  every module that must work without a display: all of the package but ChessMain and ChessEngineWorker (the GUI
+#  and its engine thread) and ChessVectorized (which needs NumPy)
+headlessModules = ['Chess.ChessEngine', 'Chess.ChessBitboard', 'Chess.ChessPerft', 'Chess.ChessSearch',
+                   'Chess.ChessTransposition', 'Chess.ChessEvaluation', 'Chess.ChessParallel', 'Chess.ChessBinary',
+                   'Chess.ChessPGN', 'Chess.ChessAnalysis', 'Chess.ChessBook', 'Chess.ChessTablebase',
+                   'Chess.ChessInstrument', 'Chess.ChessMatch']
+guiModules = ['pygame']
+
+#  run in the child interpreter: time the import itself and list any GUI modules that came with it
+probe = '''
+import json, sys, time
+start = time.perf_counter()
+__import__(%r)
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "gui": [m for m in %r if m in sys.modules]}))
+'''
+
+
+'''
+Start a fresh interpreter that imports module and return (import seconds, process seconds, GUI modules loaded)
+'''
+def measureImport(module):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', probe % (module, guiModules)], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    processTime = time.perf_counter() - start
+    result = json.loads(output.splitlines()[-1])
+    return result['seconds'], processTime, result['gui']
+
+
+'''
+Wall time of an interpreter that imports nothing, to subtract from the process times
+'''
+def measureBaseline():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start import benchmark for the headless engine modules")
+    parser.add_argument("modules", nargs="*", default=headlessModules)
+    parser.add_argument("--repeat", type=int, default=10, help="fresh interpreters per module")
+    parser.add_argument("--budget", type=float, default=100.0, help="fail if a median import takes longer (ms)")
+    args = parser.parse_args(argv)
+
+    baseline = statistics.median(measureBaseline() for _ in range(args.repeat))
+    print("interpreter start %.1f ms" % (baseline * 1000))
+    passed = True
+    for module in args.modules:
+        imports, processes, gui = [], [], set()
+        for _ in range(args.repeat):
+            importTime, processTime, loaded = measureImport(module)
+            imports.append(importTime)
+            processes.append(processTime)
+            gui.update(loaded)
+        importMs = statistics.median(imports) * 1000
+        status = "ok"
+        if gui:
+            status = "FAIL (imported %s)" % ", ".join(sorted(gui))
+            passed = False
+        elif importMs > args.budget:
+            status = "FAIL (over %.0f ms budget)" % args.budget
+            passed = False
+        print("%-24s import %7.1f ms  process %7.1f ms over baseline  %s" % (
+            module, importMs, (statistics.median(processes) - baseline) * 1000, status))
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
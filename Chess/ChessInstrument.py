@@ -0,0 +1,298 @@
+"""
+Opt-in counters and timers for the hot parts of the rules engine: move generation, attack checks, makeMove and
+undoMove, and the Moves handed out by the move pool. Instrumentation swaps wrapped versions of those methods into
+GameState and BitboardGameState (and of getMove into the modules that call it) while it is enabled and puts the
+originals back when it is disabled, so an engine that is not being measured runs exactly the code it always did.
+A snapshot holds, for each wrapped function, its calls and the time spent in it (inclusive of what it calls), the
+Move objects allocated, and the nodes (moves made) per second since the counters were last reset; it exports as JSON
+or in the Prometheus text format. Only one Instrumentation can be enabled at a time, and it only sees the process it
+runs in.
+Run from the project root, for example:
+    python -m Chess.ChessInstrument search --depth 4 --format prometheus
+    python -m Chess.ChessInstrument perft --position kiwipete --depth 3
+    python -m Chess.ChessInstrument bench --depth 3
+"""
+import argparse
+import functools
+import json
+import sys
+import time
+import tracemalloc
+import Chess.ChessBitboard
+import Chess.ChessEngine
+from Chess.ChessBitboard import BitboardGameState
+from Chess.ChessEngine import GameState, Move
+
+#  the GameState methods wrapped, where a class defines them itself. generateMoves is left out: it is a generator,
+#  and timing it would only time creating it.
+instrumentedMethods = ('getValidMoves', 'getAllPossibleMoves', 'getNoisyMoves', 'getQuietMoves', 'getMovesFrom',
+                       'generateLegalMoves', 'hasLegalMove', 'checkForPinsAndChecks', 'squareUnderAttack', 'inCheck',
+                       'getAttackedSquares', 'makeMove', 'undoMove')
+#  modules that call getMove through a global of their own
+moveModules = (Chess.ChessEngine, Chess.ChessBitboard)
+
+activeInstrumentation = None  # the Instrumentation enabled in this process, if any
+
+
+'''
+function wrapped to add its calls and the time spent in it to stats, a [calls, seconds] list
+'''
+def timedFunction(function, stats):
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats[0] += 1
+            stats[1] += clock() - start
+    return timed
+
+
+class Instrumentation():
+    def __init__(self, classes=(GameState, BitboardGameState), traceMemory=False):
+        self.classes = classes
+        self.traceMemory = traceMemory  # also follow the bytes Python allocates, through tracemalloc (slow)
+        self.enabled = False
+        self.originals = []  # (owner, attribute, original) for everything swapped in by the last enable
+        self.stats = {}  # 'Class.method' or 'getMove': [calls, seconds], shared with the wrapper that counts them
+        self.memory = (0, 0)  # tracemalloc's current and peak bytes when last disabled
+        self.reset()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    '''
+    Zero every counter and restart the clock for nodes per second
+    '''
+    def reset(self):
+        for stats in self.stats.values():
+            stats[0] = 0
+            stats[1] = 0.0
+        self.moveAllocations = 0  # Moves made by getMove for the pool, or built with Move()
+        self.elapsed = 0.0  # seconds enabled before startTime
+        self.startTime = time.perf_counter()
+        if self.enabled and self.traceMemory:
+            if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9
+                tracemalloc.clear_traces()
+                tracemalloc.reset_peak()
+            else:  # starting again clears the traces and the peak
+                tracemalloc.stop()
+                tracemalloc.start()
+
+    def statsFor(self, name):
+        return self.stats.setdefault(name, [0, 0.0])
+
+    def swap(self, owner, attribute, replacement):
+        self.originals.append((owner, attribute, getattr(owner, attribute)))
+        setattr(owner, attribute, replacement)
+
+    def enable(self):
+        global activeInstrumentation
+        if self.enabled:
+            return
+        if activeInstrumentation is not None:
+            raise RuntimeError("another Instrumentation is already enabled")
+        self.originals = []
+        for cls in self.classes:
+            for name in instrumentedMethods:
+                if name in cls.__dict__:  # an inherited method is counted under the class that defines it
+                    self.swap(cls, name, timedFunction(cls.__dict__[name], self.statsFor(cls.__name__ + '.' + name)))
+        self.swapMoveAllocation()
+        if self.traceMemory:
+            tracemalloc.start()
+        activeInstrumentation = self
+        self.enabled = True
+        self.startTime = time.perf_counter()
+
+    '''
+    Count calls of getMove and the Moves it has to allocate (pool misses), and Moves built directly
+    '''
+    def swapMoveAllocation(self):
+        movePool = Chess.ChessEngine.movePool
+        originalGetMove = Chess.ChessEngine.getMove
+        getMoveStats = self.statsFor('getMove')
+        instrumentation = self
+
+        def getMove(startSq, endSq, pieceMoved, pieceCaptured, *args):
+            size = len(movePool)
+            move = originalGetMove(startSq, endSq, pieceMoved, pieceCaptured, *args)
+            instrumentation.moveAllocations += len(movePool) - size
+            return move
+        getMove = timedFunction(getMove, getMoveStats)
+        for module in moveModules:
+            self.swap(module, 'getMove', getMove)
+        originalInit = Move.__init__
+
+        @functools.wraps(originalInit)
+        def init(move, *args, **kwargs):
+            instrumentation.moveAllocations += 1
+            originalInit(move, *args, **kwargs)
+        self.swap(Move, '__init__', init)
+
+    def disable(self):
+        global activeInstrumentation
+        if not self.enabled:
+            return
+        for owner, attribute, original in reversed(self.originals):
+            setattr(owner, attribute, original)
+        if self.traceMemory:
+            self.memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.elapsed += time.perf_counter() - self.startTime
+        activeInstrumentation = None
+        self.enabled = False
+
+    '''
+    True while disabled if everything swapped in is the original again, which is what makes the disabled cost zero
+    '''
+    def isRestored(self):
+        return not self.enabled and all(getattr(owner, attribute) is original
+                                        for owner, attribute, original in self.originals)
+
+    def seconds(self):
+        return self.elapsed + (time.perf_counter() - self.startTime if self.enabled else 0.0)
+
+    '''
+    The counters as a dictionary: 'functions' maps each wrapped function that was called to its calls, seconds and
+    mean microseconds per call; 'nodes' are moves made, over 'seconds' enabled since the last reset
+    '''
+    def snapshot(self):
+        seconds = self.seconds()
+        nodes = sum(calls for name, (calls, _) in self.stats.items() if name.endswith('.makeMove'))
+        functions = {}
+        for name, (calls, spent) in sorted(self.stats.items()):
+            if calls:
+                functions[name] = {'calls': calls, 'seconds': spent, 'meanMicroseconds': 1e6 * spent / calls}
+        snapshot = {'seconds': seconds, 'nodes': nodes, 'nodesPerSecond': nodes / seconds if seconds > 0 else 0.0,
+                    'functions': functions, 'allocations': {'Move': self.moveAllocations}}
+        if self.traceMemory:
+            current, peak = tracemalloc.get_traced_memory() if self.enabled else self.memory
+            snapshot['memory'] = {'currentBytes': current, 'peakBytes': peak}
+        return snapshot
+
+    def toJSON(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    '''
+    The snapshot in the Prometheus text exposition format, every metric name starting with prefix
+    '''
+    def toPrometheus(self, prefix='emmchess'):
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for labels, value in samples:
+                lines.append("%s_%s%s %s" % (prefix, name, labels, repr(float(value)) if isinstance(value, float) else value))
+        functions = snapshot['functions']
+        metric('calls_total', 'counter', "Calls of an instrumented engine function.",
+               [('{function="%s"}' % name, stats['calls']) for name, stats in functions.items()])
+        metric('seconds_total', 'counter', "Seconds spent in an instrumented engine function, including its callees.",
+               [('{function="%s"}' % name, stats['seconds']) for name, stats in functions.items()])
+        metric('allocations_total', 'counter', "Objects allocated by the engine.",
+               [('{type="%s"}' % name, count) for name, count in snapshot['allocations'].items()])
+        metric('nodes_total', 'counter', "Moves made.", [('', snapshot['nodes'])])
+        metric('nodes_per_second', 'gauge', "Moves made per second since the counters were reset.",
+               [('', snapshot['nodesPerSecond'])])
+        if 'memory' in snapshot:
+            metric('memory_bytes', 'gauge', "Bytes allocated by Python and not yet freed, traced by tracemalloc.",
+                   [('{kind="current"}', snapshot['memory']['currentBytes']),
+                    ('{kind="peak"}', snapshot['memory']['peakBytes'])])
+        return "\n".join(lines) + "\n"
+
+    '''
+    The functions that took the most time, as a table of text lines
+    '''
+    def describe(self, limit=12):
+        snapshot = self.snapshot()
+        lines = ["%d nodes in %.2fs, %.0f nodes per second, %d Moves allocated" % (
+            snapshot['nodes'], snapshot['seconds'], snapshot['nodesPerSecond'], snapshot['allocations']['Move'])]
+        ranked = sorted(snapshot['functions'].items(), key=lambda item: -item[1]['seconds'])
+        for name, stats in ranked[:limit]:
+            lines.append("  %-42s %10d calls %8.3fs %8.2f us/call" % (name, stats['calls'], stats['seconds'],
+                                                                     stats['meanMicroseconds']))
+        return lines
+
+
+'''
+The best of repeat timings of perft on fen at depth, for each backend: never instrumented, after an Instrumentation
+was enabled and disabled again, and while enabled. The first two run the very same function objects, checked with
+isRestored, so any difference between them is the machine's timing noise; that is the point of swapping the wrapped
+methods in and out rather than checking a flag in every call.
+'''
+def overheadBenchmark(fen, depth=3, repeat=7, backendNames=('list', 'bitboard'), out=sys.stdout):
+    from Chess.ChessPerft import perft, newGameState
+    results = {}
+    for backend in backendNames:
+        gameState = newGameState(fen, backend)
+        perft(gameState, depth)  # warm the move pool
+
+        def timed():
+            start = time.perf_counter()
+            perft(gameState, depth)
+            return time.perf_counter() - start
+        never = min(timed() for _ in range(repeat))
+        instrumentation = Instrumentation()
+        on = []
+        off = []
+        for _ in range(repeat):  # alternate so drift in the machine's speed hits both alike
+            with instrumentation:
+                on.append(timed())
+            off.append(timed())
+        results[backend] = {'never': never, 'disabled': min(off), 'enabled': min(on),
+                            'restored': instrumentation.isRestored()}
+        print("%-8s perft %d: never instrumented %.3fs, disabled %.3fs (%+.1f%%), enabled %.3fs (%+.0f%%), "
+              "originals restored: %s" % (backend, depth, never, min(off), 100 * (min(off) / never - 1), min(on),
+                                          100 * (min(on) / never - 1), "yes" if results[backend]['restored'] else "NO"),
+              file=out)
+    return results
+
+
+def main(argv=None):
+    from Chess.ChessPerft import backends, newGameState, perft, perftPositions
+    from Chess.ChessSearch import Searcher
+    parser = argparse.ArgumentParser(description="Count and time the engine's hot functions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="instrument a search")
+    perftCommand = commands.add_parser("perft", help="instrument a perft run")
+    bench = commands.add_parser("bench", help="measure what instrumentation costs, on and off")
+    for command in (search, perftCommand, bench):
+        command.add_argument("--fen")
+        command.add_argument("--position", choices=[name for name, _, _ in perftPositions], default="kiwipete")
+        command.add_argument("--depth", type=int, default=3)
+    for command in (search, perftCommand):
+        command.add_argument("--backend", choices=sorted(backends), default="list")
+        command.add_argument("--format", choices=["text", "json", "prometheus"], default="text")
+        command.add_argument("--memory", action="store_true", help="also trace allocated bytes (slow)")
+    bench.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+    fen = args.fen or next(fen for name, fen, _ in perftPositions if name == args.position)
+
+    if args.command == "bench":
+        overheadBenchmark(fen, args.depth, args.repeat)
+        return 0
+    gameState = newGameState(fen, args.backend)
+    with Instrumentation(traceMemory=args.memory) as instrumentation:
+        if args.command == "search":
+            Searcher(gameState).search(args.depth)
+        else:
+            perft(gameState, args.depth)
+    if args.format == "json":
+        print(instrumentation.toJSON())
+    elif args.format == "prometheus":
+        sys.stdout.write(instrumentation.toPrometheus())
+    else:
+        print("\n".join(instrumentation.describe()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
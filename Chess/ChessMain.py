@@ -2,40 +2,166 @@
 This class will be the main driver class and will handle user input and display of the current game state.
 """
 
+import argparse
 import pygame as p
-from Chess import ChessEngine
+from Chess import ChessEngine, ChessEngineWorker
 
 width = height = 512
 dimension: int = 8
 sqSize = height // dimension
 maxFPS = 30
 images = {}
+surfaces = {} #board background and highlight squares, drawn once by loadSurfaces
+textSurfaces = {} #rendered messages by text
+fonts = {}
+fullRedraw = False #set to True to redraw the whole board every frame at maxFPS instead of only what changed
+engineColor = None #'w' or 'b' for the engine to play that side, None for two players at the board
+engineTime = 2.0 #seconds the engine thinks per move
+ponder = True #let the engine think on the player's time about the reply it expects
+bookPath = None #Polyglot opening book (.bin) for the engine to play from while the game is in it
+tablebaseDir = None #directory of endgame tables (ChessTablebase) for the engine to play endings from
+engineEvent = p.USEREVENT #timer that wakes the loop to look for engine news while it thinks
 
 def loadImages():
     pieces = ['wP', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bP', 'bR', 'bN', 'bB', 'bQ', 'bK']
     for piece in pieces:
         images[piece] = p.transform.scale(p.image.load("EMMbastard/" + piece + ".png"), (sqSize, sqSize))
+
+'''
+Draw the empty board and the translucent highlight squares once, so a frame only has to blit them
+'''
+def loadSurfaces():
+    background = p.Surface((width, height))
+    drawBoard(background)
+    surfaces['board'] = background
+    for name, color in (('selected', 'blue'), ('target', 'yellow')):
+        surface = p.Surface((sqSize, sqSize))
+        surface.set_alpha(100)
+        surface.fill(p.Color(color))
+        surfaces[name] = surface
+
+'''
+The message drawn over the board when the game is over, or None while it goes on
+'''
+def gameOverText(gameState):
+    if gameState.checkMate:
+        return 'Black wins' if gameState.whiteToMove else 'White wins'
+    if gameState.staleMate:
+        return 'Stalemate'
+    if gameState.repetitionDraw:
+        return 'Draw by repetition'
+    if gameState.fiftyMoveDraw:
+        return 'Draw by fifty move rule'
+    return None
+
+'''
+What every square shows, (piece, highlight) with highlight None, 'selected' or 'target', so two frames can be
+compared square by square
+'''
+def squareStates(gameState, validMoves, sqSelected):
+    board = gameState.board
+    states = [[(board[r][c], None) for c in range(dimension)] for r in range(dimension)]
+    if sqSelected != ():
+        r, c = sqSelected
+        if board[r][c][0] == ('w' if gameState.whiteToMove else 'b'): #selected color matches whose turn it is
+            states[r][c] = (board[r][c], 'selected')
+            for move in validMoves.movesFrom(r, c):
+                states[move.endRow][move.endCol] = (board[move.endRow][move.endCol], 'target')
+    return states
+
+class BoardRenderer():
+    def __init__(self, screen):
+        self.screen = screen
+        self.shown = None #square states on the screen, None when it all has to be drawn again
+        self.text = None #message on the screen
+
+    '''
+    Forget what is on the screen, so the next draw repaints everything (after the window was covered, say)
+    '''
+    def invalidate(self):
+        self.shown = None
+
+    '''
+    Repaint only the squares whose piece or highlight changed since the last draw, and the message if it changed
+    or a repainted square lies under it, then push just those rectangles to the display
+    '''
+    def draw(self, gameState, validMoves, sqSelected, text=None):
+        states = squareStates(gameState, validMoves, sqSelected)
+        fullDraw = self.shown is None
+        changed = [(r, c) for r in range(dimension) for c in range(dimension)
+                   if fullDraw or states[r][c] != self.shown[r][c]]
+        if text != self.text and self.text is not None: #squares under the old message
+            oldRect = textRect(self.text)
+            changed.extend((r, c) for r in range(dimension) for c in range(dimension)
+                           if (r, c) not in changed and oldRect.colliderect(squareRect(r, c)))
+        dirty = []
+        for r, c in changed:
+            rect = squareRect(r, c)
+            self.screen.blit(surfaces['board'], rect, rect)
+            piece, highlight = states[r][c]
+            if highlight is not None:
+                self.screen.blit(surfaces[highlight], rect)
+            if piece != "--":
+                self.screen.blit(images[piece], rect)
+            dirty.append(rect)
+        if text is not None and (text != self.text or any(textRect(text).colliderect(rect) for rect in dirty)):
+            dirty.append(drawText(self.screen, text))
+        self.shown = states
+        self.text = text
+        if fullDraw:
+            p.display.flip()
+        elif dirty:
+            p.display.update(dirty)
+        return len(dirty) != 0
+
+def engineToMove(gameState):
+    return engineColor == ('w' if gameState.whiteToMove else 'b')
+
+'''
+Start or stop the timer that wakes the event loop to poll the engine, which is only needed while it is busy
+'''
+def setEngineTimer(busy):
+    p.time.set_timer(engineEvent, 1000 // maxFPS if busy else 0)
+
 def main():
     p.init()
     screen = p.display.set_mode((width, height))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
+    moveCache = ChessEngine.MoveCache() #legal moves of recent positions, kept across undo and reset
     gameState = ChessEngine.GameState()
-    validMoves = gameState.getValidMoves()
+    gameState.moveCache = moveCache
+    validMoves = gameState.getCachedValidMoves()
     moveMade = False #flag varriable for when a move is made
 
     loadImages()
+    loadSurfaces()
+    renderer = BoardRenderer(screen)
+    if not fullRedraw: #only wake up for the events the board reacts to
+        p.event.set_blocked(None)
+        p.event.set_allowed([p.QUIT, p.MOUSEBUTTONDOWN, p.KEYDOWN, p.VIDEOEXPOSE, engineEvent])
+    engine = ChessEngineWorker.EngineWorker(bookPath=bookPath, tablebaseDir=tablebaseDir) if engineColor is not None else None
+    engineState = 'idle' #or 'thinking' about its move, or 'pondering' on the player's time
+    ponderMove = None #Move.packed code of the reply the engine is pondering on
     running = True
     sqSelected = () #last click of the user (row, col)
     playerClicks = [] #player clicks ex: [(1,2), (3,4)]
     gameOver = False
+    if not fullRedraw:
+        renderer.draw(gameState, validMoves, sqSelected) #first frame, the loop then waits for events
     while running:
-        for e in p.event.get():
+        if fullRedraw:
+            events = p.event.get()
+        else:
+            events = [p.event.wait()] + p.event.get() #sleep until something happens
+        for e in events:
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.VIDEOEXPOSE:
+                renderer.invalidate()
             # Mouse Handler
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver:
+                if not gameOver and not (engine is not None and engineToMove(gameState)):
                     location = p.mouse.get_pos()
                     col = location[0]//sqSize
                     row = location[1]//sqSize
@@ -46,25 +172,40 @@ def main():
                         sqSelected = (row, col)
                         playerClicks.append(sqSelected) #append both clicks
                     if len(playerClicks) == 2:
-                        move = ChessEngine.Move(playerClicks[0], playerClicks[1], gameState.board)
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                gameState.makeMove(validMoves[i])
-                                moveMade = True
-                                print(move.getChessNotation())
-                                sqSelected = ()  #reset square for next
-                                playerClicks = []  #reset clicks for next
+                        move = validMoves.find(playerClicks[0], playerClicks[1])
+                        if move is not None:
+                            gameState.makeMove(move)
+                            moveMade = True
+                            print(move.getChessNotation())
+                            if engineState == 'pondering':
+                                if move.packed == ponderMove: #the expected reply, the search carries on
+                                    engine.ponderHit()
+                                    engineState = 'thinking'
+                                else:
+                                    engine.cancel()
+                                    engineState = 'idle'
+                            sqSelected = ()  #reset square for next
+                            playerClicks = []  #reset clicks for next
                         if not moveMade:
                             playerClicks = [sqSelected]
             # key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z:  # undo when keyboard 'z' is pressed
                     gameState.undoMove()
+                    if engine is not None:
+                        engine.cancel()
+                        engineState = 'idle'
+                        if engineToMove(gameState) and len(gameState.moveLog) > 0: #back to the player's move
+                            gameState.undoMove()
                     moveMade = True
                     gameOver = False
                 if e.key == p.K_r:  # reset game when 'r' pressed
+                    if engine is not None:
+                        engine.cancel()
+                        engineState = 'idle'
                     gameState = ChessEngine.GameState()
-                    validMoves = gameState.getValidMoves()
+                    gameState.moveCache = moveCache
+                    validMoves = gameState.getCachedValidMoves()
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
@@ -72,23 +213,53 @@ def main():
                     #animate = False    #if we decide to animate later :)
 
         if moveMade:
-            validMoves = gameState.getValidMoves()
+            validMoves = gameState.getCachedValidMoves()
             moveMade = False
 
-        drawGameState(screen, gameState, validMoves, sqSelected)
+        if engine is not None and running:
+            if engine.poll() and engine.info is not None:
+                p.display.set_caption("EMMchess  " + engine.info.describe())
+            if engineState == 'thinking' and engine.result is not None:
+                move = validMoves.find(*packedSquares(engine.result.bestMove)) if engine.result.bestMove is not None else None
+                engineState = 'idle'
+                if move is not None:
+                    gameState.makeMove(move)
+                    print(move.getChessNotation())
+                    validMoves = gameState.getCachedValidMoves()
+                    sqSelected = ()
+                    playerClicks = []
+                    if ponder and engine.result.ponderMove is not None and len(validMoves) > 0:
+                        ponderMove = engine.result.ponderMove
+                        gameState.makeMove(ChessEngine.moveFromPacked(gameState.board, ponderMove))
+                        engine.go(gameState, timeLimit=engineTime, ponder=True) #sends a copy
+                        gameState.undoMove()
+                        engineState = 'pondering'
+            if engineState == 'idle' and engineToMove(gameState) and len(validMoves) > 0 and not gameState.isDraw():
+                engine.go(gameState, timeLimit=engineTime)
+                engineState = 'thinking'
+            setEngineTimer(engineState != 'idle')
 
-        if gameState.checkMate:
+        text = gameOverText(gameState)
+        if text is not None:
             gameOver = True
-            if gameState.whiteToMove:
-                drawText(screen, 'Black wins')
-            else:
-                drawText(screen, 'White wins')
-        if gameState.staleMate:
-            gameOver = True
-            drawText(screen, 'Stalemate')
+        if fullRedraw:
+            drawGameState(screen, gameState, validMoves, sqSelected)
+            if text is not None:
+                drawText(screen, text)
+            p.display.flip()
+        elif running:
+            renderer.draw(gameState, validMoves, sqSelected, text)
+        clock.tick(maxFPS) #at most maxFPS frames a second however fast events arrive
+    if engine is not None:
+        engine.close()
 
-        clock.tick(maxFPS)
-        p.display.flip()
+'''
+The start and end squares, as (row, col), of a Move.packed code
+'''
+def packedSquares(packed):
+    startSq = packed & 63
+    endSq = (packed >> 6) & 63
+    return (startSq >> 3, startSq & 7), (endSq >> 3, endSq & 7), ChessEngine.promotionPieces[packed >> 14]
 
 def drawGameState(screen, gameState, validMoves, sqSelected):
     drawBoard(screen)
@@ -114,21 +285,46 @@ def drawHighlightedSquares(screen, gameState, validMoves, sqSelected):
         r, c = sqSelected
         if gameState.board[r][c][0] == ('w' if gameState.whiteToMove else 'b'): #selected color matches whose turn it is
             #highlight selected
-            surface = p.Surface((sqSize, sqSize))
-            surface.set_alpha(100)
-            surface.fill(p.Color('blue'))
-            screen.blit(surface, (c*sqSize,r*sqSize))
+            screen.blit(surfaces['selected'], (c*sqSize,r*sqSize))
             #highlight movable squares
-            surface.fill(p.Color('yellow'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(surface, (move.endCol*sqSize, move.endRow*sqSize))
+            for move in validMoves.movesFrom(r, c):
+                screen.blit(surfaces['target'], (move.endCol*sqSize, move.endRow*sqSize))
+
+def squareRect(r, c):
+    return p.Rect(c*sqSize, r*sqSize, sqSize, sqSize)
+
+'''
+The rendered message, made once per text since fonts are slow to load and render
+'''
+def renderText(s):
+    if s not in textSurfaces:
+        if 'message' not in fonts:
+            fonts['message'] = p.font.SysFont('Helvetica', 32, True, False)
+        textSurfaces[s] = fonts['message'].render(s, 0, p.Color('orange'))
+    return textSurfaces[s]
+
+def textRect(s):
+    textObject = renderText(s)
+    return p.Rect(0,0,width, height).move(width/2 - textObject.get_width()/2, height/2 - textObject.get_height()/2)
 
 def drawText(screen, s):
-    font = p.font.SysFont('Helvetica', 32, True, False)
-    textObject = font.render(s, 0, p.Color('orange'))
-    textLocation = p.Rect(0,0,width, height).move(width/2 - textObject.get_width()/2, height/2 - textObject.get_height()/2)
-    screen.blit(textObject, textLocation)
+    textLocation = textRect(s)
+    screen.blit(renderText(s), textLocation)
+    return textLocation
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play chess on a pygame board")
+    parser.add_argument("--engine", choices=["w", "b"], help="let the engine play this side")
+    parser.add_argument("--time", type=float, default=engineTime, help="seconds the engine thinks per move")
+    parser.add_argument("--no-ponder", action="store_true", help="do not think on the player's time")
+    parser.add_argument("--book", help="Polyglot opening book for the engine")
+    parser.add_argument("--tablebase", help="directory of endgame tables for the engine")
+    parser.add_argument("--full-redraw", action="store_true", help="redraw the whole board every frame")
+    args = parser.parse_args()
+    engineColor = args.engine
+    engineTime = args.time
+    ponder = not args.no_ponder
+    bookPath = args.book
+    tablebaseDir = args.tablebase
+    fullRedraw = args.full_redraw
     main()
\ No newline at end of file
@@ -0,0 +1,381 @@
+"""
+Headless matches between two engine configurations, for regression gating. Each player is a spec: 'random' for a
+random legal move, 'depth:N' for a search N plies deep, 'time:S' for S seconds a move or 'nodes:N' for a node budget.
+Every opening (a FEN or EPD position) is played twice with the colors swapped, and each game runs from start to end
+in a worker process, so the games spread over a process pool with a few queued per worker and every core stays busy
+while any are left. A game ends on mate, stalemate, threefold repetition, the fifty move rule, insufficient material
+or, as a draw, after maxPlies plies. Finished games are written out as PGN (ChessPGN.writeGame) as they come in, and
+the match reports games per second, the Elo difference with its 95% error bars and how busy each worker was (its
+processor time over the match's wall time, so workers sharing a core show it).
+Games with depth, nodes or random players do not depend on the order they are played in, so any worker count plays
+the same games.
+Run from the project root, for example:
+    python -m Chess.ChessMatch depth:2 random --games 40 --workers 4 --pgn match.pgn
+    python -m Chess.ChessMatch time:0.05 depth:1 --openings openings.epd --games 200
+    python -m Chess.ChessMatch depth:1 random --games 16 --scaling 1,2,4
+"""
+import argparse
+import io
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from Chess.ChessPGN import writeGame
+from Chess.ChessPerft import backends, newGameState
+from Chess.ChessSearch import Searcher
+from Chess.ChessTransposition import TranspositionTable
+
+playerKinds = {'random': None, 'depth': int, 'time': float, 'nodes': int}
+maxPlies = 400  # a game still going after this many plies is adjudicated a draw
+
+#  two plies into common openings each, so games between deterministic players differ from one pair to the next
+defaultOpenings = [
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",  # 1.e4 e5 2.Nf3 Nc6
+    "rnbqkbnr/ppp2ppp/4p3/3p4/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",  # 1.d4 d5 2.c4 e6
+    "rnbqkbnr/pp2pppp/3p4/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 3",  # 1.e4 c5 2.Nf3 d6
+    "rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3",  # 1.d4 Nf6 2.c4 g6
+    "rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3",  # 1.e4 e6 2.d4 d5
+    "rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3",  # 1.e4 c6 2.d4 d5
+    "rnbqkb1r/pppp1ppp/5n2/4p3/2P5/2N5/PP1PPPPP/R1BQKBNR w KQkq - 2 3",  # 1.c4 e5 2.Nc3 Nf6
+    "rnbqkb1r/ppp1pppp/5n2/3p4/8/5NP1/PPPPPP1P/RNBQKB1R w KQkq - 1 3",  # 1.Nf3 d5 2.g3 Nf6
+]
+
+
+'''
+(kind, value) for a player spec such as 'random', 'depth:3', 'time:0.1' or 'nodes:20000'
+'''
+def parsePlayer(spec):
+    kind, _, value = spec.partition(':')
+    if kind not in playerKinds or (playerKinds[kind] is None) != (value == ''):
+        raise ValueError("not a player: %r (random, depth:N, time:SECONDS or nodes:N)" % spec)
+    if value:
+        try:
+            value = playerKinds[kind](value)
+        except ValueError:
+            raise ValueError("not a player: %r" % spec) from None
+        if value <= 0:
+            raise ValueError("not a player: %r" % spec)
+    return kind, value or None
+
+
+class Player():
+    def __init__(self, spec, hashSizeMB=4, seed=0):
+        self.spec = spec
+        self.kind, self.value = parsePlayer(spec)
+        self.rng = random.Random(seed)
+        #  one table per player and game, so a game does not depend on the games the worker played before it
+        self.transpositionTable = TranspositionTable(hashSizeMB) if self.kind != 'random' else None
+        self.nodes = 0
+
+    def chooseMove(self, gameState, moves):
+        if self.kind == 'random':
+            return self.rng.choice(moves)
+        searcher = Searcher(gameState, transpositionTable=self.transpositionTable)
+        if self.kind == 'depth':
+            result = searcher.search(depth=self.value)
+        elif self.kind == 'time':
+            result = searcher.search(timeLimit=self.value)
+        else:
+            result = searcher.search(nodeLimit=self.value)
+        self.nodes += result.nodes
+        return result.bestMove if result.bestMove is not None else moves[0]
+
+
+'''
+True if neither side has the pieces left to mate: bare kings, or a lone knight or bishop against a bare king
+'''
+def insufficientMaterial(gameState):
+    pieces = [piece for row in gameState.board for piece in row if piece != '--' and piece[1] != 'K']
+    return not pieces or (len(pieces) == 1 and pieces[0][1] in 'NB')
+
+
+'''
+Why the game is over, or None if it goes on. The flags are the ones getValidMoves has just set.
+'''
+def adjudicate(gameState, plies, plyLimit):
+    if gameState.checkMate:
+        return 'checkmate'
+    if gameState.staleMate:
+        return 'stalemate'
+    if gameState.repetitionDraw:
+        return 'threefold repetition'
+    if gameState.fiftyMoveDraw:
+        return 'fifty move rule'
+    if insufficientMaterial(gameState):
+        return 'insufficient material'
+    if plies >= plyLimit:
+        return 'adjudicated after %d plies' % plyLimit
+    return None
+
+
+class GameRecord():
+    def __init__(self, number, result, termination, pgn, plies, nodes, seconds, cpuSeconds, worker):
+        self.number = number  # 0 based; player A has white in even games
+        self.result = result  # '1-0', '0-1' or '1/2-1/2'
+        self.termination = termination
+        self.pgn = pgn
+        self.plies = plies
+        self.nodes = nodes  # searched by both players
+        self.seconds = seconds
+        self.cpuSeconds = cpuSeconds  # the worker's processor time, less than seconds if it had to share a core
+        self.worker = worker  # pid of the process that played it
+
+    @property
+    def scoreA(self):
+        if self.result == '1/2-1/2':
+            return 0.5
+        return 1.0 if (self.result == '1-0') == (self.number % 2 == 0) else 0.0
+
+
+'''
+Play one game: task is (number, opening FEN, white's spec, black's spec, white's name, black's name, seed, maxPlies,
+hashSizeMB, backend). Runs in a worker process.
+'''
+def playGame(task):
+    number, fen, whiteSpec, blackSpec, whiteName, blackName, seed, plyLimit, hashSizeMB, backend = task
+    startTime = time.perf_counter()
+    startCPU = time.process_time()
+    gameState = newGameState(fen, backend)
+    players = (Player(whiteSpec, hashSizeMB, seed * 1000003 + number * 2),
+               Player(blackSpec, hashSizeMB, seed * 1000003 + number * 2 + 1))
+    plies = 0
+    while True:
+        moves = gameState.getValidMoves()
+        termination = adjudicate(gameState, plies, plyLimit)
+        if termination is not None:
+            break
+        move = players[0 if gameState.whiteToMove else 1].chooseMove(gameState, moves)
+        gameState.makeMove(move)
+        plies += 1
+    if gameState.checkMate:
+        result = '0-1' if gameState.whiteToMove else '1-0'
+    else:
+        result = '1/2-1/2'
+    pgn = io.StringIO()
+    writeGame(gameState, pgn, {'Event': 'EMMchess match', 'Date': time.strftime('%Y.%m.%d'), 'Round': number + 1,
+                               'White': whiteName, 'Black': blackName, 'Termination': termination}, result)
+    return GameRecord(number, result, termination, pgn.getvalue(), plies, players[0].nodes + players[1].nodes,
+                      time.perf_counter() - startTime, time.process_time() - startCPU, os.getpid())
+
+
+'''
+Elo difference of a score of wins, draws and losses, and the half width of its 95% confidence interval, from the
+spread of the per game scores. A one-sided match has an infinite difference.
+'''
+def eloDifference(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, math.inf
+
+    def elo(score):
+        if score <= 0.0:
+            return -math.inf
+        if score >= 1.0:
+            return math.inf
+        return 400.0 * math.log10(score / (1.0 - score))
+    score = (wins + 0.5 * draws) / games
+    if score <= 0.0 or score >= 1.0:
+        return elo(score), math.inf
+    variance = (wins * (1.0 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+class MatchStats():
+    def __init__(self, nameA, nameB):
+        self.nameA = nameA
+        self.nameB = nameB
+        self.wins = self.draws = self.losses = 0  # for player A
+        self.games = 0
+        self.plies = 0
+        self.nodes = 0
+        self.terminations = defaultdict(int)
+        self.busy = defaultdict(float)  # processor seconds spent playing, per worker pid
+        self.workerGames = defaultdict(int)
+        self.startTime = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, record):
+        score = record.scoreA
+        if score == 1.0:
+            self.wins += 1
+        elif score == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.games += 1
+        self.plies += record.plies
+        self.nodes += record.nodes
+        self.terminations[record.termination] += 1
+        self.busy[record.worker] += record.cpuSeconds
+        self.workerGames[record.worker] += 1
+        self.seconds = time.perf_counter() - self.startTime
+
+    @property
+    def gamesPerSecond(self):
+        return self.games / self.seconds if self.seconds > 0 else 0.0
+
+    def elo(self):
+        return eloDifference(self.wins, self.draws, self.losses)
+
+    def summary(self):
+        elo, margin = self.elo()
+        return "%d games: %s vs %s +%d =%d -%d, Elo %+.1f +/- %.1f, %.2f games/s" % (
+            self.games, self.nameA, self.nameB, self.wins, self.draws, self.losses, elo, margin, self.gamesPerSecond)
+
+    def describe(self):
+        lines = [self.summary()]
+        lines.append("%d plies (%.0f per game), %d nodes searched, %.1fs" % (
+            self.plies, self.plies / max(self.games, 1), self.nodes, self.seconds))
+        lines.append("endings: " + ", ".join("%s %d" % item for item in sorted(self.terminations.items())))
+        for worker in sorted(self.busy):
+            lines.append("worker %d: %d games, %.1fs of processor time, %.0f%% utilization" % (
+                worker, self.workerGames[worker], self.busy[worker], 100 * self.busy[worker] / max(self.seconds, 1e-9)))
+        return lines
+
+
+'''
+The positions in a stream of FEN or EPD lines, skipping blank lines and # comments. EPD lines (four fields and
+operations) start with clocks of 0 and 1.
+'''
+def readOpenings(lines):
+    openings = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split()
+        if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+            fen = " ".join(fields[:6])
+        else:
+            fen = " ".join(fields[:4]) + " 0 1"
+        newGameState(fen)  # a bad position fails here rather than in a worker
+        openings.append(fen)
+    return openings
+
+
+'''
+The game tasks of a match: every opening twice, player A with white first, until games are scheduled
+'''
+def matchTasks(specA, specB, openings, games, seed, plyLimit, hashSizeMB, backend):
+    nameA, nameB = (specA, specB) if specA != specB else (specA + ' (A)', specB + ' (B)')
+    for number in range(games):
+        fen = openings[(number // 2) % len(openings)]
+        if number % 2 == 0:
+            yield (number, fen, specA, specB, nameA, nameB, seed, plyLimit, hashSizeMB, backend)
+        else:
+            yield (number, fen, specB, specA, nameB, nameA, seed, plyLimit, hashSizeMB, backend)
+
+
+'''
+Play games between player specs specA and specB over workers processes and return the MatchStats. Each game is
+written to pgnOut as soon as it is finished, in the order they finish, and progress, if given, is called with the
+stats after every game. With workers at 1 the games are played in this process.
+'''
+def runMatch(specA, specB, games, openings=None, workers=None, pgnOut=None, progress=None, seed=1, plyLimit=maxPlies,
+             hashSizeMB=4, backend='list'):
+    parsePlayer(specA)
+    parsePlayer(specB)
+    openings = openings or defaultOpenings
+    workers = workers if workers is not None else os.cpu_count()
+    tasks = matchTasks(specA, specB, openings, games, seed, plyLimit, hashSizeMB, backend)
+    stats = MatchStats(specA if specA != specB else specA + ' (A)', specB if specA != specB else specB + ' (B)')
+
+    def finished(record):
+        stats.add(record)
+        if pgnOut is not None:
+            pgnOut.write(record.pgn)
+            pgnOut.flush()
+        if progress is not None:
+            progress(stats)
+    if workers <= 1:
+        for task in tasks:
+            finished(playGame(task))
+        return stats
+    with ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        for task in tasks:
+            pending.add(executor.submit(playGame, task))
+            if len(pending) >= 2 * workers:  # enough queued that no worker waits between games
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished(future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished(future.result())
+    return stats
+
+
+'''
+Play the same match with each number of workers and report games per second, the speedup over the first count,
+mean worker utilization and whether every count gave the same results
+'''
+def scalingBenchmark(specA, specB, games, workerCounts, openings=None, out=sys.stdout, **options):
+    baseRate = None
+    outcomes = set()
+    for workers in workerCounts:
+        pgn = io.StringIO()
+        stats = runMatch(specA, specB, games, openings, workers, pgnOut=pgn, **options)
+        outcomes.add(tuple(sorted(pgn.getvalue().split('[Event '))))  # the same games, in any order
+        baseRate = baseRate or stats.gamesPerSecond
+        utilization = sum(stats.busy.values()) / max(stats.seconds * workers, 1e-9)
+        print("workers %2d %7.2fs %6.2f games/s  speedup %5.2f  utilization %3.0f%%  %s" % (
+            workers, stats.seconds, stats.gamesPerSecond, stats.gamesPerSecond / baseRate, 100 * utilization,
+            stats.summary()), file=out)
+    print("same results for every worker count: %s (%d cores)" % ("yes" if len(outcomes) == 1 else "NO", os.cpu_count()),
+          file=out)
+    return len(outcomes) == 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a match between two players over a process pool")
+    parser.add_argument("playerA", help="random, depth:N, time:SECONDS or nodes:N")
+    parser.add_argument("playerB")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--openings", help="file of FEN or EPD positions, each played with both colors")
+    parser.add_argument("--pgn", help="write the games to this file as they finish")
+    parser.add_argument("--max-plies", type=int, default=maxPlies, help="adjudicate a draw after this many plies")
+    parser.add_argument("--hash", type=int, default=4, help="transposition table size in MB per player")
+    parser.add_argument("--backend", choices=sorted(backends), default="list")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random players")
+    parser.add_argument("--scaling", help="comma separated worker counts to compare instead of one match")
+    args = parser.parse_args(argv)
+    try:
+        parsePlayer(args.playerA)
+        parsePlayer(args.playerB)
+    except ValueError as error:
+        parser.error(str(error))
+    openings = None
+    if args.openings is not None:
+        with open(args.openings) as f:
+            openings = readOpenings(f)
+        if not openings:
+            parser.error("no positions in %s" % args.openings)
+    options = {'seed': args.seed, 'plyLimit': args.max_plies, 'hashSizeMB': args.hash, 'backend': args.backend}
+
+    if args.scaling:
+        workerCounts = [int(count) for count in args.scaling.split(',')]
+        scalingBenchmark(args.playerA, args.playerB, args.games, workerCounts, openings, **options)
+        return 0
+    reportEvery = max(1, args.games // 10)
+
+    def progress(stats):
+        if stats.games % reportEvery == 0 or stats.games == args.games:
+            print(stats.summary(), file=sys.stderr)
+    pgnOut = open(args.pgn, 'w') if args.pgn is not None else None
+    try:
+        stats = runMatch(args.playerA, args.playerB, args.games, openings, args.workers, pgnOut, progress, **options)
+    finally:
+        if pgnOut is not None:
+            pgnOut.close()
+    print("\n".join(stats.describe()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
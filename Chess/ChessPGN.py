@@ -0,0 +1,338 @@
+"""
+Streaming PGN reading and writing. readGames yields one game at a time from a file of any size, replaying each move
+through a GameState so every game comes back with real Move objects and its final position; only the game being
+read is held in memory. SAN is matched against the legal moves through an index by piece and destination square.
+writeGame turns a game state's moveLog back into PGN with SAN. readGamesParallel does the parsing and replaying in
+worker processes, handed out a batch of games at a time, and still yields the games in file order. Run from the
+project root to check the reader and writer on a few known games:
+    python -m Chess.ChessPGN --check --backend bitboard
+"""
+import argparse
+import io
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from Chess.ChessEngine import GameState, startFEN, castleMove, filesToCols, ranksToRows
+
+resultTokens = ('1-0', '0-1', '1/2-1/2', '*')
+tokenPattern = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|\(|\)|[^\s(){};]+')
+moveNumberPattern = re.compile(r'^\d+\.+')  # at least one dot, so 0-0 keeps its zero
+sanPattern = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+headerPattern = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+sevenTagRoster = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+#  (name, movetext, the FEN after it, or 'error' for a game that must not be read) checked by --check
+pgnChecks = [
+    ("letter-castling", "1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O *",
+     "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQ1RK1 b kq - 5 4"),
+    ("zero-castling", "1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. 0-0 *",
+     "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQ1RK1 b kq - 5 4"),
+    ("zero-castling-long", "1.d4 d5 2.Nc3 Nc6 3.Bf4 Bf5 4.Qd2 Qd7 5.0-0-0 0-0-0 *",
+     "2kr1bnr/pppqpppp/2n5/3p1b2/3P1B2/2N5/PPPQPPPP/2KR1BNR w - - 8 6"),
+    ("comments-and-variations", "1.e4 {main line} (1.d4 d5) 1...c5 2.Nf3 $1 d6 1-0",
+     "rnbqkbnr/pp2pppp/3p4/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 3"),
+    ("illegal-move", "1. e4 e5 2. Ke3 *", 'error'),
+]
+
+
+class PGNError(ValueError):
+    pass
+
+
+class PGNGame():
+    def __init__(self, headers):
+        self.headers = headers  # tag name -> value, in file order
+        self.san = []  # the moves as written in the file
+        self.moves = []  # the same moves as Move objects, if the game was replayed
+        self.result = headers.get('Result', '*')
+        self.gameState = None  # the final position, if the game was replayed
+        self.error = None  # why replaying stopped early, when errors are not raised
+
+
+'''
+Legal moves of the side to move indexed by (piece type, end row, end col), so SAN needs one lookup instead of a
+scan of every move
+'''
+def moveIndex(gameState):
+    index = {}
+    for move in gameState.getValidMoves():
+        key = (move.pieceMoved[1], move.endRow, move.endCol)
+        if key in index:
+            index[key].append(move)
+        else:
+            index[key] = [move]
+    return index
+
+
+'''
+The legal move a SAN string stands for in the position gameState is in. index is moveIndex(gameState) and can be
+passed in when it is already built. Raises PGNError if no legal move or more than one matches.
+'''
+def parseSAN(gameState, san, index=None):
+    if index is None:
+        index = moveIndex(gameState)
+    text = san.rstrip('+#!?')
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingSide = len(text) == 3
+        row = 7 if gameState.whiteToMove else 0
+        for move in index.get(('K', row, 6 if kingSide else 2), ()):
+            if move.flag == castleMove:
+                return move
+        raise PGNError("Illegal castling " + repr(san))
+    match = sanPattern.match(text)
+    if match is None:
+        raise PGNError("Cannot read move " + repr(san))
+    piece, fromFile, fromRank, target, promotion = match.groups()
+    candidates = index.get((piece or 'P', ranksToRows[target[1]], filesToCols[target[0]]), ())
+    found = None
+    for move in candidates:
+        if fromFile is not None and move.startCol != filesToCols[fromFile]:
+            continue
+        if fromRank is not None and move.startRow != ranksToRows[fromRank]:
+            continue
+        if move.isPawnPromotion and move.promotionChoice != (promotion or 'Q'):
+            continue
+        if found is not None:
+            raise PGNError("Ambiguous move " + repr(san))
+        found = move
+    if found is None:
+        raise PGNError("Illegal move " + repr(san))
+    return found
+
+
+'''
+SAN for move, which must be legal in the position gameState is in. The check and mate suffixes need the move to be
+made and undone, so the game state is used but left as it was.
+'''
+def moveToSAN(gameState, move, index=None):
+    if move.flag == castleMove:
+        san = 'O-O' if move.endCol > move.startCol else 'O-O-O'
+    else:
+        if index is None:
+            index = moveIndex(gameState)
+        pieceType = move.pieceMoved[1]
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = move.pieceCaptured != '--'
+        if pieceType == 'P':
+            san = (move.colsToFiles[move.startCol] + 'x' if capture else '') + target
+            if move.isPawnPromotion:
+                san += '=' + move.promotionChoice
+        else:
+            others = [other for other in index.get((pieceType, move.endRow, move.endCol), ())
+                      if other.startRow != move.startRow or other.startCol != move.startCol]
+            disambiguation = ''
+            if others:
+                if all(other.startCol != move.startCol for other in others):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in others):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = pieceType + disambiguation + ('x' if capture else '') + target
+    gameState.makeMove(move)
+    if gameState.inCheck():
+        san += '#' if not gameState.hasLegalMove() else '+'
+    gameState.undoMove()
+    return san
+
+
+'''
+Split a stream of PGN lines into the text of one game at a time: a tag section followed by movetext
+'''
+def splitGames(lines):
+    gameLines = []
+    inMovetext = False
+    for line in lines:
+        if line.startswith('%'):  # escaped line
+            continue
+        stripped = line.strip()
+        if stripped.startswith('['):
+            if inMovetext:
+                yield ''.join(gameLines)
+                gameLines = []
+                inMovetext = False
+        elif stripped:
+            inMovetext = True
+        gameLines.append(line)
+    if any(line.strip() for line in gameLines):
+        yield ''.join(gameLines)
+
+
+'''
+Read the tags and moves of one game's text, replaying the moves from the start position (or the FEN tag) in a game
+state of gameStateClass unless replay is off. With strict off an illegal move ends the game with error set instead of
+raising PGNError.
+'''
+def parseGame(text, gameStateClass=GameState, replay=True, strict=True):
+    headers = {}
+    movetextStart = 0
+    for line in text.splitlines(True):
+        stripped = line.strip()
+        if stripped.startswith('['):
+            match = headerPattern.match(stripped)
+            if match is not None:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif stripped:
+            break
+        movetextStart += len(line)
+    game = PGNGame(headers)
+    depth = 0
+    for token in tokenPattern.findall(text, movetextStart):
+        first = token[0]
+        if first == '(':
+            depth += 1
+        elif first == ')':
+            depth -= 1
+        elif depth > 0 or first in '{;$':
+            continue
+        elif token in resultTokens:
+            game.result = token
+            break
+        else:
+            san = moveNumberPattern.sub('', token)
+            if san:
+                game.san.append(san)
+    if replay:
+        gameState = gameStateClass.fromFEN(headers.get('FEN', startFEN))
+        for san in game.san:
+            try:
+                move = parseSAN(gameState, san)
+            except PGNError as error:
+                if strict:
+                    raise PGNError("%s after %s in game %r" % (error, ' '.join(game.san[:len(game.moves)]),
+                                                                headers.get('Event', '?')))
+                game.error = str(error)
+                break
+            gameState.makeMove(move)
+            game.moves.append(move)
+        game.gameState = gameState
+    return game
+
+
+'''
+Yield the games in source, a path or an open text file, one at a time
+'''
+def readGames(source, gameStateClass=GameState, replay=True, strict=True):
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', errors='replace') as pgnFile:
+            yield from readGames(pgnFile, gameStateClass, replay, strict)
+        return
+    for text in splitGames(source):
+        yield parseGame(text, gameStateClass, replay, strict)
+
+
+def parseGameBatch(texts, gameStateClass, replay, strict):
+    return [parseGame(text, gameStateClass, replay, strict) for text in texts]
+
+
+'''
+readGames with the parsing and replaying done by a pool of worker processes. Games are sent out batchSize at a time
+with at most two batches per worker in flight, so memory stays bounded however big the file is, and they come back
+in file order.
+'''
+def readGamesParallel(source, workers=None, gameStateClass=GameState, replay=True, strict=True, batchSize=64):
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', errors='replace') as pgnFile:
+            yield from readGamesParallel(pgnFile, workers, gameStateClass, replay, strict, batchSize)
+        return
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as executor:
+        maxPending = 2 * workers
+        pending = deque()
+        batch = []
+        for text in splitGames(source):
+            batch.append(text)
+            if len(batch) == batchSize:
+                pending.append(executor.submit(parseGameBatch, batch, gameStateClass, replay, strict))
+                batch = []
+                if len(pending) >= maxPending:
+                    yield from pending.popleft().result()
+        if batch:
+            pending.append(executor.submit(parseGameBatch, batch, gameStateClass, replay, strict))
+        while pending:
+            yield from pending.popleft().result()
+
+
+'''
+Write the game played in gameState (its moveLog from its start position) to out as PGN. headers adds to or overrides
+the seven tag roster; a game that did not start from the standard position gets SetUp and FEN tags. Without a
+result it is worked out from the final position, on the copy the moves are replayed in for their SAN, so gameState
+and its flags are left as they were.
+'''
+def writeGame(gameState, out, headers=None, result=None):
+    replay = type(gameState).fromFEN(gameState.startFEN)
+    tokens = []
+    for move in gameState.moveLog:
+        if replay.whiteToMove:
+            tokens.append('%d.' % replay.getFullmoveNumber())
+        elif not tokens:
+            tokens.append('%d...' % replay.getFullmoveNumber())
+        tokens.append(moveToSAN(replay, move))
+        replay.makeMove(move)
+    if result is None:
+        hasMove = replay.hasLegalMove()  # also sets the stalemate and draw flags isDraw reads for this position
+        if not hasMove and replay.inCheck():
+            result = '0-1' if replay.whiteToMove else '1-0'
+        elif replay.isDraw():
+            result = '1/2-1/2'
+        else:
+            result = '*'
+    tags = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+    tags.update(headers or {})
+    tags['Result'] = result
+    if gameState.startFEN != startFEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = gameState.startFEN
+    for name in list(sevenTagRoster) + [name for name in tags if name not in sevenTagRoster]:
+        out.write('[%s "%s"]\n' % (name, str(tags[name]).replace('\\', '\\\\').replace('"', '\\"')))
+    out.write('\n')
+
+    tokens.append(result)
+    line = ''
+    for token in tokens:  # lines of at most 80 characters, as the PGN standard asks
+        if line and len(line) + 1 + len(token) > 80:
+            out.write(line + '\n')
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    out.write(line + '\n\n')
+
+
+'''
+Read every game of pgnChecks on gameStateClass and compare the final position, then write it with writeGame and
+read it back to check that gives the same position. Returns True if every game did as expected.
+'''
+def checkPGN(gameStateClass=GameState, out=sys.stdout):
+    passed = True
+    for name, movetext, expected in pgnChecks:
+        try:
+            game = parseGame(movetext, gameStateClass)
+            found = game.gameState.toFEN()
+            text = io.StringIO()
+            writeGame(game.gameState, text)
+            if parseGame(text.getvalue(), gameStateClass).gameState.toFEN() != found:
+                found = "a different position after writeGame"
+        except PGNError:
+            found = 'error'
+        status = "ok" if found == expected else "FAIL (got %s)" % found
+        passed = passed and found == expected
+        print("%-24s %s" % (name, status), file=out)
+    return passed
+
+
+def main(argv=None):
+    from Chess.ChessPerft import backends
+    parser = argparse.ArgumentParser(description="Check the PGN reader and writer on known games")
+    parser.add_argument("--check", action="store_true", help="read, write and read back the games of pgnChecks")
+    parser.add_argument("--backend", choices=sorted(backends), default="list")
+    args = parser.parse_args(argv)
+    if not args.check:
+        parser.print_help()
+        return 0
+    return 0 if checkPGN(backends[args.backend]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
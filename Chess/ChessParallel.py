@@ -0,0 +1,188 @@
+"""
+Parallel search across processes by splitting the root moves. At each depth the expected best move is searched first
+with a full window, then every other root move is searched as its own task in a ProcessPoolExecutor, only looking
+for a score above the first move's (young brothers wait at the root). Each task runs in a Searcher with its own
+transposition table, so its result depends only on the position, its move, the depth and that bound, and the parent
+combines the results in a fixed order: a fixed depth search gives the same move and score whatever the number of
+workers or the order they finish in.
+Run from the project root to measure how the search scales, for example:
+    python -m Chess.ChessParallel --depth 4 --workers 1 2 4 8 16
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from Chess.ChessEngine import moveFromPacked
+from Chess.ChessEvaluation import evaluate
+from Chess.ChessSearch import Searcher, SearchResult, maxDepth, mateScore, infinity, isMateScore, formatScore
+
+
+'''
+Worker task: search gameState at depth with only the root move packed (a Move.packed code), looking for a score
+above alpha. The search goes straight to depth, trying pv (this move's line from the last depth, as packed codes)
+first, as the shallower depths were searched by the tasks before. deadline is an absolute time.time(), not a budget,
+so a task that waited in the queue only gets the time that is left when it starts, and none at all if the deadline
+has passed. Returns the depth completed (0 if the budget stopped it), the score (an upper bound if it is not above
+alpha), the principal variation as packed codes and the node counts.
+'''
+def searchRootMove(gameState, packed, depth, alpha, deadline, nodeLimit, hashSizeMB, evaluate, pv=()):
+    timeLimit = None
+    if deadline is not None:
+        timeLimit = deadline - time.time()
+        if timeLimit <= 0:
+            return packed, 0, alpha, [], 0, 0
+    searcher = Searcher(gameState, evaluate, hashSizeMB)
+    result = searcher.search(depth, timeLimit, nodeLimit, rootMoves=(packed,), rootAlpha=alpha, startDepth=depth,
+                             previousPV=movesFromPacked(gameState, pv))
+    completed = 0 if searcher.stopped else depth
+    return packed, completed, result.score, [move.packed for move in result.pv], result.nodes, result.quiescenceNodes
+
+
+'''
+The pooled moves for a line of packed codes played from gameState, which is left as it was
+'''
+def movesFromPacked(gameState, pv):
+    moves = []
+    for packed in pv:
+        move = moveFromPacked(gameState.board, packed)
+        gameState.makeMove(move)
+        moves.append(move)
+    for _ in moves:
+        gameState.undoMove()
+    return moves
+
+
+def noop():
+    return None
+
+
+class ParallelSearcher():
+    def __init__(self, workers=None, hashSizeMB=4, evaluate=evaluate):
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.hashSizeMB = hashSizeMB  # per task
+        self.evaluate = evaluate
+        self.executor = ProcessPoolExecutor(self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    '''
+    Start every worker process now, so the first search is not charged for it
+    '''
+    def warmUp(self):
+        for future in [self.executor.submit(noop) for _ in range(self.workers)]:
+            future.result()
+
+    '''
+    Search gameState with iterative deepening, each depth split into one task per root move, until depth is done
+    or the time (seconds) or node budget runs out. Every task of a depth stops at the same deadline, however long it
+    waited in the queue, and the node budget is shared out between them. A depth that does not complete in every
+    task is thrown away, except that depth 1 always completes. Returns a
+    SearchResult like Searcher.search, with the nodes of all the workers added up.
+    '''
+    def search(self, gameState, depth=maxDepth, timeLimit=None, nodeLimit=None, callback=None):
+        startTime = time.perf_counter()
+        deadline = time.time() + timeLimit if timeLimit is not None else None  # wall clock, shared with the workers
+        result = SearchResult()
+        rootMoves = list(gameState.getValidMoves())
+        if len(rootMoves) == 0:
+            result.score = -mateScore if gameState.checkMate else 0
+            return result
+        generationOrder = {move.packed: i for i, move in enumerate(rootMoves)}
+        ordered = [move.packed for move in rootMoves]
+        lines = {}  # root move: its principal variation from the last depth, packed
+        for iterationDepth in range(1, min(depth, maxDepth) + 1):
+            taskDeadline = taskNodes = None
+            if iterationDepth > 1:
+                if deadline is not None:
+                    if time.time() >= deadline:
+                        break
+                    taskDeadline = deadline
+                if nodeLimit is not None:
+                    taskNodes = (nodeLimit - result.nodes) // len(ordered)
+                    if taskNodes <= 0:
+                        break
+            first = self.executor.submit(searchRootMove, gameState, ordered[0], iterationDepth, -infinity, taskDeadline,
+                                         taskNodes, self.hashSizeMB, self.evaluate, lines.get(ordered[0], ())).result()
+            if first[1] < iterationDepth or (taskDeadline is not None and time.time() >= taskDeadline):
+                result.nodes += first[4]
+                result.quiescenceNodes += first[5]
+                break  # the other moves could not finish this depth either
+            alpha = first[2]
+            futures = [self.executor.submit(searchRootMove, gameState, packed, iterationDepth, alpha, taskDeadline,
+                                            taskNodes, self.hashSizeMB, self.evaluate, lines.get(packed, ()))
+                       for packed in ordered[1:]]
+            outcomes = [first] + [future.result() for future in futures]
+            result.nodes += sum(outcome[4] for outcome in outcomes)
+            result.quiescenceNodes += sum(outcome[5] for outcome in outcomes)
+            if any(outcome[1] < iterationDepth for outcome in outcomes):
+                break
+            #  the first move stays best unless another beat it; scores at or below alpha are only bounds
+            best = first
+            raised = [outcome for outcome in outcomes[1:] if outcome[2] > alpha]
+            if raised:
+                best = min(raised, key=lambda outcome: (-outcome[2], generationOrder[outcome[0]]))
+            outcomes.sort(key=lambda outcome: (outcome is not best, -outcome[2], generationOrder[outcome[0]]))
+            ordered = [outcome[0] for outcome in outcomes]  # best first next time, so the slow tasks start early
+            lines = {outcome[0]: outcome[3] for outcome in outcomes if outcome[3]}
+            _, _, score, pv, _, _ = best
+            result.depth = iterationDepth
+            result.score = score
+            result.pv = movesFromPacked(gameState, pv)
+            result.bestMove = result.pv[0]
+            result.seconds = time.perf_counter() - startTime
+            result.iterations.append((iterationDepth, score, result.nodes, result.seconds, result.pv))
+            if callback is not None:
+                callback(result)
+            if isMateScore(score):
+                break
+        result.seconds = time.perf_counter() - startTime
+        return result
+
+
+'''
+Search the same position at the same depth with each number of workers and report time, speedup over the first
+count, nodes per second, and whether every count found the same move and score
+'''
+def scalingBenchmark(gameState, depth, workerCounts, out=sys.stdout):
+    start = time.perf_counter()
+    serial = Searcher(gameState, hashSizeMB=4).search(depth)
+    print("serial     %7.2fs %9d nodes %8.0f nps  %s %s" % (
+        time.perf_counter() - start, serial.nodes, serial.nodesPerSecond, serial.bestMove.getChessNotation(),
+        formatScore(serial.score)), file=out)
+    baseTime = None
+    answers = set()
+    for workers in workerCounts:
+        with ParallelSearcher(workers) as searcher:
+            searcher.warmUp()
+            result = searcher.search(gameState, depth)
+        baseTime = baseTime or result.seconds
+        answers.add((result.bestMove.packed, result.score))
+        print("workers %2d %7.2fs %9d nodes %8.0f nps  speedup %5.2f  %s %s" % (
+            workers, result.seconds, result.nodes, result.nodesPerSecond, baseTime / result.seconds,
+            result.bestMove.getChessNotation(), formatScore(result.score)), file=out)
+    print("same move and score for every worker count: %s (%d cores)" % (
+        "yes" if len(answers) == 1 else "NO", os.cpu_count()), file=out)
+    return len(answers) == 1
+
+
+def main(argv=None):
+    from Chess.ChessPerft import backends, newGameState
+    parser = argparse.ArgumentParser(description="Scaling benchmark for the parallel root split search")
+    parser.add_argument("--fen", default="r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--backend", choices=sorted(backends), default="list")
+    args = parser.parse_args(argv)
+    return 0 if scalingBenchmark(newGameState(args.fen, args.backend), args.depth, args.workers) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Perft (performance test) for the move generator. perft counts every leaf of the legal move tree to a fixed depth,
+and the counts for the standard test positions are published, so any move generator bug shows up as a wrong count.
+The same positions are run on every GameState backend so a faster backend can be checked against the known counts.
+Run from the project root, for example:
+    python -m Chess.ChessPerft --depth 3
+    python -m Chess.ChessPerft --backend bitboard --position kiwipete --depth 4 --phases
+    python -m Chess.ChessPerft --fen "8/8/8/8/8/8/8/R3K2k w Q - 0 1" --depth 3 --divide
+    python -m Chess.ChessPerft --position startpos --depth 5 --bulk --workers 8 --split 2
+    python -m Chess.ChessPerft --repetitions
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from Chess.ChessEngine import GameState, moveFromPacked
+from Chess.ChessBitboard import BitboardGameState
+
+backends = {'list': GameState, 'bitboard': BitboardGameState}
+
+#  (name, FEN, leaf counts for depth 1, 2, 3, ...) from the chessprogramming wiki perft results and the
+#  en passant / castling / promotion torture positions collected on TalkChess
+perftPositions = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", (20, 400, 8902, 197281, 4865609)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", (48, 2039, 97862, 4085603)),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238, 674624)),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", (6, 264, 9467, 422333)),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", (44, 1486, 62379, 2103487)),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", (46, 2079, 89890, 3894594)),
+    ("illegal-ep-1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", (18, 92, 1670, 10138, 185429, 1134888)),
+    ("illegal-ep-2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", (13, 102, 1266, 10276, 135655, 1015133)),
+    ("ep-gives-check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", (15, 126, 1928, 13931, 206379, 1440467)),
+    ("short-castle-check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", (15, 66, 1198, 6399, 120330, 661072)),
+    ("long-castle-check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", (16, 71, 1286, 7418, 141077, 803711)),
+    ("castle-rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", (26, 1141, 27826, 1274206)),
+    ("castle-prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", (44, 1494, 50509, 1720476)),
+    ("promote-out-of-check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", (11, 133, 1442, 19174, 266199, 3821001)),
+    ("discovered-check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", (29, 165, 5160, 31961, 1004658)),
+    ("promote-gives-check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", (9, 40, 472, 2661, 38983, 217342)),
+    ("underpromote-check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", (6, 27, 273, 1329, 18135, 92683)),
+    ("self-stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", (2, 6, 13, 63, 382, 2217)),
+    ("stalemate-checkmate-1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", (10, 25, 268, 926, 10857, 43261, 567584)),
+    ("stalemate-checkmate-2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", (37, 183, 6559, 23527)),
+]
+
+#  (name, FEN, moves in coordinate notation, how often the position after them has been reached) for --repetitions
+repetitionLines = [
+    ("knight-shuffle", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     "g1f3 g8f6 f3g1 f6g8 g1f3 g8f6 f3g1 f6g8", 3),
+    #  no black pawn can take e4 en passant, so the position after 1.e4 is the one reached after 3.Ng1 and 5.Ng1
+    ("shuffle-after-e4", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     "e2e4 g8f6 g1f3 f6g8 f3g1 g8f6 g1f3 f6g8 f3g1", 3),
+    #  here d4 could take e4 en passant the first time, so that position is a different one
+    ("shuffle-after-ep-chance", "1n2k3/8/8/8/3p4/8/4P3/4K1N1 w - - 0 1",
+     "e2e4 b8c6 g1f3 c6b8 f3g1 b8c6 g1f3 c6b8 f3g1", 2),
+]
+
+
+'''
+Create a game state on the named backend set up at the given FEN
+'''
+def newGameState(fen, backend='list'):
+    return backends[backend].fromFEN(fen)
+
+
+'''
+Count the leaf nodes of the legal move tree depth plies deep. One move list is reused per ply. With bulk the moves
+one ply from the leaves are counted instead of made, which gives the same count without the last make/undo; leave
+it off to exercise makeMove and undoMove on every leaf.
+'''
+def perft(gameState, depth, bulk=False):
+    return perftNodes(gameState, depth, [[] for _ in range(depth + 1)], bulk)
+
+
+def perftNodes(gameState, depth, buffers, bulk):
+    if depth == 0:
+        return 1
+    moves = gameState.getValidMoves(buffers[depth])
+    if bulk and depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gameState.makeMove(move)
+        nodes += perftNodes(gameState, depth - 1, buffers, bulk)
+        gameState.undoMove()
+    return nodes
+
+
+'''
+perft that also adds the time spent in getValidMoves, makeMove and undoMove to timings under 'movegen', 'make'
+and 'undo'. The timer calls cost about as much as the work they measure, so use plain perft for nodes per second.
+'''
+def perftTimed(gameState, depth, timings):
+    for phase in ('movegen', 'make', 'undo'):
+        timings.setdefault(phase, 0.0)
+    return perftTimedNodes(gameState, depth, timings, [[] for _ in range(depth + 1)])
+
+
+def perftTimedNodes(gameState, depth, timings, buffers):
+    if depth == 0:
+        return 1
+    clock = time.perf_counter
+    start = clock()
+    moves = gameState.getValidMoves(buffers[depth])
+    timings['movegen'] += clock() - start
+    nodes = 0
+    for move in moves:
+        start = clock()
+        gameState.makeMove(move)
+        timings['make'] += clock() - start
+        nodes += perftTimedNodes(gameState, depth - 1, timings, buffers)
+        start = clock()
+        gameState.undoMove()
+        timings['undo'] += clock() - start
+    return nodes
+
+
+'''
+perft split by root move: returns {move notation: leaf count below that move}. Comparing this against another
+engine's divide output narrows a wrong count down to the move that causes it.
+'''
+def divide(gameState, depth, bulk=False):
+    counts = {}
+    for move in gameState.getValidMoves():
+        gameState.makeMove(move)
+        counts[move.getChessNotation()] = perft(gameState, depth - 1, bulk) if depth > 1 else 1
+        gameState.undoMove()
+    return counts
+
+
+'''
+Every line of play splitDepth plies long from the current position, as tuples of Move.packed codes
+'''
+def splitPaths(gameState, splitDepth):
+    paths = []
+
+    def walk(depth, path):
+        if depth == 0:
+            paths.append(tuple(path))
+            return
+        for move in list(gameState.getValidMoves()):
+            gameState.makeMove(move)
+            path.append(move.packed)
+            walk(depth - 1, path)
+            path.pop()
+            gameState.undoMove()
+    walk(splitDepth, [])
+    return paths
+
+
+'''
+Worker task for parallelPerft: play path from gameState and count below it. Returns the count, the seconds it took
+and the worker's process id.
+'''
+def perftTask(gameState, path, depth, bulk):
+    for packed in path:
+        gameState.makeMove(moveFromPacked(gameState.board, packed))
+    start = time.perf_counter()
+    nodes = perft(gameState, depth, bulk)
+    return nodes, time.perf_counter() - start, os.getpid()
+
+
+'''
+perft split across the processes of executor: every line splitDepth plies long becomes a task that counts the
+remaining depth, and the counts are added up. Returns the count and {process id: [tasks, nodes, busy seconds]}.
+'''
+def parallelPerft(gameState, depth, executor, splitDepth=1, bulk=False):
+    splitDepth = max(0, min(splitDepth, depth - 1))
+    paths = splitPaths(gameState, splitDepth)  # all of them before submitting, the tasks are pickled from gameState
+    futures = [executor.submit(perftTask, gameState, path, depth - splitDepth, bulk) for path in paths]
+    nodes = 0
+    workers = {}
+    for future in futures:
+        taskNodes, seconds, pid = future.result()
+        nodes += taskNodes
+        worker = workers.setdefault(pid, [0, 0, 0.0])
+        worker[0] += 1
+        worker[1] += taskNodes
+        worker[2] += seconds
+    return nodes, workers
+
+
+'''
+Run perft on each position and backend at the given depth (capped at the deepest published count for the
+position) and print one line per run. Returns True if every count matched. Given an executor, each perft is split
+across its processes at splitDepth, with a line per worker process.
+'''
+def runSuite(positions, backendNames, depth, phases=False, out=sys.stdout, bulk=False, executor=None, splitDepth=1):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, counts in positions:
+        runDepth = min(depth, len(counts)) if counts else depth
+        expected = counts[runDepth - 1] if counts else None
+        for backend in backendNames:
+            gameState = newGameState(fen, backend)
+            start = time.perf_counter()
+            workers = None
+            if executor is None:
+                nodes = perft(gameState, runDepth, bulk)
+            else:
+                nodes, workers = parallelPerft(gameState, runDepth, executor, splitDepth, bulk)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            if expected is None:
+                status = "----"
+            elif nodes == expected:
+                status = "ok"
+            else:
+                status = "FAIL (expected %d)" % expected
+                allPassed = False
+            line = "%-22s %-9s depth %d %10d nodes %8.2fs %9.0f nps  %s" % (
+                name, backend, runDepth, nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0, status)
+            if phases:
+                timings = {}
+                perftTimed(newGameState(fen, backend), runDepth, timings)
+                phaseTotal = sum(timings.values()) or 1.0
+                line += "  [" + ", ".join("%s %.0f%%" % (phase, 100 * t / phaseTotal) for phase, t in timings.items()) + "]"
+            print(line, file=out)
+            if workers:
+                for pid, (tasks, workerNodes, seconds) in sorted(workers.items()):
+                    print("    worker %-7d %5d tasks %10d nodes %8.2fs busy %9.0f nps" % (
+                        pid, tasks, workerNodes, seconds, workerNodes / seconds if seconds > 0 else 0.0), file=out)
+    print("total %d nodes in %.2fs, %.0f nps" % (totalNodes, totalTime, totalNodes / totalTime if totalTime > 0 else 0.0),
+          file=out)
+    return allPassed
+
+
+'''
+Play every line of repetitionLines on each backend, checking the incremental Zobrist key against computeHash after
+every move, then how often the final position has been reached and the repetition draw flag. Returns True if all
+lines passed.
+'''
+def checkRepetitions(backendNames, out=sys.stdout):
+    allPassed = True
+    for name, fen, line, expected in repetitionLines:
+        for backend in backendNames:
+            gameState = newGameState(fen, backend)
+            problem = None
+            for notation in line.split():
+                moves = [move for move in gameState.getValidMoves() if move.getChessNotation() == notation]
+                if not moves:
+                    problem = "FAIL (%s is not legal)" % notation
+                    break
+                gameState.makeMove(moves[0])
+                if gameState.hash != gameState.computeHash():
+                    problem = "FAIL (key after %s differs from computeHash)" % notation
+                    break
+            count = gameState.repetitionCount()
+            gameState.getValidMoves()
+            if problem is None and (count != expected or gameState.repetitionDraw != (expected >= 3)):
+                problem = "FAIL (expected %d, repetitionDraw %s)" % (expected, gameState.repetitionDraw)
+            allPassed = allPassed and problem is None
+            print("%-24s %-9s reached %d times  %s" % (name, backend, count, problem or "ok"), file=out)
+    return allPassed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft correctness and speed suite for the move generator")
+    parser.add_argument("--depth", type=int, default=3, help="search depth, capped per position at its deepest known count")
+    parser.add_argument("--backend", choices=sorted(backends) + ["all"], default="all")
+    parser.add_argument("--position", action="append", help="run only these named positions (repeatable)")
+    parser.add_argument("--fen", help="run a single FEN instead of the standard positions")
+    parser.add_argument("--divide", action="store_true", help="with --fen, print the count below every root move")
+    parser.add_argument("--phases", action="store_true", help="also time move generation, make and undo separately")
+    parser.add_argument("--bulk", action="store_true", help="count the last ply's moves instead of making them")
+    parser.add_argument("--workers", type=int, help="split each perft across this many processes")
+    parser.add_argument("--split", type=int, default=1, help="with --workers, plies played out before splitting")
+    parser.add_argument("--repetitions", action="store_true", help="check repetition counting and the Zobrist keys instead")
+    args = parser.parse_args(argv)
+
+    backendNames = sorted(backends) if args.backend == "all" else [args.backend]
+    if args.repetitions:
+        return 0 if checkRepetitions(backendNames) else 1
+    if args.fen:
+        if args.divide:
+            for backend in backendNames:
+                counts = divide(newGameState(args.fen, backend), args.depth, args.bulk)
+                for notation in sorted(counts):
+                    print("%s: %d" % (notation, counts[notation]))
+                print("%s: %d moves, %d nodes" % (backend, len(counts), sum(counts.values())))
+            return 0
+        positions = [("fen", args.fen, ())]
+    else:
+        positions = perftPositions
+        if args.position:
+            unknown = set(args.position) - {name for name, _, _ in perftPositions}
+            if unknown:
+                parser.error("unknown position(s): " + ", ".join(sorted(unknown)))
+            positions = [p for p in perftPositions if p[0] in args.position]
+    if args.workers is None:
+        return 0 if runSuite(positions, backendNames, args.depth, args.phases, bulk=args.bulk) else 1
+    with ProcessPoolExecutor(args.workers) as executor:
+        return 0 if runSuite(positions, backendNames, args.depth, args.phases, bulk=args.bulk, executor=executor,
+                             splitDepth=args.split) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""
+Search for the best move in a game state: negamax alpha-beta with iterative deepening, a quiescence search over
+captures and promotions, a transposition table, and move ordering by hash move, principal variation, MVV-LVA,
+killer moves and the history heuristic. Given a Tablebase (ChessTablebase), positions with few enough pieces are
+scored from it instead of being searched, and a root in the tables is played straight from them.
+The search runs on the game state it is given through makeMove/undoMove and the staged move generators (generateMoves,
+getNoisyMoves) and leaves it as it found it.
+Run from the project root, for example:
+    python -m Chess.ChessSearch --depth 5
+    python -m Chess.ChessSearch --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --time 5
+"""
+import argparse
+import sys
+import time
+from Chess.ChessEvaluation import evaluate
+from Chess.ChessTransposition import TranspositionTable, boundExact, boundLower, boundUpper
+
+pieceValues = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+mateScore = 100000  # score of mating on the move, a mate n plies away scores mateScore - n
+infinity = 1000000
+maxDepth = 64
+limitCheckInterval = 1024  # nodes between looks at the clock and the node budget
+
+
+'''
+Material balance in centipawns from the point of view of the side to move. Searching with this instead of the
+default evaluate sees nothing but material.
+'''
+def materialScore(gameState):
+    score = 0
+    for row in gameState.board:
+        for piece in row:
+            if piece != '--':
+                if piece[0] == 'w':
+                    score += pieceValues[piece[1]]
+                else:
+                    score -= pieceValues[piece[1]]
+    return score if gameState.whiteToMove else -score
+
+
+'''
+True if score means one side can force mate
+'''
+def isMateScore(score):
+    return abs(score) >= mateScore - 1000
+
+
+class SearchResult():
+    def __init__(self):
+        self.bestMove = None
+        self.score = 0
+        self.depth = 0  # deepest fully searched iteration
+        self.pv = []  # principal variation, starting with bestMove
+        self.nodes = 0  # nodes visited, including quiescence nodes
+        self.quiescenceNodes = 0
+        self.seconds = 0.0
+        self.iterations = []  # (depth, score, nodes, seconds, pv) once each iteration completes
+
+    @property
+    def nodesPerSecond(self):
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+
+class Searcher():
+    def __init__(self, gameState, evaluate=evaluate, hashSizeMB=16, transpositionTable=None, tablebase=None):
+        self.gameState = gameState
+        self.evaluate = evaluate
+        self.tablebase = tablebase
+        self.pieceCount = 0  # pieces on the board, kept up to date by negamax while there is a tablebase
+        #  kept between searches, several searchers can share one table
+        self.transpositionTable = transpositionTable if transpositionTable is not None else TranspositionTable(hashSizeMB)
+        self.killers = [[None, None] for _ in range(maxDepth + 1)]  # two quiet moves per ply that caused a cutoff
+        self.history = [[0] * 4096, [0] * 4096]  # per side, indexed by from/to squares, bumped on quiet cutoffs
+        self.moveBuffers = []  # one reusable move list per ply
+        self.pvTable = [[] for _ in range(maxDepth + 2)]
+        self.previousPV = []
+        #  called with the budget checks, every limitCheckInterval nodes after the first iteration; returning True
+        #  stops the search as if the budget ran out. Lets another thread or process stop or extend a search.
+        self.stopCheck = None
+        self.resetCounters()
+
+    def resetCounters(self):
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0  # cutoffs on the first move searched, a measure of move ordering quality
+        self.stopped = False
+
+    '''
+    Search the current position with iterative deepening until maxDepth is done or the time (seconds) or node budget
+    runs out. Each completed iteration is passed to callback, if given, as the SearchResult so far. The result
+    of an iteration cut short by the budget is thrown away, except that depth 1 always completes. rootMoves, a
+    collection of Move.packed codes, limits the search to those moves from the current position, and rootAlpha
+    only looks for moves that score above it; if none does, the score is an upper bound and there is no best move.
+    A caller that already has the shallower iterations can start at startDepth, with previousPV (moves from the
+    current position) to search first; the budget then applies from the first iteration.
+    '''
+    def search(self, depth=maxDepth, timeLimit=None, nodeLimit=None, callback=None, rootMoves=None, rootAlpha=-infinity,
+               startDepth=1, previousPV=None):
+        gameState = self.gameState
+        flags = gameState.checkMate, gameState.staleMate, gameState.fiftyMoveDraw, gameState.repetitionDraw
+        self.resetCounters()
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.rootMoves = rootMoves
+        self.limitsActive = startDepth > 1  # the first iteration always finishes so there is a move to return
+        self.previousPV = list(previousPV) if previousPV else []
+        self.transpositionTable.newSearch()
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+        result = SearchResult()
+        hasMoves = gameState.hasLegalMove()
+        if self.tablebase is not None:
+            self.pieceCount = sum(piece != '--' for row in gameState.board for piece in row)
+            if hasMoves and rootMoves is None and rootAlpha == -infinity and self.tablebaseRoot(result, callback):
+                depth = 0
+        for iterationDepth in range(startDepth, min(depth, maxDepth) + 1):
+            score = self.negamax(iterationDepth, 0, rootAlpha, infinity)
+            if self.stopped:
+                break
+            result.depth = iterationDepth
+            result.score = score
+            result.pv = list(self.pvTable[0])
+            result.bestMove = result.pv[0] if result.pv else None
+            result.nodes = self.nodes
+            result.quiescenceNodes = self.quiescenceNodes
+            result.seconds = time.perf_counter() - self.startTime
+            result.iterations.append((iterationDepth, score, self.nodes, result.seconds, result.pv))
+            if result.pv:  # a root that failed low keeps the ordering from the last iteration
+                self.previousPV = result.pv
+            self.limitsActive = True
+            if callback is not None:
+                callback(result)
+            if not hasMoves or isMateScore(score) or self.outOfBudget():
+                break
+        result.nodes = self.nodes
+        result.quiescenceNodes = self.quiescenceNodes
+        result.seconds = time.perf_counter() - self.startTime
+        gameState.checkMate, gameState.staleMate, gameState.fiftyMoveDraw, gameState.repetitionDraw = flags
+        return result
+
+    '''
+    Fill result with the best line from the tablebase and pass it to callback, if the root is in the tables
+    '''
+    def tablebaseRoot(self, result, callback):
+        gameState = self.gameState
+        probe = self.tablebase.probe(gameState)
+        if probe is None:
+            return False
+        wdl, plies = probe
+        result.pv = self.tablebase.principalVariation(gameState, max(plies, 1))
+        if not result.pv:
+            return False
+        result.bestMove = result.pv[0]
+        result.score = wdl * (mateScore - plies)
+        result.depth = max(plies, 1)
+        result.seconds = time.perf_counter() - self.startTime
+        result.iterations.append((result.depth, result.score, 0, result.seconds, result.pv))
+        if callback is not None:
+            callback(result)
+        return True
+
+    def outOfBudget(self):
+        if self.stopCheck is not None and self.stopCheck():
+            return True
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            return True
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def getMoveBuffer(self, ply):
+        while len(self.moveBuffers) <= ply:
+            self.moveBuffers.append([])
+        return self.moveBuffers[ply]
+
+    '''
+    Score of the position for the side to move, searched depth plies deep (plus captures) within the alpha-beta
+    window. Fills pvTable[ply] with the best line found from here.
+    '''
+    def negamax(self, depth, ply, alpha, beta):
+        self.nodes += 1
+        if self.limitsActive and self.nodes % limitCheckInterval == 0 and self.outOfBudget():
+            self.stopped = True
+        if self.stopped:
+            return 0
+        gameState = self.gameState
+        self.pvTable[ply] = []
+        #  a position repeated once inside the search is scored as a draw, as the side that can repeat it can do so
+        #  again; the root is searched anyway so there is a move to play
+        if ply > 0 and gameState.isRepetition():
+            return 0
+        inCheck = gameState.inCheck()
+        #  a mate on the hundredth ply still stands, so a position in check needs a legal move to be a draw
+        if ply > 0 and gameState.halfmoveClock >= 100 and (not inCheck or gameState.hasLegalMove()):
+            return 0
+        if ply > 0 and self.tablebase is not None and self.pieceCount <= self.tablebase.maxPieces:
+            probe = self.tablebase.probe(gameState)
+            if probe is not None:  # a mate plies away from here, or a draw with wdl 0
+                return probe[0] * (mateScore - ply - probe[1])
+        if inCheck and ply < maxDepth:  # check extension, so a check at the horizon is never stood on
+            depth += 1
+        if depth <= 0 or ply >= maxDepth:
+            self.nodes -= 1  # counted again by quiescence
+            return self.quiescence(ply, alpha, beta)
+
+        hashMove = 0
+        entry = self.transpositionTable.probe(gameState.hash)
+        if entry is not None:
+            hashMove, entryDepth, bound, score = entry
+            if ply > 0 and entryDepth >= depth:  # the root always searches so it has a full principal variation
+                score = scoreFromTable(score, ply)
+                if bound == boundExact or (bound == boundLower and score >= beta) or (bound == boundUpper and score <= alpha):
+                    return score
+
+        #  moves come in stages (hash and PV moves, captures, quiet moves) so a cutoff saves generating the rest
+        pvMove = self.previousPV[ply] if ply < len(self.previousPV) else None
+        moves = gameState.generateMoves((hashMove, pvMove.packed if pvMove is not None else 0), captureOrder,
+                                        self.quietOrder(ply))
+        legalMoves = 0
+        i = -1  # moves searched, less one
+        originalAlpha = alpha
+        bestScore = -infinity
+        bestMove = None
+        for move in moves:
+            legalMoves += 1
+            if ply == 0 and self.rootMoves is not None and move.packed not in self.rootMoves:
+                continue
+            i += 1
+            captured = move.pieceCaptured != '--'
+            self.pieceCount -= captured
+            gameState.makeMove(move)
+            score = -self.negamax(depth - 1, ply + 1, -beta, -alpha)
+            gameState.undoMove()
+            self.pieceCount += captured
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    bestMove = move
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                    if score >= beta:
+                        self.betaCutoffs += 1
+                        if i == 0:
+                            self.firstMoveCutoffs += 1
+                        if move.pieceCaptured == '--' and not move.isPawnPromotion:
+                            self.storeQuietCutoff(move, ply, depth)
+                        break
+        if legalMoves == 0:
+            return -mateScore + ply if inCheck else 0
+        if bestScore >= beta:
+            bound = boundLower
+        elif bestScore > originalAlpha:
+            bound = boundExact
+        else:
+            bound = boundUpper
+        if ply > 0 or self.rootMoves is None:  # a root limited to some moves has not scored the position
+            self.transpositionTable.store(gameState.hash, bestMove.packed if bestMove is not None else 0, depth, bound,
+                                          scoreToTable(bestScore, ply))
+        return bestScore
+
+    '''
+    Search only captures and promotions until the position is quiet, so the evaluation is never taken in the middle
+    of an exchange. The side to move may stand pat on the static evaluation unless it is in check, in which case
+    every evasion is searched.
+    '''
+    def quiescence(self, ply, alpha, beta):
+        self.nodes += 1
+        self.quiescenceNodes += 1
+        if self.limitsActive and self.nodes % limitCheckInterval == 0 and self.outOfBudget():
+            self.stopped = True
+        if self.stopped:
+            return 0
+        gameState = self.gameState
+        if gameState.inCheck():
+            moves = gameState.getValidMoves(self.getMoveBuffer(ply))
+            if len(moves) == 0:
+                return -mateScore + ply
+            bestScore = -infinity
+            self.orderMoves(moves, ply, 0)
+        else:
+            moves = gameState.getNoisyMoves(self.getMoveBuffer(ply))  # quiet moves are only needed to rule out stalemate
+            if len(moves) == 0 and not gameState.hasLegalMove():
+                return 0
+            bestScore = self.evaluate(gameState)
+            if bestScore >= beta:
+                return bestScore
+            if bestScore > alpha:
+                alpha = bestScore
+            moves.sort(key=captureOrder, reverse=True)
+        for move in moves:
+            gameState.makeMove(move)
+            score = -self.quiescence(ply + 1, -beta, -alpha)
+            gameState.undoMove()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return bestScore
+
+    '''
+    Sort moves best first: the best move stored in the transposition table (hashMove, a Move.packed code), the move
+    from the previous iteration's principal variation, then captures and promotions by MVV-LVA, then the killer
+    moves for this ply, then quiet moves by history score
+    '''
+    def orderMoves(self, moves, ply, hashMove):
+        pvMove = self.previousPV[ply] if ply < len(self.previousPV) else None
+        killer1, killer2 = self.killers[ply] if ply <= maxDepth else (None, None)
+        history = self.history[0 if self.gameState.whiteToMove else 1]
+
+        def moveOrder(move):
+            if move.packed == hashMove:
+                return 4000000
+            if move == pvMove:
+                return 3000000
+            if move.pieceCaptured != '--' or move.isPawnPromotion:
+                return 2000000 + captureOrder(move)
+            if move == killer1:
+                return 1000001
+            if move == killer2:
+                return 1000000
+            return history[move.packed & 4095]
+        moves.sort(key=moveOrder, reverse=True)
+
+    '''
+    The order of the quiet moves at ply for generateMoves: the killer moves, then the rest by history score
+    '''
+    def quietOrder(self, ply):
+        killer1, killer2 = self.killers[ply] if ply <= maxDepth else (None, None)
+        history = self.history[0 if self.gameState.whiteToMove else 1]
+
+        def moveOrder(move):
+            if move == killer1:
+                return 1000001
+            if move == killer2:
+                return 1000000
+            return history[move.packed & 4095]
+        return moveOrder
+
+    '''
+    Remember a quiet move that caused a beta cutoff as a killer for this ply and credit it in the history table
+    '''
+    def storeQuietCutoff(self, move, ply, depth):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self.history[0 if self.gameState.whiteToMove else 1]
+        history[move.packed & 4095] += depth * depth
+        if history[move.packed & 4095] > 900000:  # keep history below the killer and capture scores
+            for i in range(4096):
+                history[i] //= 2
+
+
+'''
+MVV-LVA: most valuable victim first, least valuable attacker breaking ties. Promotions count the promoted piece.
+'''
+def captureOrder(move):
+    score = pieceValues[move.pieceCaptured[1]] * 10 if move.pieceCaptured != '--' else 0
+    if move.isPawnPromotion:
+        score += pieceValues[move.promotionChoice] * 10
+    return score - pieceValues[move.pieceMoved[1]] // 10
+
+
+'''
+Mate scores count plies from the root. The table stores them counted from the position instead, so an entry is
+right wherever in the tree the position comes up again.
+'''
+def scoreToTable(score, ply):
+    if isMateScore(score):
+        return score + ply if score > 0 else score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if isMateScore(score):
+        return score - ply if score > 0 else score + ply
+    return score
+
+
+'''
+Search gameState and return the SearchResult, for callers that do not need to keep the searcher's history
+'''
+def findBestMove(gameState, depth=maxDepth, timeLimit=None, nodeLimit=None, evaluate=evaluate, hashSizeMB=16):
+    return Searcher(gameState, evaluate, hashSizeMB).search(depth, timeLimit, nodeLimit)
+
+
+def formatScore(score):
+    if isMateScore(score):
+        plies = mateScore - abs(score)
+        return "mate %d" % ((plies + 1) // 2 if score > 0 else -((plies + 1) // 2))
+    return "cp %d" % score
+
+
+def main(argv=None):
+    from Chess.ChessPerft import backends, newGameState
+    parser = argparse.ArgumentParser(description="Search a position for the best move")
+    parser.add_argument("--fen", default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    parser.add_argument("--depth", type=int, default=maxDepth)
+    parser.add_argument("--time", type=float, help="seconds to search")
+    parser.add_argument("--nodes", type=int, help="node budget")
+    parser.add_argument("--backend", choices=sorted(backends), default="list")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    parser.add_argument("--tablebase", help="directory of endgame tables (ChessTablebase)")
+    args = parser.parse_args(argv)
+    if args.depth == maxDepth and args.time is None and args.nodes is None:
+        args.time = 5.0
+
+    def report(result):
+        print("depth %d score %s nodes %d time %.2fs nps %.0f pv %s" % (
+            result.depth, formatScore(result.score), result.nodes, result.seconds, result.nodesPerSecond,
+            " ".join(move.getChessNotation() for move in result.pv)))
+    tablebase = None
+    if args.tablebase is not None:
+        from Chess.ChessTablebase import Tablebase
+        tablebase = Tablebase(args.tablebase)
+    searcher = Searcher(newGameState(args.fen, args.backend), hashSizeMB=args.hash, tablebase=tablebase)
+    result = searcher.search(args.depth, args.time, args.nodes, report)
+    print("bestmove %s  (%d nodes, %d quiescence, %.0f nps, %.0f%% of cutoffs on the first move)" % (
+        result.bestMove.getChessNotation() if result.bestMove else "none", result.nodes, result.quiescenceNodes,
+        result.nodesPerSecond, 100.0 * searcher.firstMoveCutoffs / max(searcher.betaCutoffs, 1)))
+    stats = searcher.transpositionTable.stats()
+    print("hash %.1f MB, %d probes, %.0f%% hits, %d stores, %d collisions, %.0f%% full" % (
+        stats['sizeBytes'] / 1048576, stats['probes'], 100 * stats['hitRate'], stats['stores'], stats['collisions'],
+        100 * stats['fill']))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,879 @@
+"""
+Endgame tablebases for positions with at most four pieces, kings included, made by retrograde analysis. A table
+covers one material set, named by the pieces of each side with the stronger side first, such as KQK, KPK or KRKN; it
+holds every position of that material with no castling rights and no en passant square, indexed with the board's
+symmetries so that each position is stored once: the first king is kept in the a1-d1-d4 triangle, or on files a to
+d once there are pawns. The index of a position is a few multiplications, so a probe is one read from a memory
+mapped file. Material with pawns on both sides, KPKP, has no table: generation makes no en passant captures.
+Two files are written for each table:
+    name.dtm    one byte per position: 0 draw, n from 1 to 127 the side to move mates in n plies, 128 + n it is
+                mated in n plies, 255 not a legal position
+    name.wdl    two bits per position, win, draw or loss for the side to move, for callers that need no distance
+Generation starts from the mates and the positions whose captures and promotions lead into smaller tables, then
+works back through the moves that lead into positions already solved, one ply at a time. The work on each position,
+finding its moves or the moves that lead to it, is shared out in chunks over a process pool. Tables for the material
+a capture or promotion leads to are generated first.
+Run from the project root, for example:
+    python -m Chess.ChessTablebase generate KQK KRK KPK --dir tables --workers 4
+    python -m Chess.ChessTablebase probe --dir tables --fen "8/8/8/4k3/8/8/8/KQ6 w - - 0 1"
+    python -m Chess.ChessTablebase bench --dir tables
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from Chess.ChessEngine import GameState, rayDirections, knightDirections, kingDirections, sliderRays
+
+maxPieces = 4
+pieceOrder = 'KQRBNP'  # the order of a side's pieces in a table name and in its index
+pieceRanks = {kind: i for i, kind in enumerate(pieceOrder)}
+deadMaterial = ('KK', 'KBK', 'KNK')  # no mate is possible, every position is a draw and has no table
+
+#  the values of a dtm table. While a table is generated drawValue also stands for not solved yet.
+drawValue = 0
+lossBase = 128
+illegalValue = 255
+maxPlies = 126
+
+#  the values of a wdl table, and what probe returns for the side to move
+wdlWin, wdlDraw, wdlLoss = 1, 0, -1
+wdlCodes = {wdlDraw: 0, wdlWin: 1, wdlLoss: 2}
+wdlIllegal = 3
+
+#  the header of both kinds of file: magic, format version, kind of table, unused, number of positions
+headerStruct = struct.Struct('<4sBBHQ')
+magic = b'EMTB'
+formatVersion = 1
+dtmKind, wdlKind = 0, 1
+
+#  flags the first pass of generation keeps for each position
+illegalFlag = 1
+matedFlag = 2  # no legal move and in check: mated now
+noLossFlag = 4  # has a move that draws or wins, so it can never be lost
+
+firstPassChunk = 8192  # positions per task of the first pass
+predecessorChunk = 2048  # solved positions per task when looking for the moves into them
+
+
+'''
+The squares of a board as 0-63 (row * 8 + col, as in Move), and what a piece on each one reaches
+'''
+def squareTargets(directions):
+    return [tuple((r + dr) * 8 + c + dc for dr, dc in directions if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+            for r in range(8) for c in range(8)]
+
+
+def squareMask(squares):
+    mask = 0
+    for sq in squares:
+        mask |= 1 << sq
+    return mask
+
+
+knightTargets = squareTargets(knightDirections)
+kingTargets = squareTargets(kingDirections)
+knightMasks = [squareMask(targets) for targets in knightTargets]
+kingMasks = [squareMask(targets) for targets in kingTargets]
+#  per color (0 white, 1 black) and square, the squares a pawn there captures on
+pawnCaptureTargets = (squareTargets(((-1, -1), (-1, 1))), squareTargets(((1, -1), (1, 1))))
+pawnAttackMasks = tuple([squareMask(targets) for targets in side] for side in pawnCaptureTargets)
+#  per square, the squares along each of rayDirections
+rays = [[tuple((r + dr * i) * 8 + c + dc * i for i in range(1, 8) if 0 <= r + dr * i < 8 and 0 <= c + dc * i < 8)
+         for dr, dc in rayDirections] for r in range(8) for c in range(8)]
+#  for two squares on a line, the squares between them and whether the line is a rook's ('R') or a bishop's ('B')
+betweenMasks = [[0] * 64 for _ in range(64)]
+lineKinds = [[None] * 64 for _ in range(64)]
+for startSq in range(64):
+    for i, ray in enumerate(rays[startSq]):
+        between = 0
+        for sq in ray:
+            betweenMasks[startSq][sq] = between
+            lineKinds[startSq][sq] = 'R' if i < 4 else 'B'
+            between |= 1 << sq
+
+
+'''
+The board seen through one of its symmetries, as a tuple mapping each square to where it goes
+'''
+def makeTransform(flipRows, flipCols, transpose):
+    transform = []
+    for sq in range(64):
+        r, c = sq >> 3, sq & 7
+        if transpose:
+            r, c = c, r
+        if flipRows:
+            r = 7 - r
+        if flipCols:
+            c = 7 - c
+        transform.append(r * 8 + c)
+    return tuple(transform)
+
+
+allTransforms = [makeTransform(flipRows, flipCols, transpose) for transpose in (False, True)
+                 for flipRows in (False, True) for flipCols in (False, True)]
+pawnTransforms = [makeTransform(False, False, False), makeTransform(False, True, False)]  # pawns only allow a mirror
+flipBoard = makeTransform(True, False, False)  # black's view of the board, for swapping the colors
+
+
+def sideKey(side):
+    return (-len(side), [pieceOrder.index(kind) for kind in side])
+
+
+'''
+The name of the table for white's pieces and black's (strings of piece letters, in any order) and whether the colors
+have to be swapped to look the position up in it, the stronger side always being the first
+'''
+def tableName(white, black):
+    white = ''.join(sorted(white, key=pieceOrder.index))
+    black = ''.join(sorted(black, key=pieceOrder.index))
+    if sideKey(black) < sideKey(white):
+        return black + white, True
+    return white + black, False
+
+
+'''
+True if both sides of the table name have pawns, so that a double push could be taken en passant. The tables hold
+no en passant square and generation makes no en passant captures, so there are no tables for such material.
+'''
+def pawnsOnBothSides(name):
+    split = name.find('K', 1)
+    return 'P' in name[:split] and 'P' in name[split:]
+
+
+'''
+The pieces of a table and the index of its positions. Pieces are listed white king first, then white's other pieces
+in pieceOrder, then black's the same way; a position is the list of their squares and the side to move.
+'''
+class Material():
+    def __init__(self, name):
+        split = name.find('K', 1)
+        if not name.startswith('K') or split < 0 or 'K' in name[split + 1:] or len(name) > maxPieces or \
+                any(kind not in pieceOrder for kind in name):
+            raise ValueError("not a material set of up to %d pieces: %r" % (maxPieces, name))
+        self.name, flipped = tableName(name[:split], name[split:])
+        if pawnsOnBothSides(self.name):
+            raise ValueError("%s has pawns on both sides, which needs en passant; the tables do not support it" % self.name)
+        split = self.name.find('K', 1)
+        self.types = list(self.name)
+        self.colors = [0] * split + [1] * (len(self.name) - split)
+        self.kings = (0, split)
+        self.sidePieces = (range(0, split), range(split, len(self.name)))
+        self.hasPawns = 'P' in self.name
+        self.pawns = [j for j, kind in enumerate(self.types) if kind == 'P']
+        if self.hasPawns:
+            transforms = pawnTransforms
+            self.region = [sq for sq in range(64) if sq & 7 <= 3]
+        else:
+            transforms = allTransforms
+            self.region = [sq for sq in range(64) if 7 - (sq >> 3) <= (sq & 7) <= 3]
+        regionIndex = {sq: i for i, sq in enumerate(self.region)}
+        self.regionIndex = [regionIndex.get(sq, -1) for sq in range(64)]
+        #  the symmetries that bring a first king on each square into the region, two for a king on its diagonal
+        self.kingTransforms = [[t for t in transforms if t[sq] in regionIndex] for sq in range(64)]
+        #  pieces of the same color and kind can swap squares, so their squares are kept in order
+        self.sameRuns = []
+        start = 0
+        for j in range(1, len(self.types) + 1):
+            if j == len(self.types) or (self.types[j], self.colors[j]) != (self.types[start], self.colors[start]):
+                if j - start > 1:
+                    self.sameRuns.append((start, j))
+                start = j
+        self.positionsPerSide = len(self.region) * 64 ** (len(self.types) - 1)
+        self.size = 2 * self.positionsPerSide
+
+    '''
+    The index of a position: the smallest among the positions it maps to under the board's symmetries
+    '''
+    def index(self, squares, whiteToMove):
+        best = -1
+        regionIndex = self.regionIndex
+        for transform in self.kingTransforms[squares[0]]:
+            mapped = [transform[sq] for sq in squares]
+            for start, end in self.sameRuns:
+                mapped[start:end] = sorted(mapped[start:end])
+            index = 0 if whiteToMove else self.positionsPerSide
+            kingIndex = regionIndex[mapped[0]]
+            for sq in mapped[1:]:
+                kingIndex = kingIndex * 64 + sq
+            index += kingIndex
+            if best < 0 or index < best:
+                best = index
+        return best
+
+    '''
+    The squares and side to move of the position at index
+    '''
+    def decode(self, index):
+        whiteToMove = index < self.positionsPerSide
+        if not whiteToMove:
+            index -= self.positionsPerSide
+        squares = [0] * len(self.types)
+        for j in range(len(self.types) - 1, 0, -1):
+            squares[j] = index & 63
+            index >>= 6
+        squares[0] = self.region[index]
+        return squares, whiteToMove
+
+    def occupancy(self, squares):
+        board = [-1] * 64
+        occupied = 0
+        for j, sq in enumerate(squares):
+            board[sq] = j
+            occupied |= 1 << sq
+        return board, occupied
+
+    '''
+    True if color's pieces attack target, with the piece numbered skip (one just taken) left out
+    '''
+    def attacked(self, squares, target, color, occupied, skip=-1):
+        types = self.types
+        for j in self.sidePieces[color]:
+            if j == skip:
+                continue
+            sq = squares[j]
+            kind = types[j]
+            if kind == 'K':
+                if kingMasks[sq] >> target & 1:
+                    return True
+            elif kind == 'N':
+                if knightMasks[sq] >> target & 1:
+                    return True
+            elif kind == 'P':
+                if pawnAttackMasks[color][sq] >> target & 1:
+                    return True
+            else:
+                line = lineKinds[sq][target]
+                if line is not None and (kind == 'Q' or kind == line) and not betweenMasks[sq][target] & occupied:
+                    return True
+        return False
+
+    '''
+    True if the position can be reached in a game: pieces on different squares, no pawn on the first or last rank
+    and the side that just moved not left in check
+    '''
+    def isLegal(self, squares, whiteToMove):
+        if len(set(squares)) != len(squares):
+            return False
+        for j in self.pawns:
+            if squares[j] < 8 or squares[j] >= 56:
+                return False
+        board, occupied = self.occupancy(squares)
+        color = 0 if whiteToMove else 1
+        return not self.attacked(squares, squares[self.kings[1 - color]], color, occupied)
+
+    '''
+    The legal moves of color as (squares after the move, number of the piece taken or -1, kind promoted to or None)
+    '''
+    def successors(self, squares, color):
+        types, colors = self.types, self.colors
+        board, occupied = self.occupancy(squares)
+        enemy = 1 - color
+        king = self.kings[color]
+        moves = []
+        for j in self.sidePieces[color]:
+            sq = squares[j]
+            kind = types[j]
+            if kind == 'P':
+                forward = -8 if color == 0 else 8
+                targets = []
+                if board[sq + forward] < 0:
+                    targets.append(sq + forward)
+                    if (sq >> 3) == (6 if color == 0 else 1) and board[sq + 2 * forward] < 0:
+                        targets.append(sq + 2 * forward)
+                for target in pawnCaptureTargets[color][sq]:
+                    if board[target] >= 0 and colors[board[target]] == enemy:
+                        targets.append(target)
+            elif kind == 'K' or kind == 'N':
+                targets = [target for target in (kingTargets if kind == 'K' else knightTargets)[sq]
+                           if board[target] < 0 or colors[board[target]] == enemy]
+            else:
+                targets = []
+                for i in sliderRays[kind]:
+                    for target in rays[sq][i]:
+                        if board[target] < 0:
+                            targets.append(target)
+                        else:
+                            if colors[board[target]] == enemy:
+                                targets.append(target)
+                            break
+            for target in targets:
+                taken = board[target]
+                after = squares[:]
+                after[j] = target
+                afterOccupied = occupied & ~(1 << sq) | 1 << target
+                if self.attacked(after, after[king], enemy, afterOccupied, taken):
+                    continue
+                if kind == 'P' and (target < 8 or target >= 56):
+                    for promotion in 'QRBN':
+                        moves.append((after, taken, promotion))
+                else:
+                    moves.append((after, taken, None))
+        return moves
+
+    '''
+    The positions, as lists of squares, from which a move of color that takes nothing and promotes nothing leads to
+    squares; color is the side to move in them. Their legality is checked.
+    '''
+    def predecessors(self, squares, color):
+        board, occupied = self.occupancy(squares)
+        types = self.types
+        enemyKing = squares[self.kings[1 - color]]
+        positions = []
+        for j in self.sidePieces[color]:
+            sq = squares[j]
+            kind = types[j]
+            if kind == 'P':
+                back = 8 if color == 0 else -8
+                targets = []
+                origin = sq + back
+                if 8 <= origin < 56 and board[origin] < 0:
+                    targets.append(origin)
+                    if (sq >> 3) == (4 if color == 0 else 3) and board[origin + back] < 0:
+                        targets.append(origin + back)
+            elif kind == 'K' or kind == 'N':
+                targets = [target for target in (kingTargets if kind == 'K' else knightTargets)[sq] if board[target] < 0]
+            else:
+                targets = []
+                for i in sliderRays[kind]:
+                    for target in rays[sq][i]:
+                        if board[target] >= 0:
+                            break
+                        targets.append(target)
+            for target in targets:
+                before = squares[:]
+                before[j] = target
+                beforeOccupied = occupied & ~(1 << sq) | 1 << target
+                if not self.attacked(before, enemyKing, color, beforeOccupied):
+                    positions.append(before)
+        return positions
+
+    '''
+    The pieces left after a move from successors, as (color, kind, square), for looking them up in another table
+    '''
+    def childPieces(self, squares, taken, promotion):
+        pieces = []
+        for j, sq in enumerate(squares):
+            if j != taken:
+                kind = promotion if promotion is not None and self.types[j] == 'P' and (sq < 8 or sq >= 56) else self.types[j]
+                pieces.append((self.colors[j], kind, sq))
+        return pieces
+
+    '''
+    The names of the tables a capture or a promotion can lead to, dead material left out
+    '''
+    def childMaterials(self):
+        names = set()
+        for j, kind in enumerate(self.types):
+            if kind == 'K':
+                continue
+            if kind == 'P':
+                for promotion in 'QRBN':
+                    names.add(self.nameWith(j, promotion))
+            names.add(self.nameWith(j, None))
+        return sorted(name for name in names if name not in deadMaterial)
+
+    def nameWith(self, j, kind):
+        sides = [[], []]
+        for i, own in enumerate(self.types):
+            if i != j:
+                sides[self.colors[i]].append(own)
+            elif kind is not None:
+                sides[self.colors[i]].append(kind)
+        return tableName(sides[0], sides[1])[0]
+
+
+'''
+What a dtm byte means for the side to move: (wdlWin, wdlDraw or wdlLoss, plies to mate or 0), None if illegal
+'''
+def decodeValue(value):
+    if value == drawValue:
+        return wdlDraw, 0
+    if value < lossBase:
+        return wdlWin, value
+    if value == illegalValue:
+        return None
+    return wdlLoss, value - lossBase
+
+
+def tablePath(directory, name, kind):
+    return os.path.join(directory, name + ('.dtm' if kind == dtmKind else '.wdl'))
+
+
+def writeTable(path, kind, data, count):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(headerStruct.pack(magic, formatVersion, kind, 0, count))
+        f.write(data)
+    os.replace(path + '.tmp', path)  # never leave a half written table where a probe could find it
+
+
+'''
+Pack a dtm table into two bits per position
+'''
+def packWDL(values):
+    codes = bytearray(256)
+    for value in range(256):
+        result = decodeValue(value)
+        codes[value] = wdlIllegal if result is None else wdlCodes[result[0]]
+    codes = values.translate(codes)
+    codes.extend(bytes(-len(codes) % 4))
+    packed = bytearray(len(codes) // 4)
+    for i in range(len(packed)):
+        j = 4 * i
+        packed[i] = codes[j] | codes[j + 1] << 2 | codes[j + 2] << 4 | codes[j + 3] << 6
+    return packed
+
+
+'''
+A directory of tables, memory mapped on first use. Probes need no castling rights and no en passant square and at
+most maxPieces pieces; otherwise, or if the table was not generated, they return None.
+'''
+class Tablebase():
+    maxPieces = maxPieces
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}  # (name, kind): (Material, mmap), or None for a table that is not there
+        self.names = {}  # (white's pieces, black's) in board order: tableName for them
+        self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):  # passed to worker processes by its directory, the mappings are made again there
+        return self.directory
+
+    def __setstate__(self, directory):
+        self.__init__(directory)
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+        for f in self.files:
+            f.close()
+        self.tables.clear()
+        self.files = []
+
+    def table(self, name, kind=dtmKind):
+        key = (name, kind)
+        if key not in self.tables:
+            path = tablePath(self.directory, name, kind)
+            if not os.path.exists(path) or pawnsOnBothSides(name):  # any such file was made without en passant
+                self.tables[key] = None
+            else:
+                f = open(path, 'rb')
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                tag, version, fileKind, _, count = headerStruct.unpack_from(data)
+                material = Material(name)
+                if tag != magic or version != formatVersion or fileKind != kind or count != material.size:
+                    data.close()
+                    f.close()
+                    raise ValueError("%s is not a %s table for %s" % (path, 'dtm' if kind == dtmKind else 'wdl', name))
+                self.files.append(f)
+                self.tables[key] = (material, data)
+        return self.tables[key]
+
+    def available(self):
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.dtm') and
+                      not pawnsOnBothSides(name[:-4]))
+
+    '''
+    The name of the table for pieces, given as (color, kind, square), the table and the index of the position in
+    it. Without a table the index is None for dead material and -1 for a table that was not generated.
+    '''
+    def locate(self, pieces, whiteToMove, kind):
+        white = ''.join([piece[1] for piece in pieces if piece[0] == 0])
+        black = ''.join([piece[1] for piece in pieces if piece[0] == 1])
+        named = self.names.get((white, black))
+        if named is None:
+            named = self.names[(white, black)] = tableName(white, black)
+        name, flipped = named
+        if name in deadMaterial:
+            return name, None, None
+        table = self.table(name, kind)
+        if table is None:
+            return name, None, -1
+        if flipped:
+            pieces = [(1 - color, piece, flipBoard[sq]) for color, piece, sq in pieces]
+            whiteToMove = not whiteToMove
+        pieces = sorted(pieces, key=lambda piece: (piece[0], pieceRanks[piece[1]]))
+        return name, table, table[0].index([piece[2] for piece in pieces], whiteToMove)
+
+    '''
+    The dtm byte of the position made of pieces, (color 0 white or 1 black, kind, square) each, or None without a
+    table for it
+    '''
+    def probePieces(self, pieces, whiteToMove):
+        name, table, index = self.locate(pieces, whiteToMove, dtmKind)
+        if table is None:
+            return drawValue if index is None else None
+        return table[1][headerStruct.size + index]
+
+    '''
+    The pieces of gameState as probePieces takes them, or None if the tables cannot hold it: too many pieces, a
+    castling right, or an en passant capture that could be played (the square is set after every double push)
+    '''
+    def gamePieces(self, gameState):
+        rights = gameState.currentCastlingRights
+        if rights.whiteKingSide or rights.whiteQueenSide or rights.blackKingSide or rights.blackQueenSide:
+            return None
+        board = gameState.board
+        pieces = []
+        for r in range(8):
+            row = board[r]
+            if row.count('--') == 8:
+                continue
+            for c in range(8):
+                piece = row[c]
+                if piece != '--':
+                    if len(pieces) == maxPieces:
+                        return None
+                    pieces.append((0 if piece[0] == 'w' else 1, piece[1], r * 8 + c))
+        if gameState.enPassantPossible:
+            r, c = gameState.enPassantPossible
+            pawn = 'wP' if gameState.whiteToMove else 'bP'
+            row = board[r + 1 if gameState.whiteToMove else r - 1]
+            if (c > 0 and row[c - 1] == pawn) or (c < 7 and row[c + 1] == pawn):
+                return None
+        return pieces
+
+    '''
+    (wdlWin, wdlDraw or wdlLoss, plies to mate or 0) for the side to move in gameState, or None if no table covers it
+    '''
+    def probe(self, gameState):
+        pieces = self.gamePieces(gameState)
+        if pieces is None:
+            return None
+        value = self.probePieces(pieces, gameState.whiteToMove)
+        return decodeValue(value) if value is not None else None
+
+    '''
+    wdlWin, wdlDraw or wdlLoss for the side to move in gameState, from the wdl table if it is there, or None
+    '''
+    def probeWDL(self, gameState):
+        pieces = self.gamePieces(gameState)
+        if pieces is None:
+            return None
+        name, table, index = self.locate(pieces, gameState.whiteToMove, wdlKind)
+        if table is None:
+            if index is None:
+                return wdlDraw
+            result = self.probe(gameState)
+            return result[0] if result is not None else None
+        code = table[1][headerStruct.size + (index >> 2)] >> ((index & 3) * 2) & 3
+        return (wdlDraw, wdlWin, wdlLoss, None)[code]
+
+    '''
+    The move that keeps the best result in gameState: the fastest mate when winning, a draw when drawing, the
+    longest defence when losing. None if a position it leads to is not in the tables.
+    '''
+    def bestMove(self, gameState):
+        best = None
+        bestScore = None
+        for move in gameState.getValidMoves():
+            gameState.makeMove(move)
+            result = self.probe(gameState)
+            gameState.undoMove()
+            if result is None:
+                return None
+            wdl, plies = result  # for the opponent
+            score = -wdl * (1000 - plies) if wdl != wdlDraw else 0
+            if bestScore is None or score > bestScore:
+                best, bestScore = move, score
+        return best
+
+    '''
+    The line of best moves from gameState, at most length moves long; gameState is left as it was
+    '''
+    def principalVariation(self, gameState, length=maxPlies):
+        line = []
+        while len(line) < length:
+            move = self.bestMove(gameState)
+            if move is None:
+                break
+            line.append(move)
+            gameState.makeMove(move)
+        for _ in line:
+            gameState.undoMove()
+        return line
+
+
+#  the table a worker process is generating and the tablebase it reads smaller tables from, made by initWorker
+workerMaterial = None
+workerTablebase = None
+
+
+def initWorker(name, directory):
+    global workerMaterial, workerTablebase
+    workerMaterial = Material(name)
+    workerTablebase = Tablebase(directory)
+
+
+'''
+The first pass over the positions from start to end: for each one, flags, the number of different positions its
+moves lead to in the same table, the fastest win it has through a capture or promotion (plies, 0 for none) and the
+longest loss through them
+'''
+def firstPass(start):
+    material, tablebase = workerMaterial, workerTablebase
+    end = min(start + firstPassChunk, material.size)
+    flags = bytearray(end - start)
+    counts = bytearray(end - start)
+    wins = bytearray(end - start)
+    losses = bytearray(end - start)
+    for index in range(start, end):
+        i = index - start
+        squares, whiteToMove = material.decode(index)
+        if not material.isLegal(squares, whiteToMove) or material.index(squares, whiteToMove) != index:
+            flags[i] = illegalFlag
+            continue
+        color = 0 if whiteToMove else 1
+        moves = material.successors(squares, color)
+        if not moves:
+            board, occupied = material.occupancy(squares)
+            inCheck = material.attacked(squares, squares[material.kings[color]], 1 - color, occupied)
+            flags[i] = matedFlag if inCheck else noLossFlag
+            continue
+        children = set()
+        win = loss = 0
+        for after, taken, promotion in moves:
+            if taken < 0 and promotion is None:
+                children.add(material.index(after, not whiteToMove))
+                continue
+            value = tablebase.probePieces(material.childPieces(after, taken, promotion), not whiteToMove)
+            if value is None:
+                raise RuntimeError("%s needs a table that is not there" % material.name)
+            if value == drawValue:
+                flags[i] |= noLossFlag
+            elif value >= lossBase:
+                flags[i] |= noLossFlag
+                if win == 0 or value - lossBase + 1 < win:
+                    win = value - lossBase + 1
+            elif value + 1 > loss:
+                loss = value + 1
+        counts[i] = len(children)
+        wins[i] = win
+        losses[i] = loss
+    return bytes(flags), bytes(counts), bytes(wins), bytes(losses)
+
+
+'''
+For each position in a chunk of solved ones (an array of indices as bytes), the different positions that lead to
+it, all in one array
+'''
+def findPredecessors(data):
+    material = workerMaterial
+    sources = array('L')
+    sources.frombytes(data)
+    found = array('L')
+    for index in sources:
+        squares, whiteToMove = material.decode(index)
+        mover = 1 if whiteToMove else 0
+        found.extend({material.index(before, mover == 0) for before in material.predecessors(squares, mover)})
+    return found.tobytes()
+
+
+def chunks(indices, size):
+    for start in range(0, len(indices), size):
+        yield indices[start:start + size].tobytes()
+
+
+'''
+Solve the table for name by retrograde analysis and write its dtm and wdl files into directory, generating the
+tables it depends on first (unless they are already there). Returns the table's counts of wins, draws and losses.
+'''
+def generateTable(name, directory, workers=None, out=sys.stdout):
+    material = Material(name)
+    os.makedirs(directory, exist_ok=True)
+    for child in material.childMaterials():
+        if not os.path.exists(tablePath(directory, child, dtmKind)):
+            generateTable(child, directory, workers, out)
+    workers = workers if workers is not None else os.cpu_count()
+    startTime = time.perf_counter()
+    if workers <= 1:
+        initWorker(material.name, directory)
+        executor = None
+        mapper = map
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=initWorker, initargs=(material.name, directory))
+        mapper = executor.map
+    try:
+        size = material.size
+        flags, counts, wins, losses = bytearray(), bytearray(), bytearray(), bytearray()
+        for chunkFlags, chunkCounts, chunkWins, chunkLosses in mapper(firstPass, range(0, size, firstPassChunk)):
+            flags += chunkFlags
+            counts += chunkCounts
+            wins += chunkWins
+            losses += chunkLosses
+        values = bytearray(size)
+        #  positions waiting to be solved as a win or a loss, by the number of plies to mate
+        winBuckets = [array('L') for _ in range(maxPlies + 2)]
+        lossBuckets = [array('L') for _ in range(maxPlies + 2)]
+        for index in range(size):
+            flag = flags[index]
+            if flag & illegalFlag:
+                values[index] = illegalValue
+            elif flag & matedFlag:
+                lossBuckets[0].append(index)
+            else:
+                if wins[index]:
+                    winBuckets[wins[index]].append(index)
+                if counts[index] == 0 and not flag & noLossFlag:
+                    lossBuckets[losses[index]].append(index)
+        del wins
+        firstPassSeconds = time.perf_counter() - startTime
+        for plies in range(maxPlies + 1):
+            solvedLosses = array('L')
+            solvedWins = array('L')
+            for index in lossBuckets[plies]:
+                if not values[index]:
+                    values[index] = lossBase + plies
+                    solvedLosses.append(index)
+            for index in winBuckets[plies]:
+                if not values[index]:
+                    values[index] = plies
+                    solvedWins.append(index)
+            lossBuckets[plies] = winBuckets[plies] = None
+            #  a move into a loss wins; once every move leads into a win, the position is lost
+            for data in mapper(findPredecessors, chunks(solvedLosses, predecessorChunk)):
+                found = array('L')
+                found.frombytes(data)
+                for index in found:
+                    if not values[index]:
+                        winBuckets[plies + 1].append(index)
+            for data in mapper(findPredecessors, chunks(solvedWins, predecessorChunk)):
+                found = array('L')
+                found.frombytes(data)
+                for index in found:
+                    if not values[index]:
+                        counts[index] -= 1
+                        if losses[index] < plies + 1:
+                            losses[index] = plies + 1
+                        if counts[index] == 0 and not flags[index] & noLossFlag:
+                            lossBuckets[losses[index]].append(index)
+            if not any(bucket for bucket in winBuckets[plies + 1:] + lossBuckets[plies + 1:]):
+                break
+        else:
+            raise RuntimeError("%s has mates longer than %d plies" % (material.name, maxPlies))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    writeTable(tablePath(directory, material.name, dtmKind), dtmKind, values, size)
+    writeTable(tablePath(directory, material.name, wdlKind), wdlKind, packWDL(values), size)
+    longest = max((value if value < lossBase else value - lossBase for value in set(values) if value != illegalValue),
+                  default=0)
+    totals = {'wins': sum(1 for value in values if 0 < value < lossBase),
+              'losses': sum(1 for value in values if lossBase <= value < illegalValue),
+              'draws': values.count(drawValue), 'illegal': values.count(illegalValue), 'longest': longest}
+    if out is not None:
+        print("%s: %d positions, %d wins, %d draws, %d losses, longest mate %d plies, %.1fs (first pass %.1fs, "
+              "%d workers)" % (material.name, size - totals['illegal'], totals['wins'], totals['draws'], totals['losses'],
+                               longest, time.perf_counter() - startTime, firstPassSeconds, workers), file=out)
+    return totals
+
+
+def describeResult(result):
+    if result is None:
+        return "not in the tables"
+    wdl, plies = result
+    if wdl == wdlDraw:
+        return "draw"
+    return "%s, mate in %d plies" % ("win" if wdl == wdlWin else "loss", plies)
+
+
+'''
+Time probes of random legal positions from every table in tablebase, the part the search pays for
+'''
+def benchmark(tablebase, probes=100000, seed=1, out=sys.stdout):
+    rng = random.Random(seed)
+    names = tablebase.available()
+    states = []
+    for name in names:
+        material, _ = tablebase.table(name)
+        while len(states) < probes * (names.index(name) + 1) // len(names):
+            squares, whiteToMove = material.decode(rng.randrange(material.size))
+            if material.isLegal(squares, whiteToMove):
+                states.append(GameState.fromFEN(positionFEN(material, squares, whiteToMove)))
+    startTime = time.perf_counter()
+    for gameState in states:
+        tablebase.probe(gameState)
+    seconds = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    for gameState in states:
+        tablebase.probeWDL(gameState)
+    wdlSeconds = time.perf_counter() - startTime
+    print("%d probes over %s: %.2f us per dtm probe, %.2f us per wdl probe" % (
+        len(states), " ".join(names), 1e6 * seconds / max(len(states), 1), 1e6 * wdlSeconds / max(len(states), 1)),
+        file=out)
+    return seconds / max(len(states), 1)
+
+
+'''
+The FEN of a position of material
+'''
+def positionFEN(material, squares, whiteToMove):
+    board = [['--'] * 8 for _ in range(8)]
+    for j, sq in enumerate(squares):
+        board[sq >> 3][sq & 7] = 'wb'[material.colors[j]] + material.types[j]
+    rows = []
+    for row in board:
+        text = ''
+        empty = 0
+        for piece in row:
+            if piece == '--':
+                empty += 1
+                continue
+            if empty:
+                text += str(empty)
+                empty = 0
+            text += piece[1] if piece[0] == 'w' else piece[1].lower()
+        rows.append(text + (str(empty) if empty else ''))
+    return "%s %s - - 0 1" % ("/".join(rows), 'w' if whiteToMove else 'b')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="solve tables by retrograde analysis")
+    generate.add_argument("names", nargs="+", help="material sets such as KQK, KPK or KRKN")
+    generate.add_argument("--dir", default="tables")
+    generate.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    generate.add_argument("--force", action="store_true", help="generate tables that are already there again")
+    probe = commands.add_parser("probe", help="look a position up")
+    probe.add_argument("--dir", default="tables")
+    probe.add_argument("--fen", required=True)
+    bench = commands.add_parser("bench", help="time probes")
+    bench.add_argument("--dir", default="tables")
+    bench.add_argument("--probes", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for name in args.names:
+            name = Material(name).name
+            if args.force or not os.path.exists(tablePath(args.dir, name, dtmKind)):
+                generateTable(name, args.dir, args.workers)
+            else:
+                print("%s: already in %s" % (name, args.dir))
+    elif args.command == "probe":
+        gameState = GameState.fromFEN(args.fen)
+        with Tablebase(args.dir) as tablebase:
+            result = tablebase.probe(gameState)
+            print(describeResult(result))
+            if result is not None:
+                print("line: " + " ".join(move.getChessNotation() for move in tablebase.principalVariation(gameState)))
+    else:
+        with Tablebase(args.dir) as tablebase:
+            benchmark(tablebase, args.probes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
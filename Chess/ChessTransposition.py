@@ -0,0 +1,117 @@
+"""
+Fixed size transposition table for the search. Results are stored by Zobrist key (GameState.hash) in two flat
+arrays of 64 bit integers, one for keys and one for packed entries, so the table takes exactly the memory it is
+given and adds no Python objects as it fills. Each bucket holds two entries: a depth-preferred slot that keeps the
+deepest result for the bucket, and an always-replace slot that takes everything else.
+"""
+from array import array
+
+#  bound types, stored as the kind of score the search produced
+boundNone = 0
+boundUpper = 1  # failed low, the score is at most this
+boundLower = 2  # failed high, the score is at least this
+boundExact = 3
+
+#  layout of a packed entry: bits 0-15 move (Move.packed), 16-23 depth, 24-25 bound, 26-31 search generation,
+#  32-52 score + scoreOffset
+scoreOffset = 1 << 20
+entryBytes = 16  # an 8 byte key and an 8 byte entry
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    '''
+    Reallocate the table to use at most sizeMB megabytes, rounded down to a power of two number of buckets.
+    Everything stored is lost.
+    '''
+    def resize(self, sizeMB):
+        buckets = 1
+        while buckets * 4 * entryBytes <= sizeMB * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.keys = array('Q', [0]) * (buckets * 2)
+        self.entries = array('Q', [0]) * (buckets * 2)
+        self.generation = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0  # stores that overwrote a different position
+
+    @property
+    def sizeBytes(self):
+        return len(self.keys) * entryBytes
+
+    def clear(self):
+        for i in range(len(self.keys)):
+            self.keys[i] = 0
+            self.entries[i] = 0
+        self.generation = 0
+        self.resetStats()
+
+    '''
+    Start a new search: entries from earlier searches can be replaced whatever their depth
+    '''
+    def newSearch(self):
+        self.generation = (self.generation + 1) & 63
+
+    '''
+    Look up a position. Returns (move, depth, bound, score) or None. move is the Move.packed code of the best move
+    found, 0 if there was none.
+    '''
+    def probe(self, key):
+        self.probes += 1
+        index = (key & self.mask) << 1
+        keys = self.keys
+        if keys[index] == key:
+            entry = self.entries[index]
+        elif keys[index + 1] == key:
+            entry = self.entries[index + 1]
+        else:
+            return None
+        self.hits += 1
+        return entry & 0xFFFF, (entry >> 16) & 0xFF, (entry >> 24) & 3, (entry >> 32) - scoreOffset
+
+    '''
+    Store a search result. A result deep enough (or stale enough) for the depth-preferred slot takes it, moving
+    the entry it replaces to the always-replace slot; anything else goes in the always-replace slot. A move of 0
+    keeps the move already stored for the position.
+    '''
+    def store(self, key, move, depth, bound, score):
+        self.stores += 1
+        index = (key & self.mask) << 1
+        keys = self.keys
+        entries = self.entries
+        preferred = entries[index]
+        if keys[index] == key:
+            slot = index
+        elif keys[index] == 0 or depth >= (preferred >> 16) & 0xFF or (preferred >> 26) & 63 != self.generation:
+            slot = index
+            if keys[index + 1] != key and keys[index + 1] != 0:
+                self.collisions += 1
+            keys[index + 1] = keys[index]  # the old deep entry still beats an empty or shallow one
+            entries[index + 1] = preferred
+        else:
+            slot = index + 1
+            if keys[slot] != key and keys[slot] != 0:
+                self.collisions += 1
+        if move == 0 and keys[slot] == key:
+            move = entries[slot] & 0xFFFF
+        keys[slot] = key
+        entries[slot] = move | min(depth, 255) << 16 | bound << 24 | self.generation << 26 | (score + scoreOffset) << 32
+
+    '''
+    Fraction of the table in use, from a sample of its first entries
+    '''
+    def fill(self, sample=2000):
+        sample = min(sample, len(self.keys))
+        return sum(1 for i in range(sample) if self.keys[i] != 0) / sample
+
+    def stats(self):
+        return {'sizeBytes': self.sizeBytes, 'entries': len(self.keys), 'probes': self.probes, 'hits': self.hits,
+                'misses': self.probes - self.hits, 'hitRate': self.hits / self.probes if self.probes else 0.0,
+                'stores': self.stores, 'collisions': self.collisions, 'fill': self.fill()}
@@ -0,0 +1,499 @@
+"""
+Move generation for a whole batch of positions at once with NumPy, for building datasets of millions of positions.
+A PositionBatch holds N positions as an (N, 12) array of uint64 bitboards in the BitboardGameState layout (bit
+row * 8 + col, a8 is bit 0), plus side to move, castling rights and the en passant square. Attack maps, check status
+and per-square destination masks are computed for every position together with array operations: attack maps, checks
+and pins from shifted copies and Kogge-Stone fills of whole bitboards, the moves of each piece from table lookups
+gathered for every piece of the batch at once. Positions with black to move are flipped top to bottom (a byte swap,
+since each byte is a rank) so the side to move always pushes its pawns towards row 0, and the results are flipped
+back.
+Move masks are (N, 64) arrays: masks[i, sq] has a bit set for every square the piece on sq can move to in position
+i, castling as the king's two square move, and a promotion as one bit however many pieces it can become.
+NumPy is an optional dependency (pip install .[batch]). Run from the project root to check the masks against
+getValidMoves and to measure throughput:
+    python -m Chess.ChessVectorized --check 2000 --sizes 1 10 100 1000 10000 100000
+"""
+import argparse
+import random
+import sys
+import time
+import numpy as np
+from Chess.ChessEngine import GameState
+from Chess.ChessBinary import positionBytes, encodePosition, encodePositions
+from Chess.ChessBitboard import BitboardGameState, knightAttacks, kingAttacks, pawnAttacks, rankMasks, rankTables, \
+    fileMasks, fileTables, diagMasks, diagTables, antiDiagMasks, antiDiagTables
+
+u64 = np.uint64
+fullBoard = u64(0xFFFFFFFFFFFFFFFF)
+fileA = u64(0x0101010101010101)
+notFileA = ~fileA
+notFileH = ~(fileA << u64(7))
+notFilesAB = ~(fileA | fileA << u64(1))
+notFilesGH = ~(fileA << u64(6) | fileA << u64(7))
+rowMasks = [u64(0xFF << (r * 8)) for r in range(8)]
+squareBits = np.array([1 << sq for sq in range(64)], dtype=np.uint64)
+knightTable = np.array(knightAttacks, dtype=np.uint64)
+kingTable = np.array(kingAttacks, dtype=np.uint64)
+pawnTable = np.array(pawnAttacks[0], dtype=np.uint64)  # white's, the side to move after flipping
+castleBits = [u64(1 << sq) for sq in range(56, 64)]  # row 7, where the side to move castles after flipping
+
+#  (shift left, step, mask for the squares a shift can land on without wrapping round a file)
+north, south = (False, u64(8), fullBoard), (True, u64(8), fullBoard)
+east, west = (True, u64(1), notFileA), (False, u64(1), notFileH)
+northEast, northWest = (False, u64(7), notFileA), (False, u64(9), notFileH)
+southEast, southWest = (True, u64(9), notFileA), (True, u64(7), notFileH)
+rookDirections = (north, south, east, west)
+bishopDirections = (northEast, northWest, southEast, southWest)
+
+if hasattr(np, 'bitwise_count'):  # NumPy 2
+    popcount = np.bitwise_count
+else:
+    byteCounts = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+    def popcount(bbs):
+        bbs = np.ascontiguousarray(bbs, dtype=np.uint64)
+        return byteCounts[bbs.view(np.uint8)].reshape(bbs.shape + (8,)).sum(axis=-1)
+
+
+'''
+Every square reached by sliding the pieces in gen one or more steps in direction until the first occupied square,
+which is included. empty is the set of empty squares; both are arrays that broadcast together.
+'''
+def slide(gen, empty, direction):
+    shiftLeft, step, mask = direction
+    propagate = empty & mask
+    if shiftLeft:
+        gen = gen | (propagate & (gen << step))
+        propagate = propagate & (propagate << step)
+        gen = gen | (propagate & (gen << (step + step)))
+        propagate = propagate & (propagate << (step + step))
+        gen = gen | (propagate & (gen << (step * u64(4))))
+        return (gen << step) & mask
+    gen = gen | (propagate & (gen >> step))
+    propagate = propagate & (propagate >> step)
+    gen = gen | (propagate & (gen >> (step + step)))
+    propagate = propagate & (propagate >> (step + step))
+    gen = gen | (propagate & (gen >> (step * u64(4))))
+    return (gen >> step) & mask
+
+
+def knightSpread(bbs):
+    oneFile = ((bbs >> u64(1)) & notFileH) | ((bbs << u64(1)) & notFileA)
+    twoFiles = ((bbs >> u64(2)) & notFilesGH) | ((bbs << u64(2)) & notFilesAB)
+    return (oneFile << u64(16)) | (oneFile >> u64(16)) | (twoFiles << u64(8)) | (twoFiles >> u64(8))
+
+
+def kingSpread(bbs):
+    row = bbs | ((bbs >> u64(1)) & notFileH) | ((bbs << u64(1)) & notFileA)
+    return (row | (row << u64(8)) | (row >> u64(8))) ^ bbs
+
+
+'''
+Squares attacked by one side's pieces, given as bitboards (pawns, knights, bishops, rooks, queens, king). Pawns
+capture towards row 0 if towardsRowZero, the way white's do.
+'''
+def attacksBy(pieces, empty, towardsRowZero):
+    pawns, knights, bishops, rooks, queens, kings = pieces
+    if towardsRowZero:
+        attacked = ((pawns >> u64(9)) & notFileH) | ((pawns >> u64(7)) & notFileA)
+    else:
+        attacked = ((pawns << u64(7)) & notFileH) | ((pawns << u64(9)) & notFileA)
+    attacked |= knightSpread(knights) | kingSpread(kings)
+    for direction in rookDirections:
+        attacked |= slide(rooks | queens, empty, direction)
+    for direction in bishopDirections:
+        attacked |= slide(bishops | queens, empty, direction)
+    return attacked
+
+
+'''
+Sliding attacks for a list of (square, occupancy) pairs, kindergarten style like ChessBitboard: the occupancy of
+the inner squares of each line through the square is gathered into a 6 bit index, by a shift for ranks and by a
+multiplication that stacks the bits in the top byte for files and diagonals, and looked up in a (64, 64) table
+built from ChessBitboard's line tables.
+'''
+fileMagic = sum(1 << (57 - 7 * r) for r in range(1, 7))  # moves the bit of row r of file a to bit 57 + r
+diagonalMagic = 0x0202020202020202  # moves the bit of file c of a diagonal to bit 57 + c
+
+
+def buildLookup(masks, tables, index):
+    lookup = np.zeros((64, 64), dtype=np.uint64)
+    for sq in range(64):
+        for occ, attacks in tables[sq].items():
+            lookup[sq, index(sq, occ)] = attacks
+    return np.array(masks, dtype=np.uint64), lookup
+
+
+rankLookup = buildLookup(rankMasks, rankTables, lambda sq, occ: occ >> (sq // 8 * 8 + 1))
+fileLookup = buildLookup(fileMasks, fileTables, lambda sq, occ: ((occ >> (sq % 8)) * fileMagic & 0xFFFFFFFFFFFFFFFF) >> 58)
+diagLookup = buildLookup(diagMasks, diagTables, lambda sq, occ: (occ * diagonalMagic & 0xFFFFFFFFFFFFFFFF) >> 58)
+antiDiagLookup = buildLookup(antiDiagMasks, antiDiagTables, lambda sq, occ: (occ * diagonalMagic & 0xFFFFFFFFFFFFFFFF) >> 58)
+rankShifts = np.array([sq // 8 * 8 + 1 for sq in range(64)], dtype=np.uint64)
+fileShifts = np.array([sq % 8 for sq in range(64)], dtype=np.uint64)
+
+
+def rookLookup(squares, occupied):
+    masks, lookup = rankLookup
+    attacks = lookup[squares, ((occupied & masks[squares]) >> rankShifts[squares]).astype(np.intp)]
+    masks, lookup = fileLookup
+    index = (((occupied & masks[squares]) >> fileShifts[squares]) * u64(fileMagic)) >> u64(58)
+    return attacks | lookup[squares, index.astype(np.intp)]
+
+
+def bishopLookup(squares, occupied):
+    attacks = None
+    for masks, lookup in (diagLookup, antiDiagLookup):
+        index = ((occupied & masks[squares]) * u64(diagonalMagic)) >> u64(58)
+        found = lookup[squares, index.astype(np.intp)]
+        attacks = found if attacks is None else attacks | found
+    return attacks
+
+
+'''
+The (position, square) of every set bit of an (N,) array of bitboards, as two index arrays
+'''
+def bitSquares(bbs):
+    bits = np.unpackbits(np.ascontiguousarray(bbs, dtype='<u8').view(np.uint8), bitorder='little')
+    found = np.flatnonzero(bits.view(bool))  # much faster than a two dimensional nonzero
+    return found >> 6, found & 63
+
+
+def bitIndex(bbs):
+    return popcount(bbs - u64(1)).astype(np.intp)  # for bitboards with one bit set
+
+
+class PositionBatch():
+    '''
+    pieces is an (N, 12) uint64 array of bitboards in ChessBitboard.pieceNames order, whiteToMove an (N,) bool
+    array, castling an (N,) uint8 array of bits (1 white king side, 2 white queen side, 4 black king side, 8 black
+    queen side) and enPassant an (N,) uint64 array with the bit of the en passant target square, or 0
+    '''
+    def __init__(self, pieces, whiteToMove, castling, enPassant):
+        self.pieces = np.asarray(pieces, dtype=np.uint64)
+        self.whiteToMove = np.asarray(whiteToMove, dtype=bool)
+        self.castling = np.asarray(castling, dtype=np.uint8)
+        self.enPassant = np.asarray(enPassant, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.whiteToMove)
+
+    def __getitem__(self, index):
+        return PositionBatch(self.pieces[index], self.whiteToMove[index], self.castling[index], self.enPassant[index])
+
+    '''
+    A batch from a buffer of ChessBinary 37 byte records, unpacked without a Python loop over positions
+    '''
+    @classmethod
+    def fromRecords(cls, data):
+        records = np.frombuffer(data, dtype=np.uint8)
+        if len(records) % positionBytes:
+            raise ValueError("Buffer of %d bytes is not a whole number of %d byte positions" % (len(records), positionBytes))
+        records = records.reshape(-1, positionBytes)
+        squares = np.empty((len(records), 64), dtype=np.uint8)
+        squares[:, 0::2] = records[:, :32] & 15
+        squares[:, 1::2] = records[:, :32] >> 4
+        if (squares > 12).any():
+            raise ValueError("Bad piece code in position record")
+        pieces = np.empty((len(records), 12), dtype=np.uint64)
+        for index in range(12):  # piece code index + 1, in pieceNames order
+            bits = np.packbits(squares == index + 1, axis=1, bitorder='little')
+            pieces[:, index] = np.ascontiguousarray(bits).view('<u8')[:, 0]
+        flags = records[:, 32]
+        whiteToMove = (flags & 1) == 0
+        castling = (flags >> 1) & 15
+        files = records[:, 33].astype(np.uint64)
+        epSquares = np.where(whiteToMove, u64(16), u64(40)) + files  # row 2 or row 5
+        enPassant = np.where(files == 15, u64(0), u64(1) << (epSquares & u64(63)))
+        return cls(pieces, whiteToMove, castling, enPassant)
+
+    @classmethod
+    def fromGameStates(cls, gameStates):
+        return cls.fromRecords(encodePositions(gameStates))
+
+    @classmethod
+    def fromFENs(cls, fens, gameStateClass=BitboardGameState):
+        gameState = gameStateClass()
+        records = []
+        for fen in fens:
+            gameState.loadFEN(fen)
+            records.append(encodePosition(gameState))
+        return cls.fromRecords(b''.join(records))
+
+    '''
+    The occupancy of each colour, (white, black)
+    '''
+    def occupancy(self):
+        return np.bitwise_or.reduce(self.pieces[:, :6], axis=1), np.bitwise_or.reduce(self.pieces[:, 6:], axis=1)
+
+    '''
+    Every square attacked by white and by black in each position, as two (N,) arrays, with the same meaning as
+    GameState.getAttackedSquares
+    '''
+    def attackMaps(self):
+        white, black = self.occupancy()
+        empty = ~(white | black)
+        pieces = self.pieces.T
+        return attacksBy(pieces[:6], empty, True), attacksBy(pieces[6:], empty, False)
+
+    '''
+    The pieces of the side to move and of the other side, seen from the side to move: positions with black to move
+    are flipped so the side to move always plays up the board towards row 0 and castles on row 7
+    '''
+    def sideToMove(self):
+        blackToMove = ~self.whiteToMove[:, None]
+        pieces = self.pieces
+        flipped = pieces.byteswap()
+        own = np.where(blackToMove, flipped[:, 6:], pieces[:, :6]).T
+        enemy = np.where(blackToMove, flipped[:, :6], pieces[:, 6:]).T
+        enPassant = np.where(self.whiteToMove, self.enPassant, self.enPassant.byteswap())
+        rights = np.where(self.whiteToMove, self.castling, self.castling >> 2)
+        return own, enemy, enPassant, rights
+
+    '''
+    Whether the side to move is in check in each position
+    '''
+    def inCheck(self):
+        own, enemy, _, _ = self.sideToMove()
+        occupied = np.bitwise_or.reduce(own, axis=0) | np.bitwise_or.reduce(enemy, axis=0)
+        return (attacksBy(enemy, ~occupied, False) & own[5]) != 0
+
+    '''
+    The moves of every position as one entry per piece of the side to move: the index of the position, the square
+    the piece stands on, the mask of squares it can move to, and whether the moves are promotions. With legal off the
+    masks ignore whether the king is left in check (pseudo-legal moves, castling only needing the rights and empty
+    squares); with it on pinned pieces are kept on the line to their king, moves out of check have to capture or
+    block the checker, the king may not step onto an attacked square and castling may not start in, pass through or
+    end in check. A piece can have two entries, the second for an en passant capture.
+    '''
+    def destinations(self, legal=True):
+        own, enemy, enPassant, rights = self.sideToMove()
+        pawns, knights, bishops, rooks, queens, king = own
+        ownAll = np.bitwise_or.reduce(own, axis=0)
+        enemyAll = np.bitwise_or.reduce(enemy, axis=0)
+        occupied = ownAll | enemyAll
+        empty = ~occupied
+
+        entries = []  # (positions, squares, masks, promotes) for each kind of piece
+        rows, squares = bitSquares(pawns)
+        rowEmpty = empty[rows]
+        singles = (squareBits[squares] >> u64(8)) & rowEmpty
+        doubles = ((singles & rowMasks[5]) >> u64(8)) & rowEmpty
+        targets = enemyAll if legal else enemyAll | enPassant  # legal en passant is added below
+        entries.append((rows, squares, singles | doubles | (pawnTable[squares] & targets[rows]), (squares >> 3) == 1))
+        rows, squares = bitSquares(knights)
+        entries.append((rows, squares, knightTable[squares], None))
+        for pieces, lookups in ((bishops, (bishopLookup,)), (rooks, (rookLookup,)), (queens, (rookLookup, bishopLookup))):
+            rows, squares = bitSquares(pieces)
+            masks = lookups[0](squares, occupied[rows])
+            if len(lookups) > 1:
+                masks |= lookups[1](squares, occupied[rows])
+            entries.append((rows, squares, masks, None))
+        rows = np.concatenate([entry[0] for entry in entries])
+        squares = np.concatenate([entry[1] for entry in entries])
+        masks = np.concatenate([entry[2] for entry in entries])
+        promotes = np.concatenate([entry[3] if entry[3] is not None else np.zeros(len(entry[0]), dtype=bool)
+                                   for entry in entries])
+        masks &= ~ownAll[rows]
+
+        kingRows, kingSquares = bitSquares(king)
+        kingMasks = kingTable[kingSquares] & ~ownAll[kingRows]
+        canCastle = (king & castleBits[4]) != 0
+        passable = empty  # squares the king may pass through and land on when castling
+        epEntries = []
+        if legal:
+            masks, kingMasks, canCastle, passable, epEntries = self.legalFilter(
+                own, enemy, enPassant, occupied, rows, squares, masks, kingRows, kingMasks, canCastle)
+        kingSidePath = castleBits[5] | castleBits[6]
+        queenSidePath = castleBits[2] | castleBits[3]
+        kingSide = canCastle & (rights & 1 != 0) & ((passable & kingSidePath) == kingSidePath)
+        queenSide = canCastle & (rights & 2 != 0) & ((passable & queenSidePath) == queenSidePath) & \
+            ((empty & castleBits[1]) != 0)
+        kingMasks |= np.where(kingSide[kingRows], castleBits[6], u64(0)) | np.where(queenSide[kingRows], castleBits[2], u64(0))
+
+        rows = np.concatenate([rows, kingRows] + [entry[0] for entry in epEntries])
+        squares = np.concatenate([squares, kingSquares] + [entry[1] for entry in epEntries])
+        masks = np.concatenate([masks, kingMasks] + [entry[2] for entry in epEntries])
+        promotes = np.concatenate([promotes, np.zeros(len(kingRows) + sum(len(entry[0]) for entry in epEntries), dtype=bool)])
+        black = ~self.whiteToMove[rows]  # back to the board's point of view
+        squares = np.where(black, squares ^ 56, squares)
+        masks = np.where(black, masks.byteswap(), masks)
+        return rows, squares, masks, promotes
+
+    '''
+    The king safety part of destinations(legal=True): narrows the masks of the other pieces to evasions and pin
+    lines, takes attacked squares out of the king's masks and works out which en passant captures are legal and
+    which squares castling may use
+    '''
+    def legalFilter(self, own, enemy, enPassant, occupied, rows, squares, masks, kingRows, kingMasks, canCastle):
+        pawns, knights, bishops, rooks, queens, king = own
+        enemyPawns, enemyKnights, enemyBishops, enemyRooks, enemyQueens, enemyKing = enemy
+        ownAll = np.bitwise_or.reduce(own, axis=0)
+        empty = ~occupied
+        enemyStraight = enemyRooks | enemyQueens
+        enemyDiagonal = enemyBishops | enemyQueens
+
+        #  squares the king cannot go to, with the king lifted off so it cannot hide behind itself
+        attacked = attacksBy(enemy, empty | king, False)
+        kingMasks &= ~attacked[kingRows]
+
+        #  checkers, the squares between a slider and the king, and pins, all by sliding out from the king
+        checkers = (knightSpread(king) & enemyKnights) | \
+            ((((king >> u64(9)) & notFileH) | ((king >> u64(7)) & notFileA)) & enemyPawns)
+        between = np.zeros(len(empty), dtype=np.uint64)
+        for directions, sliders in ((rookDirections, enemyStraight), (bishopDirections, enemyDiagonal)):
+            for direction in directions:
+                ray = slide(king, empty, direction)
+                checker = ray & sliders
+                checkers |= checker
+                between |= np.where(checker != 0, ray ^ checker, u64(0))
+                blocker = ray & ownAll
+                xray = slide(king, empty | blocker, direction)
+                pinned = np.where((xray & sliders) != 0, blocker, u64(0))
+                if pinned.any():
+                    onLine = (pinned[rows] & squareBits[squares]) != 0
+                    masks = np.where(onLine, masks & xray[rows], masks)
+        checkCount = popcount(checkers)
+        checkMask = np.where(checkCount == 0, fullBoard, np.where(checkCount == 1, checkers | between, u64(0)))
+        masks &= checkMask[rows]
+        canCastle &= checkCount == 0
+
+        #  en passant: both pawns leave their squares at once, so test the king against sliders afterwards
+        epEntries = []
+        captured = (enPassant << u64(8)) & enemyPawns
+        evades = (checkCount == 0) | ((checkCount == 1) & (((captured & checkers) | (enPassant & checkMask)) != 0))
+        for capturers in ((enPassant << u64(9)) & notFileA & pawns, (enPassant << u64(7)) & notFileH & pawns):
+            candidates = np.nonzero((capturers != 0) & (captured != 0) & evades)[0]
+            if len(candidates) == 0:
+                continue
+            capturer = capturers[candidates]
+            after = ~((occupied[candidates] ^ capturer ^ captured[candidates]) | enPassant[candidates])
+            exposed = np.zeros(len(candidates), dtype=bool)
+            for directions, sliders in ((rookDirections, enemyStraight), (bishopDirections, enemyDiagonal)):
+                for direction in directions:
+                    exposed |= (slide(king[candidates], after, direction) & sliders[candidates]) != 0
+            candidates, capturer = candidates[~exposed], capturer[~exposed]
+            epEntries.append((candidates, bitIndex(capturer), enPassant[candidates]))
+        return masks, kingMasks, canCastle, empty & ~attacked, epEntries
+
+    '''
+    The legal moves of every position as (N, 64) destination masks. Big batches are worked through chunkSize
+    positions at a time to bound the size of the intermediate arrays.
+    '''
+    def legalMasks(self, chunkSize=16384):
+        return self.toMasks(True, chunkSize)
+
+    '''
+    (N, 64) destination masks of the pseudo-legal moves, see destinations
+    '''
+    def pseudoLegalMasks(self, chunkSize=16384):
+        return self.toMasks(False, chunkSize)
+
+    def toMasks(self, legal, chunkSize):
+        result = np.zeros((len(self), 64), dtype=np.uint64)
+        for start in range(0, len(self), chunkSize):
+            rows, squares, masks, _ = self[start:start + chunkSize].destinations(legal)
+            np.bitwise_or.at(result, (rows + start, squares), masks)  # or, as an en passant capture has its own entry
+        return result
+
+    '''
+    The number of legal moves in each position, counting the four choices of every promotion the way getValidMoves
+    lists them, and whether the side to move is in check. A position with no moves is mate if in check, else stalemate.
+    '''
+    def moveCounts(self, chunkSize=16384):
+        counts = np.zeros(len(self), dtype=np.int64)
+        for start in range(0, len(self), chunkSize):
+            chunk = self[start:start + chunkSize]
+            rows, squares, masks, promotes = chunk.destinations()
+            moves = popcount(masks).astype(np.int64) * np.where(promotes, 4, 1)
+            counts[start:start + len(chunk)] = np.bincount(rows, weights=moves, minlength=len(chunk))
+        return counts, self.inCheck()
+
+
+'''
+The (64,) destination masks of the legal moves getValidMoves finds, and how many it finds
+'''
+def engineMasks(gameState):
+    masks = np.zeros(64, dtype=np.uint64)
+    moves = gameState.getValidMoves()
+    for move in moves:
+        masks[move.startRow * 8 + move.startCol] |= u64(1 << (move.endRow * 8 + move.endCol))
+    return masks, len(moves)
+
+
+'''
+Compare the batch's legal move masks, move counts and check flags with getValidMoves on every game state, and
+return the indices of the positions that differ
+'''
+def checkAgainstEngine(gameStates):
+    batch = PositionBatch.fromGameStates(gameStates)
+    masks = batch.legalMasks()
+    counts, inCheck = batch.moveCounts()
+    bad = []
+    for i, gameState in enumerate(gameStates):
+        expected, expectedCount = engineMasks(gameState)
+        if not np.array_equal(masks[i], expected) or counts[i] != expectedCount or inCheck[i] != gameState.inCheck():
+            bad.append(i)
+    return bad
+
+
+'''
+count positions reached by random play from the perft test positions, for checking and benchmarking
+'''
+def samplePositions(count, seed=1, gameStateClass=BitboardGameState):
+    from Chess.ChessPerft import perftPositions
+    rng = random.Random(seed)
+    gameStates = []
+    while len(gameStates) < count:
+        gameState = gameStateClass.fromFEN(rng.choice(perftPositions)[1])
+        for _ in range(rng.randrange(120)):
+            moves = gameState.getValidMoves()
+            if not moves:
+                break
+            gameState.makeMove(rng.choice(moves))
+        gameStates.append(gameState)
+    return gameStates
+
+
+'''
+Legal move masks for batches of each size, tiled from the records of positions, against one getValidMoves call
+per position
+'''
+def benchmark(positions, sizes, out=sys.stdout):
+    records = np.frombuffer(encodePositions(positions), dtype=np.uint8).reshape(-1, positionBytes)
+    start = time.perf_counter()
+    for gameState in positions:
+        gameState.getValidMoves()
+    loopRate = len(positions) / (time.perf_counter() - start)
+    print("getValidMoves loop %12.0f positions/s" % loopRate, file=out)
+    for size in sizes:
+        data = np.resize(records, (size, positionBytes)).tobytes()
+        repeats = max(1, 20000 // size)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            PositionBatch.fromRecords(data).legalMasks()
+        rate = size * repeats / (time.perf_counter() - start)
+        print("batch %7d        %12.0f positions/s  %6.1fx the loop" % (size, rate, rate / loopRate), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and benchmark vectorized batch move generation")
+    parser.add_argument("--check", type=int, default=1000, help="compare this many sampled positions with getValidMoves")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument("--samples", type=int, default=1000, help="distinct positions tiled into the benchmark batches")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    status = 0
+    if args.check:
+        for gameStateClass in (GameState, BitboardGameState):
+            bad = checkAgainstEngine(samplePositions(args.check, args.seed, gameStateClass))
+            print("%s: %d of %d positions differ from getValidMoves%s" % (
+                gameStateClass.__name__, len(bad), args.check, "" if not bad else " (first %d)" % bad[0]))
+            status = status or len(bad)
+    if args.sizes:
+        benchmark(samplePositions(args.samples, args.seed + 1), args.sizes)
+    return 1 if status else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())